@@ -1,22 +1,79 @@
 # Этот файл нужен для корректной работы пакета bot
 import logging
+import threading
+
 import telebot
 
-from django.conf import settings
+logger = telebot.logger
+logger.setLevel(logging.INFO)
 
-commands = settings.BOT_COMMANDS
+_bot = None
+_bot_lock = threading.Lock()
 
-bot = telebot.TeleBot(
-    settings.BOT_TOKEN,
-    threaded=False,
-    skip_pending=True,
-)
 
-bot.set_my_commands(commands)
+def get_bot():
+    """
+    Возвращает экземпляр TeleBot, создавая его при первом обращении.
 
-logging.info(f'@{bot.get_me().username} started')
+    Создание бота не обращается к сети: команды бота и проверка токена
+    выполняются явно командой setup_bot или при установке webhook.
+    Запросы к Bot API идут через общий пул соединений (bot.telegram_http).
+    """
+    global _bot
+    if _bot is None:
+        with _bot_lock:
+            if _bot is None:
+                from django.conf import settings
+                from bot.telegram_http import install
+
+                # Общий пул keep-alive соединений и таймауты из настроек
+                install()
+                _bot = telebot.TeleBot(
+                    settings.BOT_TOKEN,
+                    threaded=False,
+                    skip_pending=True,
+                )
+    return _bot
+
+
+def setup_bot():
+    """Регистрирует команды бота в Telegram и возвращает имя бота"""
+    from django.conf import settings
+
+    instance = get_bot()
+    instance.set_my_commands(settings.BOT_COMMANDS)
+    username = instance.get_me().username
+    logger.info(f'@{username} started')
+    return username
+
+
+def start_process():
+    """
+    Подготовка процесса веб-сервера (вызывается из dd.wsgi и dd.asgi).
+
+    Загружает список администраторов до первого обновления и запускает
+    фоновую отправку очереди уведомлений, чтобы процесс, перезапущенный
+    с накопившейся очередью, отправил ее сразу.
+    """
+    from django.conf import settings
+    from django.db import DatabaseError
+    from bot.admins import admin_registry
+
+    try:
+        admin_registry.load()
+    except DatabaseError:
+        # Список загрузится при первой проверке администратора
+        logger.exception('Не удалось загрузить список администраторов при старте')
+
+    if settings.OUTBOX_DRAIN_IN_PROCESS:
+        from bot.outbox import drainer
+        drainer.start()
 
-logger = telebot.logger
-logger.setLevel(logging.INFO)
 
-logging.basicConfig(level=logging.INFO, filename="ai_log.log", filemode="w")
\ No newline at end of file
+def __getattr__(name):
+    # from bot import bot - ленивое создание бота при первом импорте имени
+    if name == 'bot':
+        instance = get_bot()
+        globals()['bot'] = instance
+        return instance
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import User, StudentProfile, Payment, PaymentHistory
+from .models import User, StudentProfile, Payment, PaymentHistory, BalanceTransaction, BroadcastDelivery, NotificationOutbox, PaymentEvent, Tariff
+from bot import ledger
 
 class UserAdmin(admin.ModelAdmin):
     list_display = ('telegram_id', 'full_name', 'class_number', 'is_registered', 'is_admin')
@@ -29,6 +30,16 @@ class StudentProfileAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user')
 
+    def save_model(self, request, obj, form, change):
+        if not change or 'balance' not in form.changed_data:
+            return super().save_model(request, obj, form, change)
+
+        # Баланс меняется только через журнал операций, остальные поля - обычным сохранением
+        fields = [name for name in form.changed_data if name != 'balance']
+        if fields:
+            obj.save(update_fields=fields)
+        obj.balance = ledger.set_balance(obj.pk, obj.balance, description=f"Изменено в админке: {request.user}")
+
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
@@ -51,4 +62,51 @@ class PaymentHistoryAdmin(admin.ModelAdmin):
     ordering = ('-year', '-month')
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user', 'student_profile', 'payment')
\ No newline at end of file
+        return super().get_queryset(request).select_related('user', 'student_profile', 'payment')
+
+
+@admin.register(BalanceTransaction)
+class BalanceTransactionAdmin(admin.ModelAdmin):
+    list_display = ('student_profile', 'kind', 'amount', 'balance_after', 'month', 'year', 'created_at')
+    list_filter = ('kind', 'created_at')
+    search_fields = ('student_profile__profile_name', 'student_profile__user__telegram_id')
+    readonly_fields = ('created_at',)
+    ordering = ('-created_at',)
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('student_profile')
+
+
+@admin.register(BroadcastDelivery)
+class BroadcastDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('campaign', 'telegram_id', 'status', 'updated_at')
+    list_filter = ('status', 'campaign')
+    search_fields = ('campaign', 'telegram_id')
+    readonly_fields = ('updated_at',)
+    ordering = ('-updated_at',)
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ('yookassa_payment_id', 'event', 'source', 'previous_status', 'created_at')
+    list_filter = ('event', 'source')
+    search_fields = ('yookassa_payment_id',)
+    readonly_fields = ('created_at',)
+    ordering = ('-created_at',)
+
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ('dedup_key', 'chat_id', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('dedup_key', 'chat_id')
+    readonly_fields = ('created_at', 'sent_at')
+    ordering = ('-created_at',)
+
+
+@admin.register(Tariff)
+class TariffAdmin(admin.ModelAdmin):
+    list_display = ('key', 'name', 'price', 'effective_from', 'updated_at')
+    list_filter = ('key',)
+    search_fields = ('key', 'name')
+    ordering = ('key', '-effective_from')
@@ -0,0 +1,62 @@
+"""Множество ID администраторов в памяти процесса"""
+import threading
+import time
+
+from django.conf import settings
+
+from bot.models import User
+
+
+class AdminRegistry:
+    """
+    ID администраторов без запроса к базе на каждое сообщение.
+
+    Загружается при старте процесса веб-сервера (bot.start_process) или при
+    первом обращении, поддерживается сигналами модели User
+    и периодически перечитывается, чтобы подхватить изменения из других
+    процессов.
+    """
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self._ids = frozenset()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        ids = frozenset(User.objects.filter(is_admin=True).values_list('telegram_id', flat=True))
+        with self._lock:
+            self._ids = ids
+            self._loaded_at = time.monotonic()
+        return ids
+
+    def ids(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.refresh_interval:
+            return self.load()
+        return self._ids
+
+    def is_admin(self, telegram_id):
+        return str(telegram_id) in self.ids()
+
+    def update(self, telegram_id, is_admin):
+        """Обновляет признак администратора для одного пользователя"""
+        telegram_id = str(telegram_id)
+        with self._lock:
+            if is_admin:
+                self._ids = self._ids | {telegram_id}
+            else:
+                self._ids = self._ids - {telegram_id}
+
+
+admin_registry = AdminRegistry(refresh_interval=settings.ADMIN_IDS_REFRESH_INTERVAL)
+
+
+def is_admin(telegram_id):
+    """Проверяет, является ли пользователь администратором"""
+    return admin_registry.is_admin(telegram_id)
+
+
+def get_admin_ids():
+    """Возвращает множество ID администраторов"""
+    return admin_registry.ids()
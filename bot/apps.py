@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class BotConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'bot'
+
+    def ready(self):
+        # Подключаем обработчики сигналов моделей
+        from bot import signals  # noqa: F401
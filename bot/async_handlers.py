@@ -0,0 +1,237 @@
+"""
+Асинхронная обработка частых callback-запросов (ASGI).
+
+Главное меню, меню оплаты, выбор месяца и профиля обрабатываются в цикле
+событий: запросы к Telegram идут через AsyncTeleBot и не занимают поток,
+запросы к базе - через sync_to_async в ограниченном пуле потоков.
+Правка меню оплаты идет через общий планировщик правок (bot.edits).
+Остальные обновления и случаи, требующие синхронного обработчика
+(регистрация, сверка незавершенных платежей с ЮKassa), передаются
+в обычный пул обработки (bot.dispatcher).
+
+Порядок обновлений одного чата сохраняется в пределах процесса:
+асинхронная обработка и постановка в синхронный пул идут по очереди
+чата, а пока у чата есть необработанные обновления в синхронном пуле,
+новые обновления тоже отправляются туда.
+
+Требует aiohttp; без него все обновления обрабатываются синхронно.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from bot import screens
+from bot.context import update_scope
+from bot.dispatcher import dispatch_update, get_update_chat_id, has_pending_updates
+from bot.edits import edit_message
+from bot.metrics import metrics
+from bot.models import Payment
+from bot.router import CallbackRouter
+
+try:
+    from telebot.async_telebot import AsyncTeleBot
+except ImportError:
+    AsyncTeleBot = None
+
+logger = logging.getLogger(__name__)
+
+_db_executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_WORKERS, thread_name_prefix='async-db')
+
+# Ограничение числа одновременно обрабатываемых асинхронно обновлений
+_in_flight = threading.BoundedSemaphore(settings.ASYNC_MAX_IN_FLIGHT)
+
+_async_bot = None
+_async_bot_lock = threading.Lock()
+
+# Очереди чатов в цикле событий: chat_id -> [asyncio.Lock, число ожидающих]
+_chat_turns = {}
+
+
+class Fallback(Exception):
+    """Обновление нужно обработать синхронным обработчиком"""
+
+
+def get_async_bot():
+    """Возвращает экземпляр AsyncTeleBot, создавая его при первом обращении"""
+    global _async_bot
+    if _async_bot is None:
+        with _async_bot_lock:
+            if _async_bot is None:
+                _async_bot = AsyncTeleBot(settings.BOT_TOKEN)
+    return _async_bot
+
+
+def _db_scope(function):
+    @wraps(function)
+    def wrapped(*args, **kwargs):
+        close_old_connections()
+        try:
+            with update_scope():
+                return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return wrapped
+
+
+def run_sync(function, *args, **kwargs):
+    """Выполняет синхронную функцию (запросы к базе) в пуле потоков"""
+    return sync_to_async(_db_scope(function), thread_sensitive=False, executor=_db_executor)(*args, **kwargs)
+
+
+async def _show(call, screen):
+    await get_async_bot().edit_message_text(
+        chat_id=call.message.chat.id,
+        message_id=call.message.message_id,
+        text=screen.text,
+        reply_markup=screen.markup
+    )
+
+
+async def _alert(call, error):
+    await get_async_bot().answer_callback_query(call.id, str(error))
+
+
+async def menu_call(call):
+    try:
+        screen = await run_sync(screens.render_main_menu, str(call.from_user.id))
+    except screens.NeedsRegistration:
+        raise Fallback
+
+    try:
+        await _show(call, screen)
+    except Exception:
+        # Если не удалось отредактировать сообщение, отправляем новое
+        await get_async_bot().send_message(call.message.chat.id, screen.text, reply_markup=screen.markup)
+
+
+def _fallback_if_pending(user):
+    # Сверка незавершенных платежей ходит в ЮKassa и не должна занимать пул запросов к базе
+    if Payment.objects.filter(user=user, status__in=['pending', 'waiting_for_capture']).exists():
+        raise Fallback
+
+
+async def payment_menu(call):
+    try:
+        screen = await run_sync(
+            screens.render_payment_menu,
+            str(call.from_user.id),
+            check_pending=_fallback_if_pending
+        )
+    except screens.NeedsRegistration:
+        raise Fallback
+    except screens.Alert as e:
+        await _alert(call, e)
+        return
+
+    try:
+        # Через общий планировщик правок, как и синхронный обработчик (отправка в потоке)
+        await asyncio.to_thread(edit_message, call.message, screen.text, screen.markup)
+    except Exception as e:
+        logger.warning(f"Error editing message: {e}")
+        await _alert(call, "❌ Произошла ошибка")
+
+
+async def select_payment_method(call):
+    try:
+        screen = await run_sync(
+            screens.render_payment_months,
+            str(call.from_user.id),
+            with_balance=call.data == "pay_with_balance"
+        )
+    except screens.Alert as e:
+        await _alert(call, e)
+        return
+    await _show(call, screen)
+
+
+async def select_profile(call):
+    profile_id, = call.route_params
+    try:
+        screen = await run_sync(screens.render_profile, str(call.from_user.id), profile_id)
+    except screens.Alert as e:
+        await _alert(call, e)
+        return
+    await _show(call, screen)
+
+
+router = CallbackRouter()
+router.exact("main_menu", menu_call)
+router.exact("payment_menu", payment_menu)
+router.exact("pay_with_yookassa", select_payment_method)
+router.exact("pay_with_balance", select_payment_method)
+router.prefix("select_profile_", select_profile, int)
+
+
+async def process_update_async(update):
+    """
+    Обрабатывает обновление асинхронно, если для него есть асинхронный обработчик.
+
+    Returns:
+        bool: False, если обновление нужно передать синхронному пулу
+    """
+    call = update.callback_query
+    if call is None or AsyncTeleBot is None:
+        return False
+    try:
+        route, params = router.resolve(call.data or '')
+    except ValueError:
+        return False
+    if route is None:
+        return False
+
+    if not _in_flight.acquire(blocking=False):
+        metrics.increment('updates.async_saturated')
+        return False
+
+    call.route = route.name
+    call.route_params = params
+    try:
+        with metrics.timer(f"route.{route.name}.async"):
+            await route.handler(call)
+    except Fallback:
+        return False
+    except Exception:
+        metrics.increment('updates.failed')
+        logger.exception(f"Error processing update {update.update_id} asynchronously")
+    finally:
+        _in_flight.release()
+    metrics.increment('updates.processed_async')
+    return True
+
+
+@asynccontextmanager
+async def _chat_turn(chat_id):
+    """Обновления одного чата проходят по одному"""
+    turn = _chat_turns.get(chat_id)
+    if turn is None:
+        turn = _chat_turns[chat_id] = [asyncio.Lock(), 0]
+    turn[1] += 1
+    try:
+        async with turn[0]:
+            yield
+    finally:
+        turn[1] -= 1
+        if not turn[1]:
+            del _chat_turns[chat_id]
+
+
+async def dispatch_update_async(update):
+    """
+    Обрабатывает обновление в цикле событий или передает его синхронному пулу.
+
+    Returns:
+        bool: False, если очередь синхронного пула переполнена и обновление не принято
+    """
+    chat_id = get_update_chat_id(update)
+    async with _chat_turn(chat_id):
+        if not has_pending_updates(chat_id) and await process_update_async(update):
+            return True
+        return await sync_to_async(dispatch_update, thread_sensitive=False)(update)
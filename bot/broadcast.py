@@ -0,0 +1,199 @@
+"""Массовые рассылки с ограничением скорости и журналом доставки"""
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from telebot.apihelper import ApiTelegramException
+
+from bot.metrics import metrics
+from bot.models import BroadcastDelivery, PaymentHistory, User
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Ограничитель скорости: не более rate операций в секунду
+    с допустимым всплеском до capacity.
+
+    pause() останавливает всех отправителей (ответ 429 от Telegram).
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+def get_unpaid_recipients(month, year):
+    """
+    Зарегистрированные пользователи (не админы) без оплаты за месяц - одним запросом.
+
+    Returns:
+        QuerySet: кортежи (telegram_id, full_name, class_number)
+    """
+    paid = PaymentHistory.objects.filter(
+        user=OuterRef('pk'),
+        month=month,
+        year=year,
+        status='completed'
+    )
+    return User.objects.filter(
+        is_admin=False,
+        is_registered=True
+    ).annotate(
+        is_paid=Exists(paid)
+    ).filter(
+        is_paid=False
+    ).order_by('pk').values_list('telegram_id', 'full_name', 'class_number')
+
+
+class Broadcast:
+    """
+    Рассылка сообщений пакетом получателей.
+
+    Сообщения отправляются параллельно несколькими потоками через общий
+    ограничитель скорости. Результат по каждому получателю сохраняется
+    в BroadcastDelivery, поэтому прерванная рассылка с тем же campaign
+    при повторном запуске пропускает уже доставленные сообщения.
+    """
+
+    # Размер пакета записей журнала доставки
+    flush_size = 50
+
+    def __init__(self, campaign, rate=None, workers=None, max_retries=3, send=None):
+        self.campaign = campaign
+        self.bucket = TokenBucket(rate or settings.BROADCAST_RATE)
+        self.workers = workers or settings.BROADCAST_WORKERS
+        self.max_retries = max_retries
+        self._send = send
+
+    def _send_message(self, telegram_id, text):
+        if self._send is not None:
+            return self._send(telegram_id, text)
+        from bot import bot
+        return bot.send_message(telegram_id, text)
+
+    def _deliver(self, telegram_id, text):
+        """Отправляет одно сообщение с повтором после 429. Возвращает (status, error)"""
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                with metrics.timer('broadcast.send'):
+                    self._send_message(telegram_id, text)
+                return BroadcastDelivery.STATUS_SENT, ''
+            except ApiTelegramException as e:
+                if e.error_code == 429 and attempt < self.max_retries:
+                    retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 1)
+                    metrics.increment('broadcast.throttled')
+                    logger.warning(f"Broadcast {self.campaign}: 429, пауза {retry_after} сек")
+                    self.bucket.pause(retry_after)
+                    continue
+                return BroadcastDelivery.STATUS_FAILED, str(e)
+            except Exception as e:
+                return BroadcastDelivery.STATUS_FAILED, str(e)
+        return BroadcastDelivery.STATUS_FAILED, 'retry limit exceeded'
+
+    def delivered_ids(self):
+        return set(BroadcastDelivery.objects.filter(
+            campaign=self.campaign,
+            status=BroadcastDelivery.STATUS_SENT
+        ).values_list('telegram_id', flat=True))
+
+    def _flush(self, outcomes):
+        if not outcomes:
+            return
+        deliveries = [
+            BroadcastDelivery(campaign=self.campaign, telegram_id=telegram_id, status=status, error=error)
+            for telegram_id, status, error in outcomes
+        ]
+        features = connection.features
+        if features.supports_update_conflicts:
+            # MySQL (ON DUPLICATE KEY UPDATE) не принимает список уникальных полей
+            unique_fields = ['campaign', 'telegram_id'] if features.supports_update_conflicts_with_target else None
+            BroadcastDelivery.objects.bulk_create(
+                deliveries,
+                update_conflicts=True,
+                unique_fields=unique_fields,
+                update_fields=['status', 'error', 'updated_at'],
+            )
+        else:
+            for delivery in deliveries:
+                BroadcastDelivery.objects.update_or_create(
+                    campaign=delivery.campaign,
+                    telegram_id=delivery.telegram_id,
+                    defaults={'status': delivery.status, 'error': delivery.error},
+                )
+        outcomes.clear()
+
+    def run(self, messages, on_result=None):
+        """
+        Выполняет рассылку.
+
+        Args:
+            messages: итерируемое пар (telegram_id, text)
+            on_result: необязательный вызов on_result(telegram_id, status, error)
+
+        Returns:
+            dict: количество отправленных, ошибочных и пропущенных сообщений
+        """
+        delivered = self.delivered_ids()
+        counts = {BroadcastDelivery.STATUS_SENT: 0, BroadcastDelivery.STATUS_FAILED: 0, 'skipped': 0}
+        outcomes = []
+        in_flight = {}
+
+        def collect(done):
+            for future in done:
+                telegram_id = in_flight.pop(future)
+                status, error = future.result()
+                counts[status] += 1
+                outcomes.append((telegram_id, status, error))
+                if on_result is not None:
+                    on_result(telegram_id, status, error)
+            if len(outcomes) >= self.flush_size:
+                self._flush(outcomes)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='broadcast') as executor:
+            try:
+                for telegram_id, text in messages:
+                    telegram_id = str(telegram_id)
+                    if telegram_id in delivered:
+                        counts['skipped'] += 1
+                        continue
+                    if len(in_flight) >= self.workers * 2:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    in_flight[executor.submit(self._deliver, telegram_id, text)] = telegram_id
+            finally:
+                # Отправленные сообщения фиксируются и при прерывании рассылки
+                collect(wait(in_flight).done)
+                self._flush(outcomes)
+
+        return counts
@@ -0,0 +1,105 @@
+"""Контекст пользователя, собираемый один раз на обновление Telegram"""
+import copy
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from bot.cache import TTLCache
+from bot.models import User
+
+_UNSET = object()
+
+# Контексты текущего обновления (на поток обработки)
+_local = threading.local()
+
+# Короткоживущий кэш процесса, сбрасывается сигналами сохранения моделей
+_process_cache = TTLCache(ttl=settings.USER_CONTEXT_CACHE_TTL)
+
+
+class UserContext:
+    """Пользователь, его активный профиль и признак администратора"""
+
+    def __init__(self, user, active_profile=_UNSET):
+        self.user = user
+        self._active_profile = active_profile
+
+    @property
+    def telegram_id(self):
+        return self.user.telegram_id
+
+    @property
+    def is_admin(self):
+        return self.user.is_admin
+
+    @property
+    def active_profile(self):
+        """Активный профиль ученика (загружается при первом обращении)"""
+        if self._active_profile is _UNSET:
+            from bot.handlers.profiles import get_active_profile
+            self._active_profile = get_active_profile(self.user)
+            _remember(self)
+        return self._active_profile
+
+
+def _remember(context):
+    """Кладёт копию контекста в кэш процесса, чтобы потоки не делили экземпляры моделей"""
+    if _process_cache.ttl <= 0:
+        return
+    profile = context._active_profile
+    _process_cache.set(context.telegram_id, (
+        copy.copy(context.user),
+        profile if profile is _UNSET or profile is None else copy.copy(profile),
+    ))
+
+
+def _load(telegram_id):
+    cached = _process_cache.get(telegram_id)
+    if cached is not None:
+        user, profile = cached
+        if profile is not _UNSET and profile is not None:
+            profile = copy.copy(profile)
+        return UserContext(copy.copy(user), profile)
+
+    context = UserContext(User.objects.get(telegram_id=telegram_id))
+    _remember(context)
+    return context
+
+
+def get_user_context(telegram_id):
+    """
+    Возвращает контекст пользователя.
+
+    Внутри update_scope контекст строится один раз на обновление.
+
+    Raises:
+        User.DoesNotExist: если пользователь не найден
+    """
+    telegram_id = str(telegram_id)
+    contexts = getattr(_local, 'contexts', None)
+    if contexts is None:
+        return _load(telegram_id)
+
+    context = contexts.get(telegram_id)
+    if context is None:
+        context = contexts[telegram_id] = _load(telegram_id)
+    return context
+
+
+def invalidate_user_context(telegram_id):
+    """Сбрасывает кэшированный контекст пользователя"""
+    telegram_id = str(telegram_id)
+    _process_cache.delete(telegram_id)
+    contexts = getattr(_local, 'contexts', None)
+    if contexts is not None:
+        contexts.pop(telegram_id, None)
+
+
+@contextmanager
+def update_scope():
+    """Область жизни контекстов на время обработки одного обновления"""
+    _local.contexts = {}
+    try:
+        yield
+    finally:
+        _local.contexts = None
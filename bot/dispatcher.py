@@ -0,0 +1,205 @@
+"""Пул обработки входящих обновлений Telegram"""
+import queue
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from traceback import format_exc
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from bot import bot, logger
+from bot.context import update_scope
+from bot.metrics import metrics
+
+
+def get_update_chat_id(update):
+    """Возвращает ID чата, к которому относится обновление (ключ очерёдности)"""
+    for attr in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        message = getattr(update, attr, None)
+        if message is not None:
+            return message.chat.id
+
+    callback = getattr(update, 'callback_query', None)
+    if callback is not None:
+        if callback.message is not None:
+            return callback.message.chat.id
+        return callback.from_user.id
+
+    for attr in ('inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query',
+                 'my_chat_member', 'chat_member', 'chat_join_request'):
+        event = getattr(update, attr, None)
+        if event is not None:
+            chat = getattr(event, 'chat', None)
+            if chat is not None:
+                return chat.id
+            return event.from_user.id
+
+    return update.update_id
+
+
+def process_update(update):
+    """Обрабатывает одно обновление в текущем потоке"""
+    close_old_connections()
+    started = time.perf_counter()
+    try:
+        with update_scope():
+            bot.process_new_updates([update])
+    except Exception as e:
+        metrics.increment('updates.failed')
+        logger.error(f"Error processing update {update.update_id}: {e}")
+        logger.error(f"Traceback: {format_exc()}")
+    finally:
+        metrics.observe('updates.process', time.perf_counter() - started)
+        metrics.increment('updates.processed')
+        close_old_connections()
+
+
+def instrument_handlers(telebot_instance):
+    """Оборачивает зарегистрированные обработчики замером времени выполнения"""
+    handler_lists = (
+        telebot_instance.message_handlers,
+        telebot_instance.callback_query_handlers,
+    )
+    for handlers in handler_lists:
+        for handler in handlers:
+            function = handler['function']
+            if getattr(function, '_instrumented', False):
+                continue
+            handler['function'] = _timed_handler(function)
+
+
+def _timed_handler(function):
+    name = f"handler.{function.__name__}"
+
+    @wraps(function)
+    def wrapped(*args, **kwargs):
+        with metrics.timer(name):
+            return function(*args, **kwargs)
+
+    wrapped._instrumented = True
+    return wrapped
+
+
+class UpdateDispatcher:
+    """
+    Ограниченный пул потоков для обработки обновлений.
+
+    Каждый чат закреплён за одним потоком (по хэшу chat_id), поэтому
+    обновления одного чата обрабатываются строго по порядку, а разные
+    чаты - параллельно.
+    """
+
+    def __init__(self, workers, queue_size):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._queues = []
+        self._started = False
+        self._lock = threading.Lock()
+        # Число принятых и еще не обработанных обновлений по чатам
+        self._pending = Counter()
+        self._pending_lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            per_worker = max(1, self.queue_size // self.workers)
+            for index in range(self.workers):
+                shard = queue.Queue(maxsize=per_worker)
+                self._queues.append(shard)
+                thread = threading.Thread(
+                    target=self._run,
+                    args=(shard,),
+                    name=f"update-worker-{index}",
+                    daemon=True,
+                )
+                thread.start()
+            metrics.register_gauge('updates.queue_depth', self.queue_depth)
+            self._started = True
+
+    def _run(self, shard):
+        while True:
+            update, chat_id, enqueued_at = shard.get()
+            metrics.observe('updates.queue_wait', time.perf_counter() - enqueued_at)
+            try:
+                process_update(update)
+            finally:
+                self._release(chat_id)
+                shard.task_done()
+
+    def _release(self, chat_id):
+        with self._pending_lock:
+            self._pending[chat_id] -= 1
+            if self._pending[chat_id] <= 0:
+                del self._pending[chat_id]
+
+    def has_pending(self, chat_id):
+        """Есть ли у чата принятые и еще не обработанные обновления"""
+        with self._pending_lock:
+            return chat_id in self._pending
+
+    def submit(self, update):
+        """
+        Ставит обновление в очередь.
+
+        Returns:
+            bool: False, если очередь переполнена и обновление не принято
+        """
+        if not self._started:
+            self._start()
+        chat_id = get_update_chat_id(update)
+        shard = self._queues[hash(chat_id) % self.workers]
+        with self._pending_lock:
+            self._pending[chat_id] += 1
+        try:
+            shard.put_nowait((update, chat_id, time.perf_counter()))
+        except queue.Full:
+            self._release(chat_id)
+            metrics.increment('updates.rejected')
+            return False
+        metrics.increment('updates.enqueued')
+        return True
+
+    def queue_depth(self):
+        return sum(shard.qsize() for shard in self._queues)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """Возвращает пул обработки обновлений или None, если включён синхронный режим"""
+    global _dispatcher
+    if settings.BOT_UPDATE_WORKERS <= 0:
+        return None
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = UpdateDispatcher(
+                    workers=settings.BOT_UPDATE_WORKERS,
+                    queue_size=settings.BOT_UPDATE_QUEUE_SIZE,
+                )
+    return _dispatcher
+
+
+def has_pending_updates(chat_id):
+    """Есть ли у чата обновления в пуле обработки (в синхронном режиме - нет)"""
+    dispatcher = get_dispatcher()
+    return dispatcher is not None and dispatcher.has_pending(chat_id)
+
+
+def dispatch_update(update):
+    """
+    Передаёт обновление на обработку: в пул потоков или синхронно.
+
+    Returns:
+        bool: False, если обновление не принято из-за переполнения очереди
+    """
+    dispatcher = get_dispatcher()
+    if dispatcher is None:
+        process_update(update)
+        return True
+    return dispatcher.submit(update)
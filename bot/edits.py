@@ -0,0 +1,200 @@
+"""Объединение частых правок сообщений с учетом лимитов Telegram"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from telebot.apihelper import ApiTelegramException
+
+from bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сколько чатов помнит планировщик (время следующей разрешенной правки)
+MAX_TRACKED_MESSAGES = 10000
+
+# Число блокировок чатов: отправки в один чат идут строго по очереди
+CHAT_LOCK_STRIPES = 64
+
+PendingEdit = namedtuple('PendingEdit', ['text', 'reply_markup', 'content_hash', 'seen_hash'])
+
+
+def content_hash(text, reply_markup=None):
+    """Хэш содержимого сообщения: текст и клавиатура"""
+    markup_json = reply_markup.to_json() if reply_markup is not None else ''
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update((text or '').strip().encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(markup_json.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _is_not_modified(error):
+    return error.error_code == 400 and 'message is not modified' in (error.description or '')
+
+
+def _retry_after(error):
+    return (error.result_json or {}).get('parameters', {}).get('retry_after', 1)
+
+
+def _edit_message_text(chat_id, message_id, text, reply_markup):
+    from bot import bot
+    return bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, reply_markup=reply_markup)
+
+
+class EditScheduler:
+    """
+    Планировщик правок сообщений по ключу (chat_id, message_id).
+
+    Правка отправляется сразу, если чат не превысил лимит (одна правка
+    в min_interval секунд). Иначе она откладывается до конца интервала,
+    а более новая правка того же сообщения заменяет ожидающую. Правки,
+    совпадающие с текущим содержимым сообщения из callback-запроса,
+    не отправляются. После ответа 429 чат ждет retry_after, последняя
+    правка отправляется после паузы.
+    """
+
+    def __init__(self, min_interval=None, send=None):
+        self.min_interval = settings.EDIT_MIN_INTERVAL if min_interval is None else min_interval
+        self._send = send or _edit_message_text
+        self._lock = threading.Lock()
+        self._chat_locks = [threading.Lock() for _ in range(CHAT_LOCK_STRIPES)]
+        self._pending = OrderedDict()
+        self._next_at = OrderedDict()
+        self._timers = {}
+
+    def _chat_lock(self, chat_id):
+        return self._chat_locks[hash(chat_id) % CHAT_LOCK_STRIPES]
+
+    @staticmethod
+    def _unchanged(edit):
+        """
+        Содержимое сообщения уже совпадает с правкой.
+
+        Сравнивается только с содержимым из callback-запроса: сообщение
+        могли изменить в обход планировщика, поэтому отправленные ранее
+        правки не учитываются.
+        """
+        return edit.content_hash == edit.seen_hash
+
+    def edit(self, message, text, reply_markup=None):
+        """
+        Заменяет текст и клавиатуру сообщения, к которому относится callback.
+
+        Ошибки немедленной отправки (кроме 429 и «message is not modified»)
+        передаются вызывающему; ошибки отложенной отправки записываются в лог.
+
+        Args:
+            message: сообщение из callback-запроса (текущее содержимое)
+        """
+        chat_id = message.chat.id
+        key = (chat_id, message.message_id)
+        edit = PendingEdit(
+            text,
+            reply_markup,
+            content_hash(text, reply_markup),
+            content_hash(message.text, message.reply_markup)
+        )
+
+        with self._chat_lock(chat_id):
+            with self._lock:
+                if key in self._pending:
+                    # Ожидающая правка устарела: отправится только последняя
+                    metrics.increment('edits.coalesced')
+                    self._pending[key] = edit
+                    return
+                if self._unchanged(edit):
+                    metrics.increment('edits.unchanged')
+                    return
+                now = time.monotonic()
+                next_at = self._next_at.get(chat_id, 0.0)
+                if now < next_at or self._has_pending(chat_id):
+                    metrics.increment('edits.deferred')
+                    self._pending[key] = edit
+                    self._schedule(chat_id, next_at - now)
+                    return
+                self._reserve(chat_id, now + self.min_interval)
+            self._deliver(key, edit, raise_errors=True)
+
+    def _has_pending(self, chat_id):
+        return any(pending_chat_id == chat_id for pending_chat_id, _ in self._pending)
+
+    def _reserve(self, chat_id, next_at):
+        self._next_at[chat_id] = max(next_at, self._next_at.get(chat_id, 0.0))
+        self._next_at.move_to_end(chat_id)
+        while len(self._next_at) > MAX_TRACKED_MESSAGES:
+            self._next_at.popitem(last=False)
+
+    def _schedule(self, chat_id, delay):
+        if chat_id in self._timers:
+            return
+        timer = threading.Timer(max(delay, 0.0), self._flush, args=(chat_id,))
+        timer.daemon = True
+        self._timers[chat_id] = timer
+        timer.start()
+
+    def _deliver(self, key, edit, raise_errors=False):
+        chat_id, message_id = key
+        try:
+            self._send(chat_id, message_id, edit.text, edit.reply_markup)
+        except ApiTelegramException as e:
+            if _is_not_modified(e):
+                metrics.increment('edits.unchanged')
+                return
+            if e.error_code == 429:
+                retry_after = _retry_after(e)
+                metrics.increment('edits.throttled')
+                logger.warning(f"Edit {chat_id}/{message_id}: 429, пауза {retry_after} сек")
+                with self._lock:
+                    self._reserve(chat_id, time.monotonic() + retry_after)
+                    # Более новая правка, пришедшая за время отправки, важнее
+                    self._pending.setdefault(key, edit)
+                    self._schedule(chat_id, retry_after)
+                return
+            metrics.increment('edits.failed')
+            if raise_errors:
+                raise
+            logger.warning(f"Edit {chat_id}/{message_id} failed: {e}")
+            return
+        except Exception as e:
+            metrics.increment('edits.failed')
+            if raise_errors:
+                raise
+            logger.warning(f"Edit {chat_id}/{message_id} failed: {e}")
+            return
+        metrics.increment('edits.sent')
+
+    def _flush(self, chat_id):
+        """Отправляет самую раннюю отложенную правку чата (поток таймера)"""
+        with self._chat_lock(chat_id):
+            with self._lock:
+                self._timers.pop(chat_id, None)
+                now = time.monotonic()
+                next_at = self._next_at.get(chat_id, 0.0)
+                if now < next_at:
+                    self._schedule(chat_id, next_at - now)
+                    return
+                key = next((key for key in self._pending if key[0] == chat_id), None)
+                if key is None:
+                    return
+                edit = self._pending.pop(key)
+                if self._unchanged(edit):
+                    metrics.increment('edits.unchanged')
+                    edit = None
+                else:
+                    self._reserve(chat_id, now + self.min_interval)
+            if edit is not None:
+                self._deliver(key, edit)
+            with self._lock:
+                if self._has_pending(chat_id):
+                    self._schedule(chat_id, self._next_at.get(chat_id, 0.0) - time.monotonic())
+
+
+edit_scheduler = EditScheduler()
+
+
+def edit_message(message, text, reply_markup=None):
+    """Правка сообщения callback-запроса через общий планировщик"""
+    edit_scheduler.edit(message, text, reply_markup)
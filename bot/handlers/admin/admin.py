@@ -10,11 +10,20 @@ from bot.keyboards import (
     generate_admin_payment_method_keyboard,
     generate_admin_payment_months_keyboard,
     generate_student_info_keyboard,
+    generate_student_search_results_keyboard,
     generate_payment_history_keyboard
 )
 from bot import bot, logger
+from bot.context import get_user_context
+from bot.edits import edit_message
 from bot.models import User, Payment, PaymentHistory, AdminState
+from bot.paid_months import get_paid_months
+from bot.students import NEXT, PREV, get_students_count
 from bot.pricing import get_price_by_class
+from bot.search import search_students
+
+# Учеников на одной странице списка
+STUDENTS_PER_PAGE = 8
 
 
 def admin_permission(func):
@@ -25,8 +34,11 @@ def admin_permission(func):
     @wraps(func)
     def wrapped(message: Message) -> None:
         user_id = message.from_user.id
-        user = User.objects.get(telegram_id=user_id)
-        if not user.is_admin:
+        try:
+            is_admin = get_user_context(user_id).is_admin
+        except User.DoesNotExist:
+            is_admin = False
+        if not is_admin:
             bot.send_message(user_id, '⛔ У вас нет администраторского доступа')
             logger.warning(f'Попытка доступа к админ панели от {user_id}')
             return
@@ -44,8 +56,7 @@ def admin_permission_callback(func):
     def wrapped(call: CallbackQuery) -> None:
         user_id = call.from_user.id
         try:
-            user = User.objects.get(telegram_id=user_id)
-            if not user.is_admin:
+            if not get_user_context(user_id).is_admin:
                 bot.answer_callback_query(call.id, '⛔ У вас нет администраторского доступа')
                 logger.warning(f'Попытка доступа к админ панели от {user_id}')
                 return
@@ -64,6 +75,8 @@ def admin_menu(msg: Message):
 @admin_permission_callback
 def admin_menu_callback(call: CallbackQuery):
     """Обработчик для возврата в админ меню из callback"""
+    # Выход в меню отменяет ожидание ввода (поиск, сумма)
+    AdminState.objects.filter(admin_id=str(call.from_user.id)).delete()
     bot.edit_message_text(
         chat_id=call.message.chat.id,
         message_id=call.message.message_id,
@@ -79,21 +92,72 @@ def handle_view_students(call: CallbackQuery):
         chat_id=call.message.chat.id,
         message_id=call.message.message_id,
         text="Выберите ученика для просмотра информации:",
-        reply_markup=generate_students_pagination_keyboard()
+        reply_markup=generate_students_pagination_keyboard(students_per_page=STUDENTS_PER_PAGE)
     )
 
 
 @admin_permission_callback
-def handle_students_page(call: CallbackQuery):
-    """Обработчик пагинации списка учеников"""
-    # Получаем номер страницы из callback_data
-    page = int(call.data.split('_')[2])
-    
+def handle_search_students(call: CallbackQuery):
+    """Включает режим поиска ученика: следующее сообщение админа - поисковый запрос"""
+    admin_id = str(call.from_user.id)
+    AdminState.objects.filter(admin_id=admin_id, state='waiting_balance_amount').delete()
+    AdminState.objects.update_or_create(
+        admin_id=admin_id,
+        state='waiting_search_query',
+        defaults={'data': {}}
+    )
     bot.edit_message_text(
         chat_id=call.message.chat.id,
         message_id=call.message.message_id,
-        text="Выберите ученика для просмотра информации:",
-        reply_markup=generate_students_pagination_keyboard(page=page)
+        text="🔍 Введите имя или фамилию ученика (можно начало слова):",
+        reply_markup=InlineKeyboardMarkup().add(
+            InlineKeyboardButton("⬅️ Назад", callback_data="admin_menu")
+        )
+    )
+
+
+def handle_admin_search_query(msg: Message, search_state: AdminState):
+    """Ищет учеников по тексту сообщения и показывает найденных"""
+    students = search_students(msg.text)
+    if not students:
+        bot.send_message(
+            msg.chat.id,
+            "🔍 Никого не найдено. Попробуйте другой запрос:",
+            reply_markup=InlineKeyboardMarkup().add(
+                InlineKeyboardButton("⬅️ Назад", callback_data="admin_menu")
+            )
+        )
+        return
+    
+    search_state.delete()
+    bot.send_message(
+        msg.chat.id,
+        f"🔍 Найдено учеников: {len(students)}. Выберите ученика:",
+        reply_markup=generate_student_search_results_keyboard(students)
+    )
+
+
+@admin_permission_callback
+def handle_students_page(call: CallbackQuery):
+    """Обработчик пагинации списка учеников"""
+    # Номер страницы, направление и курсор разобраны маршрутизатором из callback_data
+    page, direction, cursor = call.route_params
+    if direction not in (NEXT, PREV):
+        bot.answer_callback_query(call.id, "❌ Неверный формат данных")
+        return
+    
+    total_pages = max(1, (get_students_count() + STUDENTS_PER_PAGE - 1) // STUDENTS_PER_PAGE)
+    
+    # Частые нажатия стрелок объединяются: отправляется только последняя страница
+    edit_message(
+        call.message,
+        f"Выберите ученика для просмотра информации:\n\nСтраница {min(page, total_pages)} из {total_pages}",
+        generate_students_pagination_keyboard(
+            page=page,
+            cursor=cursor,
+            direction=direction,
+            students_per_page=STUDENTS_PER_PAGE
+        )
     )
 
 
@@ -101,9 +165,9 @@ def handle_students_page(call: CallbackQuery):
 def handle_select_student(call: CallbackQuery):
     """Обработчик выбора ученика для просмотра информации"""
     try:
-        # Получаем ID ученика из callback_data
+        # ID ученика разобран маршрутизатором из callback_data
         logger.info(f"Callback data: {call.data}")
-        student_id = call.data.split('_')[2].strip()
+        student_id, = call.route_params
         logger.info(f"Student ID: '{student_id}'")
         
         # Проверяем, что ID не пустой и не является служебным словом
@@ -114,8 +178,8 @@ def handle_select_student(call: CallbackQuery):
         
         student = User.objects.get(telegram_id=student_id)
         
-        # Получаем информацию об оплатах ученика
-        payments = PaymentHistory.objects.filter(user=student, status='completed').order_by('year', 'month')
+        # Получаем оплаченные месяцы ученика (одна маска на год)
+        paid_months = get_paid_months(student.telegram_id)
         
         # Определяем текущий месяц и год
         current_date = datetime.now()
@@ -123,13 +187,13 @@ def handle_select_student(call: CallbackQuery):
         current_year = current_date.year
         
         # Проверяем, оплачен ли текущий месяц
-        current_month_paid = payments.filter(month=current_month, year=current_year).exists()
+        current_month_paid = paid_months.is_paid(current_month, current_year)
         
         # Находим последний оплаченный месяц
         last_paid_month = None
-        if payments.exists():
-            last_payment = payments.last()
-            last_paid_month = f"{last_payment.month}/{last_payment.year}"
+        last_payment = paid_months.last()
+        if last_payment:
+            last_paid_month = f"{last_payment[0]}/{last_payment[1]}"
         
         # Формируем текст сообщения
         message_text = f"👤 Информация об ученике:\n\n"
@@ -143,7 +207,7 @@ def handle_select_student(call: CallbackQuery):
         message_text += "✅ Оплачен" if current_month_paid else "❌ Не оплачен"
         message_text += f"\nПоследний оплаченный месяц: {last_paid_month or 'Нет оплат'}\n\n"
         
-        message_text += f"📊 Всего оплат: {payments.count()}"
+        message_text += f"📊 Всего оплат: {len(paid_months)}"
         
         bot.edit_message_text(
             chat_id=call.message.chat.id,
@@ -163,13 +227,9 @@ def handle_select_student(call: CallbackQuery):
 def handle_view_payment_history(call: CallbackQuery):
     """Показывает историю оплат ученика"""
     try:
-        # Получаем ID ученика из callback_data
+        # ID ученика разобран маршрутизатором из callback_data
         logger.info(f"Callback data: {call.data}")
-        parts = call.data.split('_')
-        logger.info(f"Split parts: {parts}")
-        
-        # ID находится на последней позиции
-        student_id = parts[-1].strip()
+        student_id, = call.route_params
         logger.info(f"Student ID: '{student_id}'")
         
         # Проверяем, что ID не пустой и не является служебным словом
@@ -219,13 +279,9 @@ def handle_view_payment_history(call: CallbackQuery):
 def handle_mark_payment_for_student(call: CallbackQuery):
     """Показывает выбор месяца для отметки оплаты конкретного ученика"""
     try:
-        # Получаем ID ученика из callback_data
+        # ID ученика разобран маршрутизатором из callback_data
         logger.info(f"Callback data: {call.data}")
-        parts = call.data.split('_')
-        logger.info(f"Split parts: {parts}")
-        
-        # ID находится на последней позиции
-        student_id = parts[-1].strip()
+        student_id, = call.route_params
         logger.info(f"Student ID: '{student_id}'")
         
         # Проверяем, что ID не пустой и не является служебным словом
@@ -255,13 +311,9 @@ def handle_mark_payment_for_student(call: CallbackQuery):
 def handle_admin_payment_method_selection(call: CallbackQuery):
     """Обработчик выбора способа оплаты админом"""
     try:
-        # Получаем ID ученика из callback_data
+        # ID ученика разобран маршрутизатором из callback_data
         logger.info(f"Callback data: {call.data}")
-        parts = call.data.split('_')
-        logger.info(f"Split parts: {parts}")
-        
-        # ID находится на последней позиции
-        student_id = parts[-1].strip()
+        student_id, = call.route_params
         logger.info(f"Student ID: '{student_id}'")
         
         # Проверяем, что ID не пустой и не является служебным словом
@@ -279,7 +331,7 @@ def handle_admin_payment_method_selection(call: CallbackQuery):
                 message_id=call.message.message_id,
                 text=f"Выберите месяц оплаты для ученика {student.full_name or 'Не указано'}:\n\n"
                      f"💳 Текущий баланс: {student.balance} ₽",
-                reply_markup=generate_admin_payment_months_keyboard(student_id)
+                reply_markup=generate_admin_payment_months_keyboard(student_id, get_paid_months(student_id))
             )
         elif call.data.startswith("admin_balance_payment_"):
             # Зачисление на баланс - запрашиваем сумму
@@ -295,7 +347,8 @@ def handle_admin_payment_method_selection(call: CallbackQuery):
                 )
             )
             
-            # Сохраняем состояние для ожидания ввода суммы
+            # Сохраняем состояние для ожидания ввода суммы (поиск при этом отменяется)
+            AdminState.objects.filter(admin_id=str(call.from_user.id), state='waiting_search_query').delete()
             AdminState.objects.update_or_create(
                 admin_id=str(call.from_user.id),
                 state='waiting_balance_amount',
@@ -376,8 +429,14 @@ def handle_admin_text_input(msg: Message):
                 )
                 admin_state.delete()
         else:
-            # Нет активного состояния - игнорируем сообщение
-            pass
+            # Ожидается поисковый запрос
+            search_state = AdminState.objects.filter(
+                admin_id=admin_id,
+                state='waiting_search_query'
+            ).first()
+            if search_state:
+                handle_admin_search_query(msg, search_state)
+            # Иначе нет активного состояния - игнорируем сообщение
             
     except Exception as e:
         logger.error(f"Ошибка в handle_admin_text_input: {e}")
@@ -395,7 +454,7 @@ def handle_mark_student_payment(call: CallbackQuery):
         chat_id=call.message.chat.id,
         message_id=call.message.message_id,
         text="Выберите ученика для отметки оплаты:",
-        reply_markup=generate_students_pagination_keyboard()
+        reply_markup=generate_students_pagination_keyboard(students_per_page=STUDENTS_PER_PAGE)
     )
 
 
@@ -403,19 +462,9 @@ def handle_mark_student_payment(call: CallbackQuery):
 def handle_admin_mark_payment(call: CallbackQuery):
     """Обработчик отметки оплаты администратором"""
     try:
-        # Разбираем callback_data
+        # Параметры разобраны маршрутизатором из callback_data
         logger.info(f"Callback data: {call.data}")
-        parts = call.data.split('_')
-        logger.info(f"Split parts: {parts}")
-        
-        if len(parts) < 5:
-            bot.answer_callback_query(call.id, "❌ Неверный формат данных")
-            logger.error(f"Неверный формат callback_data: {call.data}")
-            return
-        
-        student_id = parts[3].strip()
-        month = parts[4].strip()
-        year = parts[5].strip()
+        student_id, month, year = call.route_params
         
         logger.info(f"Student ID: '{student_id}', Month: '{month}', Year: '{year}'")
         
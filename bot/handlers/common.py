@@ -3,7 +3,9 @@ from bot import bot
 from bot.keyboards import main_markup
 from bot.texts import MAIN_TEXT
 from bot.models import User, StudentProfile
+from bot.context import get_user_context
 from bot.handlers.registration import start_registration
+from bot.screens import NeedsRegistration, render_main_menu
 
 
 def start(message: Message) -> None:
@@ -12,7 +14,7 @@ def start(message: Message) -> None:
     
     try:
         # Проверяем, есть ли пользователь в базе
-        user = User.objects.get(telegram_id=telegram_id)
+        user = get_user_context(telegram_id).user
         
         # Проверяем, есть ли у пользователя хотя бы один профиль
         if not user.student_profiles.exists():
@@ -34,7 +36,7 @@ def show_main_menu(message: Message) -> None:
     
     try:
         # Проверяем, есть ли пользователь в базе
-        user = User.objects.get(telegram_id=telegram_id)
+        user = get_user_context(telegram_id).user
         
         # Проверяем, есть ли у пользователя хотя бы один профиль
         if not user.student_profiles.exists():
@@ -52,34 +54,24 @@ def show_main_menu(message: Message) -> None:
 
 def menu_call(call: CallbackQuery) -> None:
     """Обработчик для возврата в главное меню"""
-    telegram_id = str(call.from_user.id)
+    try:
+        screen = render_main_menu(str(call.from_user.id))
+    except NeedsRegistration:
+        # Если пользователя нет в базе или нет профилей, отправляем на регистрацию
+        start_registration(call.message)
+        return
     
     try:
-        # Проверяем, есть ли пользователь в базе
-        user = User.objects.get(telegram_id=telegram_id)
-        
-        # Проверяем, есть ли у пользователя хотя бы один профиль
-        if not user.student_profiles.exists():
-            # Если нет профилей, отправляем на регистрацию
-            start_registration(call.message)
-            return
-        
-        # Если есть профили, показываем главное меню
-        try:
-            bot.edit_message_text(
-                chat_id=call.message.chat.id,
-                message_id=call.message.message_id,
-                text=MAIN_TEXT,
-                reply_markup=main_markup
-            )
-        except Exception:
-            # Если не удалось отредактировать сообщение, отправляем новое
-            bot.send_message(
-                chat_id=call.message.chat.id,
-                text=MAIN_TEXT,
-                reply_markup=main_markup
-            )
-        
-    except User.DoesNotExist:
-        # Если пользователя нет в базе, отправляем на регистрацию
-        start_registration(call.message)
\ No newline at end of file
+        bot.edit_message_text(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            text=screen.text,
+            reply_markup=screen.markup
+        )
+    except Exception:
+        # Если не удалось отредактировать сообщение, отправляем новое
+        bot.send_message(
+            chat_id=call.message.chat.id,
+            text=screen.text,
+            reply_markup=screen.markup
+        )
@@ -1,28 +1,34 @@
 from telebot.types import CallbackQuery
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from bot import bot
 import logging
 
 logger = logging.getLogger('bot')
+from bot import ledger
+from bot.admins import get_admin_ids
+from bot.context import get_user_context
+from bot.edits import edit_message
 from bot.models import User, Payment, PaymentHistory
 from bot.keyboards import (
     generate_payment_method_keyboard,
-    generate_payment_months_keyboard,
-    generate_balance_payment_months_keyboard,
     generate_check_payment_keyboard,
     generate_payment_menu_keyboard
 )
+from bot.notifications import render_admin_payment_text
+from bot.payment_state import APPLIED, apply_payment_status, record_payment_success
 from bot.pricing import get_price_by_class
+from bot.screens import Alert, NeedsRegistration, render_payment_menu, render_payment_months
 from bot.yookassa_client import create_payment as create_yookassa_payment
 
 
 def payment_method(call: CallbackQuery) -> None:
     """Показывает меню выбора способа оплаты"""
     try:
-        user = User.objects.get(telegram_id=str(call.from_user.id))
+        context = get_user_context(str(call.from_user.id))
+        user = context.user
         
         # Получаем активный профиль
-        active_profile = user.student_profiles.filter(is_active=True).first()
+        active_profile = context.active_profile
         if not active_profile:
             bot.answer_callback_query(call.id, "❌ У вас нет активного профиля")
             return
@@ -74,70 +80,22 @@ def payment_menu(call: CallbackQuery) -> None:
     """Показывает меню оплаты"""
     from bot.handlers.registration import start_registration
 
-    telegram_id = str(call.from_user.id)
-
     try:
-        # Проверяем, есть ли пользователь в базе
-        user = User.objects.get(telegram_id=telegram_id)
-
-        # Проверяем, есть ли у пользователя хотя бы один профиль
-        if not user.student_profiles.exists():
-            # Если нет профилей, отправляем на регистрацию
-            bot.answer_callback_query(call.id, "⚠️ Для оплаты необходимо пройти регистрацию")
-            start_registration(call.message)
-            return
-
-        # Автоматически проверяем статус незавершенных платежей пользователя
-        check_pending_payments(user)
-
-        # Получаем активный профиль
-        active_profile = user.student_profiles.filter(is_active=True).first()
-        if not active_profile:
-            bot.answer_callback_query(call.id, "❌ У вас нет активного профиля")
-            return
-
-        # Получаем цену занятия для ученика с учетом уровня образования
-        class_key = active_profile.class_number
-        if active_profile.education_level:
-            if active_profile.class_number in ['10', '11']:
-                class_key = f"{active_profile.class_number}_{active_profile.education_level}"
-
-        price_info = get_price_by_class(class_key)
-
-        if not price_info:
-            bot.answer_callback_query(call.id, "❌ Не удалось определить тариф для вашего класса")
-            return
-
-        lesson_price = price_info['price']
-        class_name = price_info['name']
-        description = price_info['description']
-
-        markup = generate_payment_menu_keyboard()
-
-        text = f"💳 Меню оплаты\n\n"
-        text += f"👤 Профиль: {active_profile.profile_name}\n"
-        text += f"📚 Класс: {active_profile.class_number}\n"
-        text += f"📊 Уровень: {active_profile.get_education_level_display() or 'Не указан'}\n"
-        text += f"💰 Тариф: {class_name}\n"
-        text += f"ℹ️ {description}\n"
-        text += f"💵 Стоимость: {lesson_price} ₽\n"
-        text += f"💳 Баланс: {active_profile.balance} ₽\n\n"
-        text += f"Выберите действие:"
-
-        try:
-            bot.edit_message_text(
-                chat_id=call.message.chat.id,
-                text=text,
-                reply_markup=markup,
-                message_id=call.message.message_id
-            )
-        except Exception as e:
-            print(f"Error editing message: {e}")
-            bot.answer_callback_query(call.id, "❌ Произошла ошибка")
-
-    except User.DoesNotExist:
+        # Заодно проверяем статус незавершенных платежей пользователя
+        screen = render_payment_menu(str(call.from_user.id), check_pending=check_pending_payments)
+    except NeedsRegistration:
         bot.answer_callback_query(call.id, "⚠️ Для оплаты необходимо пройти регистрацию")
         start_registration(call.message)
+        return
+    except Alert as e:
+        bot.answer_callback_query(call.id, str(e))
+        return
+
+    try:
+        edit_message(call.message, screen.text, screen.markup)
+    except Exception as e:
+        print(f"Error editing message: {e}")
+        bot.answer_callback_query(call.id, "❌ Произошла ошибка")
 
 
 def start_payment(call: CallbackQuery) -> None:
@@ -148,7 +106,8 @@ def start_payment(call: CallbackQuery) -> None:
     
     try:
         # Проверяем, есть ли пользователь в базе
-        user = User.objects.get(telegram_id=telegram_id)
+        context = get_user_context(telegram_id)
+        user = context.user
         
         # Проверяем, есть ли у пользователя хотя бы один профиль
         if not user.student_profiles.exists():
@@ -158,7 +117,7 @@ def start_payment(call: CallbackQuery) -> None:
             return
         
         # Получаем активный профиль
-        active_profile = user.student_profiles.filter(is_active=True).first()
+        active_profile = context.active_profile
         if not active_profile:
             bot.answer_callback_query(call.id, "❌ У вас нет активного профиля")
             return
@@ -205,62 +164,17 @@ def start_payment(call: CallbackQuery) -> None:
 def select_payment_method(call: CallbackQuery) -> None:
     """Обрабатывает выбор способа оплаты"""
     try:
-        user = User.objects.get(telegram_id=str(call.from_user.id))
-        
-        # Получаем активный профиль
-        active_profile = user.student_profiles.filter(is_active=True).first()
-        if not active_profile:
-            bot.answer_callback_query(call.id, "❌ У вас нет активного профиля")
-            return
-            
-        # Получаем цену занятия для ученика с учетом уровня образования
-        class_key = active_profile.class_number
-        if active_profile.education_level:
-            if active_profile.class_number in ['10', '11']:
-                class_key = f"{active_profile.class_number}_{active_profile.education_level}"
-        
-        price_info = get_price_by_class(class_key)
-        
-        if not price_info:
-            bot.answer_callback_query(call.id, "❌ Не удалось определить тариф для вашего класса")
-            return
-            
-        lesson_price = price_info['price']
-        class_name = price_info['name']
-        description = price_info['description']
-        
-        if call.data == "pay_with_yookassa":
-            markup = generate_payment_months_keyboard()
-            text = f"📅 Выберите месяц для оплаты\n\n"
-            text += f"👤 Профиль: {active_profile.profile_name}\n"
-            text += f"📚 Класс: {active_profile.class_number}\n"
-            text += f"📊 Уровень: {active_profile.get_education_level_display() or 'Не указан'}\n"
-            text += f"💰 Тариф: {class_name}\n"
-            text += f"ℹ️ {description}\n"
-            text += f"💵 Стоимость: {lesson_price} ₽"
-        else:  # pay_with_balance
-            if active_profile.balance <= 0:
-                bot.answer_callback_query(call.id, "❌ На балансе недостаточно средств")
-                return
-            
-            markup = generate_balance_payment_months_keyboard()
-            text = f"📅 Выберите месяц для оплаты с баланса\n\n"
-            text += f"👤 Профиль: {active_profile.profile_name}\n"
-            text += f"📚 Класс: {active_profile.class_number}\n"
-            text += f"📊 Уровень: {active_profile.get_education_level_display() or 'Не указан'}\n"
-            text += f"💰 Тариф: {class_name}\n"
-            text += f"ℹ️ {description}\n"
-            text += f"💵 Стоимость: {lesson_price} ₽\n"
-            text += f"💳 Баланс: {active_profile.balance} ₽"
-        
-        bot.edit_message_text(
-            chat_id=call.message.chat.id,
-            text=text,
-            reply_markup=markup,
-            message_id=call.message.message_id
-        )
-    except User.DoesNotExist:
-        bot.answer_callback_query(call.id, "❌ Пользователь не найден")
+        screen = render_payment_months(str(call.from_user.id), with_balance=call.data == "pay_with_balance")
+    except Alert as e:
+        bot.answer_callback_query(call.id, str(e))
+        return
+    
+    bot.edit_message_text(
+        chat_id=call.message.chat.id,
+        text=screen.text,
+        reply_markup=screen.markup,
+        message_id=call.message.message_id
+    )
 
 
 def select_payment_month(call: CallbackQuery) -> None:
@@ -273,27 +187,18 @@ def select_payment_month(call: CallbackQuery) -> None:
     logger.info(f"YOOKASSA_SHOP_ID exists: {'YOOKASSA_SHOP_ID' in dir(settings)}")
     logger.info(f"YOOKASSA_SECRET_KEY exists: {'YOOKASSA_SECRET_KEY' in dir(settings)}")
     try:
-        # Получаем месяц и год из callback_data
-        parts = call.data.split('_')
-        if len(parts) < 4:
-            bot.answer_callback_query(call.id, "❌ Неверный формат данных")
-            return
-            
-        try:
-            month = int(parts[2])
-            year = int(parts[3])
-        except (IndexError, ValueError):
-            bot.answer_callback_query(call.id, "❌ Неверный формат даты")
-            return
+        # Месяц и год разобраны маршрутизатором из callback_data
+        month, year = call.route_params
             
         if not (1 <= month <= 12):
             bot.answer_callback_query(call.id, "❌ Неверный номер месяца")
             return
             
-        user = User.objects.get(telegram_id=str(call.from_user.id))
+        context = get_user_context(str(call.from_user.id))
+        user = context.user
         
         # Получаем активный профиль
-        active_profile = user.student_profiles.filter(is_active=True).first()
+        active_profile = context.active_profile
         if not active_profile:
             bot.answer_callback_query(call.id, "❌ У вас нет активного профиля")
             return
@@ -425,14 +330,14 @@ def select_payment_month(call: CallbackQuery) -> None:
 def select_balance_payment_month(call: CallbackQuery) -> None:
     """Обрабатывает выбор месяца для оплаты с баланса"""
     try:
-        # Получаем месяц и год из callback_data
-        month = int(call.data.split('_')[3])
-        year = int(call.data.split('_')[4])
+        # Месяц и год разобраны маршрутизатором из callback_data
+        month, year = call.route_params
         
-        user = User.objects.get(telegram_id=str(call.from_user.id))
+        context = get_user_context(str(call.from_user.id))
+        user = context.user
         
         # Получаем активный профиль
-        active_profile = user.student_profiles.filter(is_active=True).first()
+        active_profile = context.active_profile
         if not active_profile:
             bot.answer_callback_query(call.id, "❌ У вас нет активного профиля")
             return
@@ -458,27 +363,35 @@ def select_balance_payment_month(call: CallbackQuery) -> None:
         class_name = price_info['name']
         description = price_info['description']
         
-        # Проверяем достаточно ли средств на балансе
-        if active_profile.balance < lesson_price:
+        try:
+            with transaction.atomic():
+                # Проверка остатка и списание - одним условным обновлением
+                active_profile.balance = ledger.debit(
+                    active_profile.pk,
+                    lesson_price,
+                    month=month,
+                    year=year,
+                    description=class_name
+                )
+                
+                # Создаем запись в истории платежей
+                PaymentHistory.objects.create(
+                    user=user,
+                    student_profile=active_profile,
+                    month=month,
+                    year=year,
+                    amount_paid=lesson_price,
+                    pricing_plan=class_name,
+                    payment_type='balance',
+                    status='completed'
+                )
+        except ledger.InsufficientFunds:
             bot.answer_callback_query(call.id, "❌ На балансе недостаточно средств")
             return
-        
-        with transaction.atomic():
-            # Списываем средства с баланса
-            active_profile.balance -= lesson_price
-            active_profile.save()
-            
-            # Создаем запись в истории платежей
-            PaymentHistory.objects.create(
-                user=user,
-                student_profile=active_profile,
-                month=month,
-                year=year,
-                amount_paid=lesson_price,
-                pricing_plan=class_name,
-                payment_type='balance',
-                status='completed'
-            )
+        except IntegrityError:
+            # Параллельное нажатие уже оплатило месяц, списание откатилось
+            bot.answer_callback_query(call.id, "❌ Этот месяц уже оплачен")
+            return
         
         text = f"✅ Оплата успешно выполнена!\n\n"
         text += f"👤 Профиль: {active_profile.profile_name}\n"
@@ -511,10 +424,8 @@ def select_balance_payment_month(call: CallbackQuery) -> None:
 def check_payment(call: CallbackQuery) -> None:
     """Проверяет статус платежа"""
     try:
-        # Получаем данные из callback_data
-        payment_id = call.data.split('_')[2]
-        month = int(call.data.split('_')[3])
-        year = int(call.data.split('_')[4])
+        # Данные разобраны маршрутизатором из callback_data
+        payment_id, month, year = call.route_params
 
         logger.info(f"Проверка платежа: payment_id={payment_id}, month={month}, year={year}")
 
@@ -542,8 +453,8 @@ def check_payment(call: CallbackQuery) -> None:
             )
         else:
             # Проверяем актуальный статус у ЮKassa
-            from bot.yookassa_client import YooKassaClient
-            client = YooKassaClient()
+            from bot.yookassa_client import get_client
+            client = get_client()
 
             try:
                 # Получаем информацию о платеже от ЮKassa
@@ -553,33 +464,13 @@ def check_payment(call: CallbackQuery) -> None:
 
                 if payment_info and payment_info.get('status') == 'succeeded':
                     logger.info(f"Платеж {payment_id} успешно оплачен - обновляем БД")
-                    # Платеж успешно оплачен - обновляем статус и создаем запись в истории
-                    payment.status = 'succeeded'
-                    payment.payment_method = payment_info.get('payment_method', {})
-                    payment.save()
-
-                    # Создаем запись в истории платежей, если её нет
-                    from bot.models import PaymentHistory
-                    if not PaymentHistory.objects.filter(
-                        user=payment.user,
-                        payment=payment,
-                        month=payment.payment_month,
-                        year=payment.payment_year
-                    ).exists():
-                        PaymentHistory.objects.create(
-                            user=payment.user,
-                            student_profile=payment.student_profile,
-                            payment=payment,
-                            month=payment.payment_month,
-                            year=payment.payment_year,
-                            amount_paid=payment.amount,
-                            pricing_plan=payment.pricing_plan,
-                            payment_type='card',
-                            status='completed'
-                        )
-
-                    # Отправляем уведомления
-                    notify_payment_success(payment_id)
+                    # Статус, история оплат и уведомления - одной транзакцией под блокировкой платежа
+                    apply_payment_status(
+                        payment_id,
+                        'succeeded',
+                        payment_method=payment_info.get('payment_method'),
+                        source='check_payment'
+                    )
 
                     # Показываем успешное сообщение
                     text = f"✅ Оплата успешно выполнена!\n\n"
@@ -599,8 +490,7 @@ def check_payment(call: CallbackQuery) -> None:
                     )
                 elif payment_info and payment_info.get('status') == 'canceled':
                     # Платеж отменен
-                    payment.status = 'canceled'
-                    payment.save()
+                    apply_payment_status(payment_id, 'canceled', source='check_payment')
                     bot.answer_callback_query(call.id, "❌ Платеж был отменен")
                 else:
                     # Платеж еще в обработке
@@ -625,7 +515,8 @@ def payment_history(call: CallbackQuery) -> None:
     
     try:
         # Проверяем, есть ли пользователь в базе
-        user = User.objects.get(telegram_id=telegram_id)
+        context = get_user_context(telegram_id)
+        user = context.user
         
         # Проверяем, есть ли у пользователя хотя бы один профиль
         if not user.student_profiles.exists():
@@ -635,7 +526,7 @@ def payment_history(call: CallbackQuery) -> None:
             return
         
         # Получаем активный профиль
-        active_profile = user.student_profiles.filter(is_active=True).first()
+        active_profile = context.active_profile
         if not active_profile:
             bot.answer_callback_query(call.id, "❌ У вас нет активного профиля")
             return
@@ -691,66 +582,18 @@ def payment_history(call: CallbackQuery) -> None:
 
 
 def notify_payment_success(payment_id: str) -> None:
-    """Уведомляет пользователя об успешной оплате"""
-    try:
-        payment = Payment.objects.get(yookassa_payment_id=payment_id)
+    """
+    Фиксирует успешную оплату в истории и ставит уведомления в очередь.
 
-        # Создаем запись в истории платежей только если её ещё нет
-        if not PaymentHistory.objects.filter(
-            user=payment.user,
-            payment=payment,
-            month=payment.payment_month,
-            year=payment.payment_year
-        ).exists():
-            PaymentHistory.objects.create(
-                user=payment.user,
-                student_profile=payment.student_profile,
-                payment=payment,
-                month=payment.payment_month,
-                year=payment.payment_year,
-                amount_paid=payment.amount,
-                pricing_plan=payment.pricing_plan,
-                payment_type='card',
-                status='completed'
-            )
-        
-        # Получаем цену занятия для ученика
-        price_info = get_price_by_class(payment.student_profile.class_number)
-        
-        if price_info:
-            class_name = price_info['name']
-            description = price_info['description']
-        else:
-            class_name = payment.pricing_plan
-            description = ""
-        
-        # Отправляем уведомление пользователю
-        text = f"✅ Оплата успешно выполнена!\n\n"
-        text += f"👤 Профиль: {payment.student_profile.profile_name}\n"
-        text += f"📚 Класс: {payment.student_profile.class_number}\n"
-        text += f"📊 Уровень: {payment.student_profile.get_education_level_display() or 'Не указан'}\n"
-        text += f"💰 Тариф: {class_name}\n"
-        text += f"ℹ️ {description}\n"
-        text += f"📅 Период: {payment.payment_month:02d}.{payment.payment_year}\n"
-        text += f"💵 Сумма: {payment.amount} ₽"
-        
-        bot.send_message(
-            chat_id=payment.user.telegram_id,
-            text=text
-        )
-        
-        # Уведомляем админов
-        notify_admins_about_payment(
-            payment.user,
-            payment.student_profile,
-            payment.payment_month,
-            payment.payment_year,
-            payment.amount,
-            'card'
-        )
-        
-    except Payment.DoesNotExist:
-        pass
+    Сообщения отправляются фоновым отправителем очереди после фиксации транзакции.
+    """
+    with transaction.atomic():
+        payment = Payment.objects.select_for_update().select_related('student_profile').filter(
+            yookassa_payment_id=payment_id,
+            status='succeeded'
+        ).first()
+        if payment is not None:
+            record_payment_success(payment)
 
 
 def check_pending_payments(user: User) -> None:
@@ -767,8 +610,8 @@ def check_pending_payments(user: User) -> None:
 
         logger.info(f"Найдено {pending_payments.count()} незавершенных платежей для пользователя {user.telegram_id}")
 
-        from bot.yookassa_client import YooKassaClient
-        client = YooKassaClient()
+        from bot.yookassa_client import get_client
+        client = get_client()
 
         updated_count = 0
         for payment in pending_payments:
@@ -776,44 +619,17 @@ def check_pending_payments(user: User) -> None:
                 # Получаем актуальный статус от ЮKassa
                 payment_info = client.get_payment(payment.yookassa_payment_id)
 
-                if payment_info:
+                if payment_info and payment_info.get('status') in ('succeeded', 'canceled'):
                     new_status = payment_info.get('status')
-
-                    if new_status == 'succeeded' and payment.status != 'succeeded':
-                        # Платеж успешно завершен - обновляем БД
-                        payment.status = 'succeeded'
-                        payment.payment_method = payment_info.get('payment_method', {})
-                        payment.save()
-
-                        # Создаем запись в истории платежей, если её нет
-                        if not PaymentHistory.objects.filter(
-                            user=payment.user,
-                            payment=payment,
-                            month=payment.payment_month,
-                            year=payment.payment_year
-                        ).exists():
-                            PaymentHistory.objects.create(
-                                user=payment.user,
-                                student_profile=payment.student_profile,
-                                payment=payment,
-                                month=payment.payment_month,
-                                year=payment.payment_year,
-                                amount_paid=payment.amount,
-                                pricing_plan=payment.pricing_plan,
-                                payment_type='card',
-                                status='completed'
-                            )
-
-                        # Отправляем уведомления
-                        notify_payment_success(payment.yookassa_payment_id)
+                    transition = apply_payment_status(
+                        payment.yookassa_payment_id,
+                        new_status,
+                        payment_method=payment_info.get('payment_method') if new_status == 'succeeded' else None,
+                        source='check_payment'
+                    )
+                    if transition.outcome == APPLIED:
                         updated_count += 1
-                        logger.info(f"Платеж {payment.yookassa_payment_id} обновлен на succeeded")
-
-                    elif new_status == 'canceled' and payment.status != 'canceled':
-                        # Платеж отменен
-                        payment.status = 'canceled'
-                        payment.save()
-                        logger.info(f"Платеж {payment.yookassa_payment_id} обновлен на canceled")
+                        logger.info(f"Платеж {payment.yookassa_payment_id} обновлен на {new_status}")
 
             except Exception as e:
                 logger.error(f"Ошибка при проверке платежа {payment.yookassa_payment_id}: {e}")
@@ -827,30 +643,11 @@ def check_pending_payments(user: User) -> None:
 
 def notify_admins_about_payment(user: User, profile: 'StudentProfile', month: int, year: int, amount: float, payment_type: str) -> None:
     """Уведомляет админов об оплате"""
-    admins = User.objects.filter(is_admin=True)
-    
-    # Получаем цену занятия для ученика
-    price_info = get_price_by_class(profile.class_number)
-    
-    if price_info:
-        class_name = price_info['name']
-        description = price_info['description']
-    else:
-        class_name = "Тариф не определен"
-        description = ""
-    
-    text = f"💰 Новая оплата!\n\n"
-    text += f"👤 Ученик: {profile.full_name}\n"
-    text += f"📚 Класс: {profile.class_number}\n"
-    text += f"📊 Уровень: {profile.get_education_level_display() or 'Не указан'}\n"
-    text += f"💰 Тариф: {class_name}\n"
-    text += f"ℹ️ {description}\n"
-    text += f"📅 Период: {month:02d}.{year}\n"
-    text += f"💳 Способ: {'Банковская карта' if payment_type == 'card' else 'С баланса'}\n"
-    text += f"💵 Сумма: {amount} ₽"
+    admin_ids = get_admin_ids()
+    text = render_admin_payment_text(profile, month, year, amount, payment_type)
     
-    for admin in admins:
+    for admin_id in admin_ids:
         try:
-            bot.send_message(admin.telegram_id, text)
+            bot.send_message(admin_id, text)
         except Exception:
             continue
\ No newline at end of file
@@ -2,10 +2,13 @@ from django.db import transaction
 from telebot.types import CallbackQuery, Message
 from bot import bot
 from bot.models import User, StudentProfile
+from bot.context import get_user_context, invalidate_user_context
+from bot.edits import edit_message
+from bot.screens import Alert, render_profile
+from bot.states import get_state_store
 from bot.keyboards import (
     generate_profiles_menu_keyboard,
     generate_profiles_list_keyboard,
-    generate_profile_management_keyboard,
     generate_profile_data_management_keyboard,
     generate_profile_school_classes_keyboard,
     generate_profile_confirmation_keyboard,
@@ -16,7 +19,6 @@ from bot.keyboards import (
 from bot.texts import (
     PROFILES_MENU_TEXT,
     PROFILES_LIST_TEXT,
-    PROFILE_INFO_TEXT,
     PROFILE_DATA_MANAGEMENT_TEXT,
     PROFILE_CREATION_WELCOME,
     PROFILE_CLASS_CHOICE,
@@ -30,14 +32,14 @@ from bot.texts import (
     PROFILE_ALREADY_EXISTS
 )
 
-# Словарь для хранения состояния создания профиля
-profile_creation_states = {}
+# Хранилище состояний создания профиля
+profile_creation_states = get_state_store('profile_creation')
 
 
 def profiles_menu(call: CallbackQuery) -> None:
     """Показывает меню управления профилями"""
     try:
-        user = User.objects.get(telegram_id=str(call.from_user.id))
+        user = get_user_context(str(call.from_user.id)).user
         
         text = PROFILES_MENU_TEXT
         markup = generate_profiles_menu_keyboard()
@@ -55,7 +57,8 @@ def profiles_menu(call: CallbackQuery) -> None:
 def view_profiles(call: CallbackQuery) -> None:
     """Показывает список профилей пользователя с информацией об активном профиле"""
     try:
-        user = User.objects.get(telegram_id=str(call.from_user.id))
+        context = get_user_context(str(call.from_user.id))
+        user = context.user
         profiles = user.student_profiles.all().order_by('-is_active', 'created_at')
         
         if not profiles.exists():
@@ -63,7 +66,7 @@ def view_profiles(call: CallbackQuery) -> None:
             markup = generate_profiles_menu_keyboard()
         else:
             # Получаем активный профиль
-            active_profile = get_active_profile(user)
+            active_profile = context.active_profile
             
             text = f"👥 Ваши профили\n\n"
             
@@ -80,12 +83,7 @@ def view_profiles(call: CallbackQuery) -> None:
             
             markup = generate_profiles_list_keyboard(profiles)
         
-        bot.edit_message_text(
-            chat_id=call.message.chat.id,
-            text=text,
-            reply_markup=markup,
-            message_id=call.message.message_id
-        )
+        edit_message(call.message, text, markup)
     except User.DoesNotExist:
         bot.answer_callback_query(call.id, "Пользователь не найден")
 
@@ -93,7 +91,7 @@ def view_profiles(call: CallbackQuery) -> None:
 def create_profile(call: CallbackQuery) -> None:
     """Начинает процесс создания нового профиля"""
     try:
-        user = User.objects.get(telegram_id=str(call.from_user.id))
+        user = get_user_context(str(call.from_user.id)).user
         
         # Устанавливаем состояние создания профиля
         profile_creation_states[str(call.from_user.id)] = {
@@ -113,15 +111,15 @@ def create_profile(call: CallbackQuery) -> None:
         bot.answer_callback_query(call.id, "Пользователь не найден")
 
 
-def handle_profile_creation_message(message: Message) -> None:
-    """Обрабатывает текстовые сообщения во время создания профиля"""
+def handle_profile_creation_message(message: Message, state: dict = None) -> None:
+    """Обрабатывает текстовые сообщения во время создания профиля (state - уже прочитанное состояние)"""
     telegram_id = str(message.from_user.id)
     
-    if telegram_id not in profile_creation_states:
+    if state is None:
+        state = profile_creation_states.get(telegram_id)
+    if state is None:
         return
     
-    state = profile_creation_states[telegram_id]
-    
     if state['step'] == 'waiting_profile_name':
         # Сохраняем имя профиля и переходим к следующему шагу
         profile_name = message.text.strip()
@@ -130,7 +128,7 @@ def handle_profile_creation_message(message: Message) -> None:
             return
         
         try:
-            user = User.objects.get(telegram_id=telegram_id)
+            user = get_user_context(telegram_id).user
             
             # Проверяем, не существует ли уже профиль с таким именем
             if user.student_profiles.filter(profile_name=profile_name).exists():
@@ -140,6 +138,7 @@ def handle_profile_creation_message(message: Message) -> None:
             # Сохраняем имя профиля в состоянии
             state['profile_name'] = profile_name
             state['step'] = 'waiting_class'
+            profile_creation_states[telegram_id] = state
             
             text = PROFILE_CLASS_CHOICE.format(profile_name=profile_name)
             markup = generate_profile_school_classes_keyboard()
@@ -154,15 +153,14 @@ def handle_profile_class_choice(call: CallbackQuery) -> None:
     """Обрабатывает выбор класса для профиля"""
     telegram_id = str(call.from_user.id)
     
-    if telegram_id not in profile_creation_states:
+    state = profile_creation_states.get(telegram_id)
+    if state is None:
         return
     
-    state = profile_creation_states[telegram_id]
-    
     if state['step'] != 'waiting_class':
         return
     
-    raw_value = call.data.replace('profile_class_', '')
+    raw_value, = call.route_params
     education_level = None
     
     if raw_value == '10_base':
@@ -184,6 +182,7 @@ def handle_profile_class_choice(call: CallbackQuery) -> None:
         state['class_number'] = class_number
         state['education_level'] = education_level
         state['step'] = 'waiting_confirmation'
+        profile_creation_states[telegram_id] = state
         
         text = PROFILE_CONFIRMATION.format(
             profile_name=state['profile_name'],
@@ -207,17 +206,16 @@ def confirm_profile_creation(call: CallbackQuery) -> None:
     """Подтверждает создание профиля"""
     telegram_id = str(call.from_user.id)
     
-    if telegram_id not in profile_creation_states:
+    state = profile_creation_states.get(telegram_id)
+    if state is None:
         return
     
-    state = profile_creation_states[telegram_id]
-    
     if state['step'] != 'waiting_confirmation':
         return
     
     try:
         with transaction.atomic():
-            user = User.objects.get(telegram_id=telegram_id)
+            user = get_user_context(telegram_id).user
             
             # Создаем новый профиль
             profile = StudentProfile.objects.create(
@@ -232,6 +230,8 @@ def confirm_profile_creation(call: CallbackQuery) -> None:
             
             # Деактивируем все остальные профили пользователя
             user.student_profiles.exclude(id=profile.id).update(is_active=False)
+            # Массовое обновление не вызывает сигналов: сбрасываем кэш активного профиля
+            transaction.on_commit(lambda: invalidate_user_context(telegram_id))
             
             text = PROFILE_CREATED_SUCCESS.format(
                 profile_name=profile.profile_name,
@@ -258,45 +258,33 @@ def confirm_profile_creation(call: CallbackQuery) -> None:
 def select_profile(call: CallbackQuery) -> None:
     """Показывает информацию о выбранном профиле"""
     try:
-        # Парсим callback_data: select_profile_{profile_id}
-        profile_id = int(call.data.split('_')[2])
-        
-        profile = StudentProfile.objects.get(id=profile_id, user__telegram_id=str(call.from_user.id))
-        
-        status_display = "Активный" if profile.is_active else "Неактивный"
-        
-        text = PROFILE_INFO_TEXT.format(
-            profile_name=profile.profile_name,
-            full_name=profile.full_name or "Не указано",
-            class_number=profile.class_number,
-            education_level=profile.get_education_level_display() or 'Не указан',
-            balance=profile.balance,
-            created_at=profile.created_at.strftime('%d.%m.%Y'),
-            status=status_display
-        )
-        markup = generate_profile_management_keyboard(profile.id)
-        
-        bot.edit_message_text(
-            chat_id=call.message.chat.id,
-            text=text,
-            reply_markup=markup,
-            message_id=call.message.message_id
-        )
-    except (ValueError, StudentProfile.DoesNotExist):
-        bot.answer_callback_query(call.id, "Профиль не найден")
+        # Параметры разобраны маршрутизатором: select_profile_{profile_id}
+        profile_id, = call.route_params
+        screen = render_profile(str(call.from_user.id), profile_id)
+    except Alert as e:
+        bot.answer_callback_query(call.id, str(e))
+        return
+    
+    bot.edit_message_text(
+        chat_id=call.message.chat.id,
+        text=screen.text,
+        reply_markup=screen.markup,
+        message_id=call.message.message_id
+    )
 
 
 def switch_to_profile(call: CallbackQuery) -> None:
     """Переключает на выбранный профиль"""
     try:
-        # Парсим callback_data: switch_to_profile_{profile_id}
-        profile_id = int(call.data.split('_')[3])
+        # Параметры разобраны маршрутизатором: switch_to_profile_{profile_id}
+        profile_id, = call.route_params
         
         with transaction.atomic():
             profile = StudentProfile.objects.get(id=profile_id, user__telegram_id=str(call.from_user.id))
             
             # Деактивируем все профили пользователя
             profile.user.student_profiles.update(is_active=False)
+            transaction.on_commit(lambda: invalidate_user_context(profile.user_id))
             
             # Активируем выбранный профиль
             profile.is_active = True
@@ -318,8 +306,8 @@ def switch_to_profile(call: CallbackQuery) -> None:
 def edit_profile_data(call: CallbackQuery) -> None:
     """Показывает меню управления данными профиля"""
     try:
-        # Парсим callback_data: edit_profile_data_{profile_id}
-        profile_id = int(call.data.split('_')[3])
+        # Параметры разобраны маршрутизатором: edit_profile_data_{profile_id}
+        profile_id, = call.route_params
         
         profile = StudentProfile.objects.get(id=profile_id, user__telegram_id=str(call.from_user.id))
         
@@ -339,8 +327,8 @@ def edit_profile_data(call: CallbackQuery) -> None:
 def delete_profile(call: CallbackQuery) -> None:
     """Показывает первое подтверждение удаления профиля"""
     try:
-        # Парсим callback_data: delete_profile_{profile_id}
-        profile_id = int(call.data.split('_')[2])
+        # Параметры разобраны маршрутизатором: delete_profile_{profile_id}
+        profile_id, = call.route_params
         
         profile = StudentProfile.objects.get(id=profile_id, user__telegram_id=str(call.from_user.id))
         
@@ -360,8 +348,8 @@ def delete_profile(call: CallbackQuery) -> None:
 def confirm_delete_profile(call: CallbackQuery) -> None:
     """Показывает финальное подтверждение удаления профиля"""
     try:
-        # Парсим callback_data: confirm_delete_profile_{profile_id}
-        profile_id = int(call.data.split('_')[3])
+        # Параметры разобраны маршрутизатором: confirm_delete_profile_{profile_id}
+        profile_id, = call.route_params
         
         profile = StudentProfile.objects.get(id=profile_id, user__telegram_id=str(call.from_user.id))
         
@@ -384,8 +372,8 @@ def confirm_delete_profile(call: CallbackQuery) -> None:
 def final_delete_profile(call: CallbackQuery) -> None:
     """Выполняет финальное удаление профиля"""
     try:
-        # Парсим callback_data: final_delete_profile_{profile_id}
-        profile_id = int(call.data.split('_')[3])
+        # Параметры разобраны маршрутизатором: final_delete_profile_{profile_id}
+        profile_id, = call.route_params
         
         with transaction.atomic():
             profile = StudentProfile.objects.get(id=profile_id, user__telegram_id=str(call.from_user.id))
@@ -414,7 +402,4 @@ def is_user_creating_profile(telegram_id: str) -> bool:
 
 def get_active_profile(user: User) -> StudentProfile:
     """Получает активный профиль пользователя"""
-    try:
-        return user.student_profiles.get(is_active=True)
-    except StudentProfile.DoesNotExist:
-        return None
\ No newline at end of file
+    return user.student_profiles.filter(is_active=True).first()
\ No newline at end of file
@@ -1,3 +1,4 @@
+from bot.context import get_user_context, invalidate_user_context
 from bot.models import User, StudentProfile
 from bot import bot
 from django.conf import settings
@@ -7,11 +8,12 @@ from bot.texts import (
     REGISTRATION_CLASS,
     MAIN_TEXT
 )
+from bot.states import get_state_store
 from telebot.types import CallbackQuery, Message
 from django.db import transaction
 
-# Словарь для хранения состояния регистрации пользователей
-registration_states = {}
+# Хранилище состояний регистрации пользователей
+registration_states = get_state_store('registration')
 
 def start_registration(message: Message) -> None:
     """Начинает процесс регистрации пользователя"""
@@ -21,7 +23,7 @@ def start_registration(message: Message) -> None:
     
     # Проверяем, зарегистрирован ли уже пользователь
     try:
-        user = User.objects.get(telegram_id=telegram_id)
+        user = get_user_context(telegram_id).user
         if user.is_registered:
             # Пользователь уже зарегистрирован, показываем главное меню
             from bot.handlers.common import show_main_menu
@@ -40,15 +42,15 @@ def start_registration(message: Message) -> None:
     # Отправляем первый вопрос
     bot.send_message(message.chat.id, REGISTRATION_WELCOME)
 
-def handle_registration_message(message: Message) -> None:
-    """Обрабатывает текстовые сообщения во время регистрации"""
+def handle_registration_message(message: Message, state: dict = None) -> None:
+    """Обрабатывает текстовые сообщения во время регистрации (state - уже прочитанное состояние)"""
     telegram_id = str(message.from_user.id)
     
-    if telegram_id not in registration_states:
+    if state is None:
+        state = registration_states.get(telegram_id)
+    if state is None:
         return
     
-    state = registration_states[telegram_id]
-    
     if state['step'] == 'waiting_full_name':
         # Сохраняем ФИО и переходим к следующему шагу
         full_name = message.text.strip()
@@ -57,12 +59,14 @@ def handle_registration_message(message: Message) -> None:
             return
         
         try:
-            user = User.objects.get(telegram_id=telegram_id)
+            user = get_user_context(telegram_id).user
             user.full_name = full_name
-            user.save()
+            # Пользователь мог быть взят из кэша контекста: пишем только изменённое поле
+            user.save(update_fields=['full_name'])
             
             # Переходим к выбору класса
             state['step'] = 'waiting_class'
+            registration_states[telegram_id] = state
             bot.send_message(message.chat.id, REGISTRATION_CLASS, reply_markup=school_classes_markup)
         except Exception as e:
             bot.send_message(message.chat.id, "Произошла ошибка. Попробуйте еще раз.")
@@ -72,16 +76,15 @@ def handle_class_choice(call: CallbackQuery) -> None:
     """Обрабатывает выбор класса"""
     telegram_id = str(call.from_user.id)
     
-    if telegram_id not in registration_states:
+    state = registration_states.get(telegram_id)
+    if state is None:
         return
     
-    state = registration_states[telegram_id]
-    
     if state['step'] != 'waiting_class':
         return
     
     # Маппинг классов к тарифным планам и уровням
-    raw_value = call.data.replace('class_', '')
+    raw_value, = call.route_params
     education_level = None
     
     if raw_value == '10_base':
@@ -100,15 +103,17 @@ def handle_class_choice(call: CallbackQuery) -> None:
         class_number = raw_value
     
     try:
-        user = User.objects.get(telegram_id=telegram_id)
+        user = get_user_context(telegram_id).user
         user.class_number = class_number
         user.is_registered = True
-        user.save()
+        user.save(update_fields=['class_number', 'is_registered'])
         
         # Создаем первый профиль ученика
         with transaction.atomic():
             # Деактивируем все существующие профили
             user.student_profiles.update(is_active=False)
+            # Массовое обновление не вызывает сигналов: сбрасываем кэш активного профиля
+            transaction.on_commit(lambda: invalidate_user_context(telegram_id))
             
             # Создаем новый активный профиль
             profile = StudentProfile.objects.create(
@@ -4,8 +4,11 @@ from telebot.types import (
 )
 from datetime import datetime, timedelta
 from calendar import month_name
+from functools import lru_cache, wraps
 import locale
 
+from bot.paid_months import month_window
+
 # Установим русскую локаль для названий месяцев
 try:
     locale.setlocale(locale.LC_TIME, 'ru_RU.UTF-8')
@@ -16,11 +19,52 @@ except:
         pass  # Если не удается установить русскую локаль
 
 
+# Число клавиатур с параметрами (ID профиля, ученика, месяц), хранимых готовыми
+KEYBOARD_CACHE_SIZE = 256
+
+
+class FrozenKeyboard(InlineKeyboardMarkup):
+    """
+    Неизменяемая inline-клавиатура: кнопки фиксируются при создании,
+    JSON для Telegram сериализуется один раз.
+    """
+
+    def __init__(self, markup):
+        super().__init__(row_width=markup.row_width)
+        self.keyboard = tuple(tuple(row) for row in markup.keyboard)
+        self._json = super().to_json()
+
+    def add(self, *args, **kwargs):
+        raise TypeError("FrozenKeyboard is immutable")
+
+    row = add
+
+    def to_json(self):
+        return self._json
+
+
+def cached_keyboard(maxsize=None):
+    """
+    Кэширует клавиатуру, собранную функцией, как FrozenKeyboard.
+
+    Клавиатуры без параметров собираются один раз, с параметрами -
+    хранятся в LRU по значениям аргументов.
+    """
+    def decorator(builder):
+        @lru_cache(maxsize=maxsize)
+        @wraps(builder)
+        def cached(*args, **kwargs):
+            return FrozenKeyboard(builder(*args, **kwargs))
+        return cached
+    return decorator
+
+
 main_markup = InlineKeyboardMarkup()
 btn1 = InlineKeyboardButton("👥 Мои профили", callback_data="profiles_menu")
 btn2 = InlineKeyboardButton("💳 Оплатить занятия", callback_data="start_payment")
 btn3 = InlineKeyboardButton("📊 История платежей", callback_data="payment_history")
 main_markup.add(btn1).add(btn2).add(btn3)
+main_markup = FrozenKeyboard(main_markup)
 
 
 # Клавиатура выбора класса
@@ -37,15 +81,19 @@ btn7 = InlineKeyboardButton("10 класс (Профиль)", callback_data="cla
 btn8 = InlineKeyboardButton("11 класс (База)", callback_data="class_11_base")
 btn9 = InlineKeyboardButton("11 класс (Профиль)", callback_data="class_11_profile")
 school_classes_markup.add(btn1, btn2, btn3).add(btn4, btn5).add(btn6, btn7).add(btn8, btn9)
+school_classes_markup = FrozenKeyboard(school_classes_markup)
 
 UNIVERSAL_BUTTONS = InlineKeyboardMarkup()
 btn1 = InlineKeyboardButton("⬅️ Назад ⬅️", callback_data="main_menu")
 UNIVERSAL_BUTTONS.add(btn1)
+UNIVERSAL_BUTTONS = FrozenKeyboard(UNIVERSAL_BUTTONS)
 
 ADMIN_MARKUP = InlineKeyboardMarkup()
 btn1 = InlineKeyboardButton("👥 Просмотр оплаты учеников", url="https://fundamentally116.store/bot/payment-info/")
 btn2 = InlineKeyboardButton("💵 Отметить оплату ученика", callback_data="mark_student_payment")
-ADMIN_MARKUP.add(btn1).add(btn2)
+btn3 = InlineKeyboardButton("🔍 Поиск ученика", callback_data="search_students")
+ADMIN_MARKUP.add(btn1).add(btn2).add(btn3)
+ADMIN_MARKUP = FrozenKeyboard(ADMIN_MARKUP)
 
 # Названия месяцев на русском языке (первые 3 буквы)
 MONTH_NAMES = {
@@ -54,35 +102,72 @@ MONTH_NAMES = {
     9: "Сен", 10: "Окт", 11: "Ноя", 12: "Дек"
 }
 
-def generate_students_pagination_keyboard(page=1, students_per_page=8):
+def month_button_text(month, year, paid=False):
+    """Подпись кнопки месяца; оплаченные месяцы отмечаются ✅"""
+    text = f"{MONTH_NAMES[month]} {year}"
+    if paid:
+        return f"✅ {text}"
+    return text
+
+
+@cached_keyboard(maxsize=KEYBOARD_CACHE_SIZE)
+def _build_months_keyboard(callback_prefix, back_text, back_callback, window, paid_mask):
+    markup = InlineKeyboardMarkup()
+    buttons = [
+        InlineKeyboardButton(
+            month_button_text(month, year, paid_mask >> i & 1),
+            callback_data=f"{callback_prefix}{month}_{year}"
+        )
+        for i, (month, year) in enumerate(window)
+    ]
+    
+    # Размещаем кнопки по 3 в ряд
+    for i in range(0, len(buttons), 3):
+        markup.add(*buttons[i:i+3])
+    
+    markup.add(InlineKeyboardButton(back_text, callback_data=back_callback))
+    return markup
+
+
+def months_keyboard(callback_prefix, back_text, back_callback, paid_months=None):
     """
-    Генерирует клавиатуру с пагинацией учеников
+    Клавиатура 12 месяцев начиная с текущего (по 3 в ряд) и кнопка назад.
+
+    Готовая клавиатура берется из кэша по окну месяцев и маске оплаченных
+    в нем месяцев, поэтому пользователи с одинаковыми оплатами получают
+    один и тот же объект.
+    """
+    window = month_window()
+    paid_mask = paid_months.window_mask(window) if paid_months is not None else 0
+    return _build_months_keyboard(callback_prefix, back_text, back_callback, window, paid_mask)
+
+def generate_students_pagination_keyboard(page=1, cursor=None, direction='n', students_per_page=8):
+    """
+    Генерирует клавиатуру с пагинацией учеников.
+
+    Страница выбирается по курсору (telegram_id соседней страницы), который
+    вместе с номером страницы передаётся в callback_data кнопок навигации.
     """
     markup = InlineKeyboardMarkup()
-    from bot.models import User
+    from bot.students import get_students_page
     
-    # Получаем всех учеников (не админов)
-    students = User.objects.filter(is_admin=False)
-    total_students = students.count()
-    total_pages = (total_students + students_per_page - 1) // students_per_page
-    
-    # Получаем учеников для текущей страницы
-    start_idx = (page - 1) * students_per_page
-    end_idx = start_idx + students_per_page
-    current_students = students[start_idx:end_idx]
+    # Получаем только учеников текущей страницы (и признаки соседних страниц)
+    current_students, has_prev, has_next = get_students_page(cursor, direction, students_per_page)
     
     # Добавляем кнопки с учениками
-    for student in current_students:
-        button_text = student.full_name or f"ID: {student.telegram_id}"
-        callback_data = f"select_student_{student.telegram_id}"
+    for telegram_id, full_name in current_students:
+        button_text = full_name or f"ID: {telegram_id}"
+        callback_data = f"select_student_{telegram_id}"
         markup.add(InlineKeyboardButton(button_text, callback_data=callback_data))
     
     # Добавляем кнопки навигации
     nav_buttons = []
-    if page > 1:
-        nav_buttons.append(InlineKeyboardButton("⬅️", callback_data=f"students_page_{page-1}"))
-    if page < total_pages:
-        nav_buttons.append(InlineKeyboardButton("➡️", callback_data=f"students_page_{page+1}"))
+    if has_prev and current_students:
+        first_id = current_students[0][0]
+        nav_buttons.append(InlineKeyboardButton("⬅️", callback_data=f"students_page_{max(page - 1, 1)}_p_{first_id}"))
+    if has_next and current_students:
+        last_id = current_students[-1][0]
+        nav_buttons.append(InlineKeyboardButton("➡️", callback_data=f"students_page_{page + 1}_n_{last_id}"))
     if nav_buttons:
         markup.add(*nav_buttons)
     
@@ -91,6 +176,7 @@ def generate_students_pagination_keyboard(page=1, students_per_page=8):
     
     return markup
 
+@cached_keyboard(maxsize=KEYBOARD_CACHE_SIZE)
 def generate_admin_payment_method_keyboard(student_id):
     """
     Генерирует клавиатуру выбора способа оплаты для админа
@@ -110,47 +196,40 @@ def generate_admin_payment_method_keyboard(student_id):
     
     return markup
 
-def generate_admin_payment_months_keyboard(student_id):
+def generate_student_search_results_keyboard(students):
     """
-    Генерирует клавиатуру с месяцами для админской отметки оплаты
+    Генерирует клавиатуру с результатами поиска учеников
     """
     markup = InlineKeyboardMarkup()
     
+    for telegram_id, full_name in students:
+        button_text = full_name or f"ID: {telegram_id}"
+        markup.add(InlineKeyboardButton(button_text, callback_data=f"select_student_{telegram_id}"))
+    
+    markup.add(InlineKeyboardButton("⬅️ Назад", callback_data="admin_menu"))
+    
+    return markup
+
+def generate_admin_payment_months_keyboard(student_id, paid_months=None):
+    """
+    Генерирует клавиатуру с месяцами для админской отметки оплаты
+    (оплаченные месяцы из paid_months отмечаются ✅)
+    """
     # Проверяем, что student_id не пустой и не является служебным словом
     if not student_id or str(student_id).strip() in ['student', 'admin', 'user']:
-        return markup
+        return InlineKeyboardMarkup()
     
     # Очищаем student_id от пробелов
     student_id = str(student_id).strip()
     
-    current_date = datetime.now()
-    current_month = current_date.month
-    current_year = current_date.year
-    
-    buttons = []
-    
-    # Генерируем 12 месяцев начиная с текущего
-    for i in range(12):
-        month = ((current_month - 1 + i) % 12) + 1
-        year = current_year + ((current_month + i - 1) // 12)
-        
-        month_name = MONTH_NAMES[month]
-        button_text = f"{month_name} {year}"
-        callback_data = f"admin_mark_payment_{student_id}_{month}_{year}"
-        
-        buttons.append(InlineKeyboardButton(button_text, callback_data=callback_data))
-    
-    # Размещаем кнопки по 3 в ряд
-    for i in range(0, len(buttons), 3):
-        row_buttons = buttons[i:i+3]
-        markup.add(*row_buttons)
-    
-    # Кнопка назад к списку учеников
-    back_btn = InlineKeyboardButton("⬅️ Назад к списку учеников", callback_data="mark_student_payment")
-    markup.add(back_btn)
-    
-    return markup
+    return months_keyboard(
+        f"admin_mark_payment_{student_id}_",
+        "⬅️ Назад к списку учеников",
+        "mark_student_payment",
+        paid_months
+    )
 
+@cached_keyboard()
 def generate_payment_method_keyboard():
     """Генерирует клавиатуру выбора способа оплаты"""
     markup = InlineKeyboardMarkup()
@@ -163,6 +242,7 @@ def generate_payment_method_keyboard():
     
     return markup
 
+@cached_keyboard()
 def generate_payment_menu_keyboard():
     """Генерирует клавиатуру меню оплаты"""
     markup = InlineKeyboardMarkup()
@@ -175,74 +255,23 @@ def generate_payment_menu_keyboard():
     
     return markup
 
-def generate_balance_payment_months_keyboard():
+def generate_balance_payment_months_keyboard(paid_months=None):
     """
     Генерирует клавиатуру с месяцами для оплаты с баланса
-    Логика: показываем 12 месяцев начиная с текущего месяца.
+    Логика: показываем 12 месяцев начиная с текущего месяца,
+    оплаченные месяцы из paid_months отмечаются ✅.
     """
-    markup = InlineKeyboardMarkup()
-    current_date = datetime.now()
-    current_month = current_date.month
-    current_year = current_date.year
-    
-    buttons = []
-    
-    # Генерируем 12 месяцев начиная с текущего
-    for i in range(12):
-        month = ((current_month - 1 + i) % 12) + 1
-        year = current_year + ((current_month + i - 1) // 12)
-        
-        month_name = MONTH_NAMES[month]
-        button_text = f"{month_name} {year}"
-        callback_data = f"pay_balance_month_{month}_{year}"
-        
-        buttons.append(InlineKeyboardButton(button_text, callback_data=callback_data))
-    
-    # Размещаем кнопки по 3 в ряд
-    for i in range(0, len(buttons), 3):
-        row_buttons = buttons[i:i+3]
-        markup.add(*row_buttons)
-    
-    # Кнопка назад
-    back_btn = InlineKeyboardButton("⬅️ Назад", callback_data="start_payment")
-    markup.add(back_btn)
-    
-    return markup
+    return months_keyboard("pay_balance_month_", "⬅️ Назад", "start_payment", paid_months)
 
-def generate_payment_months_keyboard():
+def generate_payment_months_keyboard(paid_months=None):
     """
     Генерирует клавиатуру с 12 месяцами для выбора оплаты.
-    Логика: показываем 12 месяцев начиная с текущего месяца.
+    Логика: показываем 12 месяцев начиная с текущего месяца,
+    оплаченные месяцы из paid_months отмечаются ✅.
     """
-    markup = InlineKeyboardMarkup()
-    current_date = datetime.now()
-    current_month = current_date.month
-    current_year = current_date.year
-    
-    buttons = []
-    
-    # Генерируем 12 месяцев начиная с текущего
-    for i in range(12):
-        month = ((current_month - 1 + i) % 12) + 1
-        year = current_year + ((current_month + i - 1) // 12)
-        
-        month_name = MONTH_NAMES[month]
-        button_text = f"{month_name} {year}"
-        callback_data = f"pay_month_{month}_{year}"
-        
-        buttons.append(InlineKeyboardButton(button_text, callback_data=callback_data))
-    
-    # Размещаем кнопки по 3 в ряд
-    for i in range(0, len(buttons), 3):
-        row_buttons = buttons[i:i+3]
-        markup.add(*row_buttons)
-    
-    # Кнопка назад
-    back_btn = InlineKeyboardButton("⬅️ Назад", callback_data="payment_menu")
-    markup.add(back_btn)
-    
-    return markup
+    return months_keyboard("pay_month_", "⬅️ Назад", "payment_menu", paid_months)
 
+@cached_keyboard(maxsize=KEYBOARD_CACHE_SIZE)
 def generate_payment_confirmation_keyboard(month, year):
     """Генерирует клавиатуру подтверждения оплаты"""
     markup = InlineKeyboardMarkup()
@@ -271,6 +300,7 @@ def generate_check_payment_keyboard(payment_url, payment_id, month, year):
     
     return markup
 
+@cached_keyboard(maxsize=KEYBOARD_CACHE_SIZE)
 def generate_student_info_keyboard(student_id):
     """
     Генерирует клавиатуру с информацией об ученике и его оплатах
@@ -297,6 +327,7 @@ def generate_student_info_keyboard(student_id):
     
     return markup
 
+@cached_keyboard(maxsize=KEYBOARD_CACHE_SIZE)
 def generate_payment_history_keyboard(student_id):
     """
     Генерирует клавиатуру для просмотра истории оплат ученика
@@ -319,6 +350,7 @@ def generate_payment_history_keyboard(student_id):
 
 
 # Клавиатуры для управления профилями
+@cached_keyboard()
 def generate_profiles_menu_keyboard():
     """Генерирует клавиатуру меню профилей"""
     markup = InlineKeyboardMarkup()
@@ -352,6 +384,7 @@ def generate_profiles_list_keyboard(profiles):
     return markup
 
 
+@cached_keyboard(maxsize=KEYBOARD_CACHE_SIZE)
 def generate_profile_management_keyboard(profile_id):
     """Генерирует клавиатуру управления конкретным профилем"""
     markup = InlineKeyboardMarkup()
@@ -370,6 +403,7 @@ def generate_profile_management_keyboard(profile_id):
     return markup
 
 
+@cached_keyboard(maxsize=KEYBOARD_CACHE_SIZE)
 def generate_profile_data_management_keyboard(profile_id):
     """Генерирует клавиатуру управления данными профиля"""
     markup = InlineKeyboardMarkup()
@@ -388,6 +422,7 @@ def generate_profile_data_management_keyboard(profile_id):
     return markup
 
 
+@cached_keyboard()
 def generate_profile_school_classes_keyboard():
     """Генерирует клавиатуру классов для профиля"""
     markup = InlineKeyboardMarkup()
@@ -408,6 +443,7 @@ def generate_profile_school_classes_keyboard():
     return markup
 
 
+@cached_keyboard()
 def generate_profile_confirmation_keyboard():
     """Генерирует клавиатуру подтверждения создания профиля"""
     markup = InlineKeyboardMarkup()
@@ -420,6 +456,7 @@ def generate_profile_confirmation_keyboard():
     return markup
 
 
+@cached_keyboard(maxsize=KEYBOARD_CACHE_SIZE)
 def generate_profile_deletion_confirmation_keyboard(profile_id):
     """Генерирует клавиатуру первого подтверждения удаления профиля"""
     markup = InlineKeyboardMarkup()
@@ -432,6 +469,7 @@ def generate_profile_deletion_confirmation_keyboard(profile_id):
     return markup
 
 
+@cached_keyboard(maxsize=KEYBOARD_CACHE_SIZE)
 def generate_profile_deletion_final_confirmation_keyboard(profile_id):
     """Генерирует клавиатуру финального подтверждения удаления профиля"""
     markup = InlineKeyboardMarkup()
@@ -0,0 +1,125 @@
+"""Баланс профилей: атомарные списания и зачисления с журналом операций"""
+import logging
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from bot.context import invalidate_user_context
+from bot.models import BalanceTransaction, StudentProfile
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientFunds(Exception):
+    """На балансе профиля недостаточно средств"""
+
+
+def _record(profile_id, kind, amount, month=None, year=None, description=''):
+    """Пишет операцию в журнал. Вызывается в транзакции после изменения баланса"""
+    user_id, balance = StudentProfile.objects.filter(pk=profile_id).values_list('user_id', 'balance').get()
+
+    # Первая операция профиля: фиксируем остаток, накопленный до журнала
+    if not BalanceTransaction.objects.filter(student_profile_id=profile_id).exists():
+        opening = balance - amount
+        BalanceTransaction.objects.create(
+            student_profile_id=profile_id,
+            kind='opening',
+            amount=opening,
+            balance_after=opening
+        )
+
+    BalanceTransaction.objects.create(
+        student_profile_id=profile_id,
+        kind=kind,
+        amount=amount,
+        balance_after=balance,
+        month=month,
+        year=year,
+        description=description[:200]
+    )
+    transaction.on_commit(lambda: invalidate_user_context(user_id))
+    return balance
+
+
+def debit(profile_id, amount, kind='month_payment', month=None, year=None, description=''):
+    """
+    Списывает сумму с баланса профиля.
+
+    Проверка остатка и списание выполняются одним условным UPDATE
+    (balance >= amount), поэтому параллельные нажатия не уводят баланс
+    в минус. Вызывать внутри transaction.atomic вместе с действием,
+    за которое списываются деньги.
+
+    Raises:
+        InsufficientFunds: средств недостаточно
+
+    Returns:
+        Decimal: баланс после списания
+    """
+    amount = Decimal(amount)
+    with transaction.atomic():
+        updated = StudentProfile.objects.filter(pk=profile_id, balance__gte=amount).update(
+            balance=F('balance') - amount
+        )
+        if not updated:
+            raise InsufficientFunds(profile_id)
+        return _record(profile_id, kind, -amount, month, year, description)
+
+
+def credit(profile_id, amount, kind='top_up', description=''):
+    """Зачисляет сумму на баланс профиля. Возвращает баланс после зачисления"""
+    amount = Decimal(amount)
+    with transaction.atomic():
+        StudentProfile.objects.filter(pk=profile_id).update(balance=F('balance') + amount)
+        return _record(profile_id, kind, amount, description=description)
+
+
+def set_balance(profile_id, balance, description=''):
+    """
+    Устанавливает баланс профиля (ручная корректировка) с записью разницы в журнал.
+
+    Returns:
+        Decimal: баланс после корректировки
+    """
+    balance = Decimal(balance)
+    with transaction.atomic():
+        current = StudentProfile.objects.select_for_update().values_list('balance', flat=True).get(pk=profile_id)
+        if balance == current:
+            return current
+        StudentProfile.objects.filter(pk=profile_id).update(balance=balance)
+        return _record(profile_id, 'adjustment', balance - current, description=description)
+
+
+def get_running_balance(profile_id):
+    """Баланс профиля по журналу операций (сумма всех записей)"""
+    total = BalanceTransaction.objects.filter(student_profile_id=profile_id).aggregate(total=Sum('amount'))['total']
+    return total if total is not None else Decimal('0')
+
+
+def recompute_balance(profile_id, fix=False):
+    """
+    Сверяет баланс профиля с журналом.
+
+    Расхождение (баланс изменен в обход журнала) записывается в лог;
+    баланс заменяется значением по журналу только при fix=True.
+    Профиль без операций в журнале не проверяется.
+
+    Returns:
+        tuple: (баланс профиля, баланс по журналу)
+    """
+    with transaction.atomic():
+        profile = StudentProfile.objects.select_for_update().only('balance', 'user_id').get(pk=profile_id)
+        if not BalanceTransaction.objects.filter(student_profile_id=profile_id).exists():
+            return profile.balance, profile.balance
+
+        running = get_running_balance(profile_id)
+        if running != profile.balance:
+            logger.warning(
+                "Баланс профиля расходится с журналом",
+                extra={'profile_id': profile_id, 'balance': str(profile.balance), 'running': str(running)}
+            )
+            if fix:
+                StudentProfile.objects.filter(pk=profile_id).update(balance=running)
+                transaction.on_commit(lambda: invalidate_user_context(profile.user_id))
+        return profile.balance, running
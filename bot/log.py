@@ -0,0 +1,148 @@
+"""Журналирование: JSON-формат, запись в файл из фонового потока, выборка и маскирование"""
+import itertools
+import json
+import logging
+import os
+import queue
+import re
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+
+# Стандартные атрибуты LogRecord; остальные поля записи попадают в JSON как extra
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sample'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON с полями extra"""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RedactingFilter(logging.Filter):
+    """
+    Маскирует секреты и персональные данные в тексте и полях записи:
+    токены ботов, ключи ЮKassa, телефоны, email и имена из JSON обновлений Telegram.
+    """
+
+    PATTERNS = [
+        # Токен бота (в том числе в URL webhook)
+        (re.compile(r'\b\d{6,12}:[A-Za-z0-9_-]{30,}\b'), '[TOKEN]'),
+        # Значения ключей, паролей и токенов в виде key=value / "key": "value"
+        (re.compile(r'(?i)((?:secret_key|password|token|authorization)["\']?\s*[:=]\s*["\']?)[^\s"\',&]+'), r'\1[REDACTED]'),
+        # Персональные поля JSON (обновления Telegram, данные регистрации)
+        (re.compile(r'("(?:first_name|last_name|username|full_name|phone_number|email)"\s*:\s*)"[^"]*"'), r'\1"[PII]"'),
+        (re.compile(r"('(?:first_name|last_name|username|full_name|phone_number|email)'\s*:\s*)'[^']*'"), r"\1'[PII]'"),
+        (re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+'), '[EMAIL]'),
+        (re.compile(r'(?<![\w:])\+?[78][\s(-]*\d{3}[\s)-]*\d{3}[\s-]*\d{2}[\s-]*\d{2}(?!\d)'), '[PHONE]'),
+    ]
+
+    def redact(self, text):
+        for pattern, replacement in self.PATTERNS:
+            text = pattern.sub(replacement, text)
+        return text
+
+    def filter(self, record):
+        record.msg = self.redact(record.getMessage())
+        record.args = None
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and isinstance(value, str):
+                setattr(record, key, self.redact(value))
+        if record.exc_text:
+            record.exc_text = self.redact(record.exc_text)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает в журнал каждую N-ю запись частого события (N = 1 / rate).
+
+    Выборка применяется только к записям с extra={'sample': 'имя события'},
+    остальные записи проходят без изменений.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.every = 0 if rate <= 0 else max(1, round(1 / rate))
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        event = getattr(record, 'sample', None)
+        if event is None or self.every == 1:
+            return True
+        if self.every == 0:
+            return False
+        counter = self._counters.get(event)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(event, itertools.count())
+        return next(counter) % self.every == 0
+
+
+class QueueFileHandler(QueueHandler):
+    """
+    Неблокирующая запись в файл.
+
+    Поток, вызвавший логгер, только кладёт запись в ограниченную очередь;
+    маскирование, форматирование и запись на диск выполняет фоновый
+    QueueListener. При переполнении очереди записи отбрасываются.
+
+    В один файл пишут все процессы веб-сервера (дозапись строк), поэтому
+    ротация внешняя (logrotate): WatchedFileHandler переоткрывает файл
+    после его переименования.
+    """
+
+    def __init__(self, filename, queue_size=10000):
+        super().__init__(queue.Queue(queue_size))
+        self.dropped = 0
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        self.target = WatchedFileHandler(filename, encoding='utf-8', delay=True)
+        self.target.setFormatter(JsonFormatter())
+        self.target.addFilter(RedactingFilter())
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def setFormatter(self, fmt):
+        # Форматирует фоновый обработчик, а не вызывающий поток
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Фиксируем текст сообщения и трассировку сейчас: аргументы могут измениться
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        self.target.close()
+        super().close()
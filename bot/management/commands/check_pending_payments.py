@@ -1,12 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+import json
+import time
+import uuid
+
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from bot.models import Payment, PaymentHistory
-from bot.handlers.payments import notify_payment_success
-from bot.yookassa_client import YooKassaClient
+from django.db.models import Q
+from django.utils import timezone
+from bot.models import Payment
+from bot.payment_state import APPLIED, apply_payment_status
+from bot.outbox import drain_all
+from bot.yookassa_client import get_client
 import logging
 
 logger = logging.getLogger('bot')
 
+PENDING_STATUSES = ['pending', 'waiting_for_capture']
+
 
 class Command(BaseCommand):
     help = 'Проверяет статус всех незавершенных платежей у ЮKassa и обновляет базу данных'
@@ -17,145 +28,249 @@ class Command(BaseCommand):
             action='store_true',
             help='Показать что будет сделано без выполнения изменений',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Максимум одновременных запросов к ЮKassa',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=20,
+            help='Количество платежей, обновляемых в одной транзакции',
+        )
+        parser.add_argument(
+            '--lease',
+            type=int,
+            default=600,
+            help='Время блокировки платежей этим запуском, сек (параллельные запуски их пропускают)',
+        )
 
-    def handle(self, *args, **options):
-        dry_run = options['dry_run']
-
-        if dry_run:
-            self.stdout.write(
-                self.style.WARNING('🔍 РЕЖИМ ПРЕДВАРИТЕЛЬНОГО ПРОСМОТРА - изменения не будут сохранены')
-            )
+    def claim_payments(self, run_id, lease):
+        """
+        Блокирует незавершенные платежи за этим запуском условным UPDATE.
 
-        # Находим все незавершенные платежи
-        pending_payments = Payment.objects.filter(
-            status__in=['pending', 'waiting_for_capture']
-        ).select_related('user', 'student_profile')
+        Платежи, заблокированные другим запуском с неистекшей арендой, пропускаются.
 
-        if not pending_payments.exists():
-            self.stdout.write(
-                self.style.SUCCESS('✅ Нет незавершенных платежей для проверки')
-            )
-            return
+        Returns:
+            tuple: (заблокированные платежи, количество пропущенных)
+        """
+        now = timezone.now()
+        pending = Payment.objects.filter(status__in=PENDING_STATUSES)
+        free = Q(reconcile_locked_until__isnull=True) | Q(reconcile_locked_until__lt=now)
+        total = pending.count()
+        pending.filter(free).update(
+            reconcile_locked_until=now + timedelta(seconds=lease),
+            reconcile_owner=run_id
+        )
+        claimed = list(
+            pending.filter(reconcile_owner=run_id).select_related('user', 'student_profile')
+        )
+        return claimed, total - len(claimed)
 
-        self.stdout.write(
-            self.style.WARNING(f'📋 Найдено {pending_payments.count()} незавершенных платежей')
+    def release_payments(self, run_id):
+        Payment.objects.filter(reconcile_owner=run_id).update(
+            reconcile_locked_until=None,
+            reconcile_owner=''
         )
 
-        # Инициализируем клиент ЮKassa
+    def fetch_status(self, client, payment):
+        """Запрашивает платеж у ЮKassa (выполняется в пуле потоков, без обращений к БД)"""
+        started = time.perf_counter()
         try:
-            client = YooKassaClient()
+            return payment, client.get_payment(payment.yookassa_payment_id), None, time.perf_counter() - started
         except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(f'❌ Ошибка инициализации клиента ЮKassa: {e}')
-            )
-            return
+            return payment, None, e, time.perf_counter() - started
 
-        updated_count = 0
-        succeeded_count = 0
-        canceled_count = 0
-        error_count = 0
-
-        for payment in pending_payments:
-            try:
-                self.stdout.write(f'\n🔍 Проверяем платеж {payment.yookassa_payment_id}...')
+    def apply_status(self, payment, payment_info, dry_run, stats, notify):
+        """Применяет статус из ЮKassa к платежу (внутри транзакции пакета)"""
+        current_status = payment_info.get('status')
+        self.stdout.write(f'  📊 {payment.yookassa_payment_id}: текущий статус в ЮKassa: {current_status}')
 
-                # Получаем актуальный статус от ЮKassa
-                payment_info = client.get_payment(payment.yookassa_payment_id)
+        if current_status == 'succeeded' and payment.status != 'succeeded':
+            self.stdout.write(
+                self.style.SUCCESS(f'  ✅ Платеж {payment.yookassa_payment_id} успешно оплачен!')
+            )
 
-                if not payment_info:
-                    self.stdout.write(
-                        self.style.ERROR(f'  ❌ Не удалось получить информацию о платеже {payment.yookassa_payment_id}')
-                    )
-                    error_count += 1
-                    continue
+            if not dry_run:
+                # Статус, история оплат и уведомления - под блокировкой строки платежа
+                transition = apply_payment_status(
+                    payment.yookassa_payment_id,
+                    'succeeded',
+                    payment_method=payment_info.get('payment_method'),
+                    source='reconcile'
+                )
+                if transition.outcome != APPLIED:
+                    self.stdout.write(f'     ℹ️ Статус уже применен другим обработчиком ({transition.outcome})')
+                    return
+                notify.append(payment.yookassa_payment_id)
 
-                current_status = payment_info.get('status')
-                self.stdout.write(f'  📊 Текущий статус в ЮKassa: {current_status}')
+            stats['updated'] += 1
+            stats['succeeded'] += 1
 
-                if current_status == 'succeeded' and payment.status != 'succeeded':
-                    self.stdout.write(
-                        self.style.SUCCESS(f'  ✅ Платеж {payment.yookassa_payment_id} успешно оплачен!')
-                    )
+        elif current_status == 'canceled' and payment.status != 'canceled':
+            self.stdout.write(
+                self.style.WARNING(f'  ❌ Платеж {payment.yookassa_payment_id} был отменен')
+            )
 
-                    if not dry_run:
-                        with transaction.atomic():
-                            # Обновляем статус платежа
-                            payment.status = 'succeeded'
-                            payment.payment_method = payment_info.get('payment_method', {})
-                            payment.save()
-
-                            # Создаем запись в истории платежей, если её нет
-                            if not PaymentHistory.objects.filter(
-                                user=payment.user,
-                                payment=payment,
-                                month=payment.payment_month,
-                                year=payment.payment_year
-                            ).exists():
-                                PaymentHistory.objects.create(
-                                    user=payment.user,
-                                    student_profile=payment.student_profile,
-                                    payment=payment,
-                                    month=payment.payment_month,
-                                    year=payment.payment_year,
-                                    amount_paid=payment.amount,
-                                    pricing_plan=payment.pricing_plan,
-                                    payment_type='card',
-                                    status='completed'
-                                )
-
-                                # Отправляем уведомления
-                                try:
-                                    notify_payment_success(payment.yookassa_payment_id)
-                                    self.stdout.write('     📨 Уведомления отправлены')
-                                except Exception as e:
-                                    self.stdout.write(
-                                        self.style.WARNING(f'     ⚠️ Ошибка отправки уведомлений: {e}')
-                                    )
-                            else:
-                                self.stdout.write('     ℹ️ Запись в истории платежей уже существует')
-
-                    updated_count += 1
-                    succeeded_count += 1
-
-                elif current_status == 'canceled' and payment.status != 'canceled':
-                    self.stdout.write(
-                        self.style.WARNING(f'  ❌ Платеж {payment.yookassa_payment_id} был отменен')
-                    )
+            if not dry_run:
+                transition = apply_payment_status(payment.yookassa_payment_id, 'canceled', source='reconcile')
+                if transition.outcome != APPLIED:
+                    self.stdout.write(f'     ℹ️ Статус уже применен другим обработчиком ({transition.outcome})')
+                    return
 
-                    if not dry_run:
-                        payment.status = 'canceled'
-                        payment.save()
+            stats['updated'] += 1
+            stats['canceled'] += 1
 
-                    updated_count += 1
-                    canceled_count += 1
+        elif current_status in PENDING_STATUSES:
+            self.stdout.write(f'  ⏳ Платеж {payment.yookassa_payment_id} еще в обработке')
+            stats['still_pending'] += 1
 
-                elif current_status in ['pending', 'waiting_for_capture']:
-                    self.stdout.write(f'  ⏳ Платеж {payment.yookassa_payment_id} еще в обработке')
+        else:
+            self.stdout.write(
+                self.style.WARNING(f'  ❓ Неизвестный статус платежа: {current_status}')
+            )
+            stats['unknown'] += 1
 
-                else:
+    def apply_batch(self, batch, dry_run, stats):
+        notify = []
+        with transaction.atomic():
+            for payment, payment_info in batch:
+                try:
+                    with transaction.atomic():
+                        self.apply_status(payment, payment_info, dry_run, stats, notify)
+                except Exception as e:
                     self.stdout.write(
-                        self.style.WARNING(f'  ❓ Неизвестный статус платежа: {current_status}')
+                        self.style.ERROR(f'  ❌ Ошибка при обновлении платежа {payment.yookassa_payment_id}: {e}')
                     )
+                    stats['errors'] += 1
 
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'  ❌ Ошибка при проверке платежа {payment.yookassa_payment_id}: {e}')
-                )
-                error_count += 1
+        if notify:
+            self.stdout.write(f'     📨 Уведомления по {len(notify)} платежам поставлены в очередь')
+        batch.clear()
 
-        # Выводим итоговую статистику
-        self.stdout.write('\n' + '='*50)
-        self.stdout.write(self.style.SUCCESS('📊 РЕЗУЛЬТАТЫ ПРОВЕРКИ:'))
-        self.stdout.write(f'  🔄 Обновлено платежей: {updated_count}')
-        self.stdout.write(f'  ✅ Успешно оплаченных: {succeeded_count}')
-        self.stdout.write(f'  ❌ Отмененных: {canceled_count}')
-        self.stdout.write(f'  ⚠️ Ошибок: {error_count}')
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        workers = max(1, options['workers'])
+        batch_size = max(1, options['batch_size'])
+        run_id = uuid.uuid4().hex
+        started = time.perf_counter()
+
+        stats = {
+            'updated': 0,
+            'succeeded': 0,
+            'canceled': 0,
+            'still_pending': 0,
+            'unknown': 0,
+            'errors': 0,
+        }
+        fetch_times = []
+        summary = {
+            'run_id': run_id,
+            'dry_run': dry_run,
+            'workers': workers,
+            'claimed': 0,
+            'skipped_locked': 0,
+        }
 
         if dry_run:
             self.stdout.write(
-                self.style.WARNING('\n🔍 Это был предварительный просмотр. Запустите без --dry-run для применения изменений.')
+                self.style.WARNING('🔍 РЕЖИМ ПРЕДВАРИТЕЛЬНОГО ПРОСМОТРА - изменения не будут сохранены')
+            )
+
+        # Находим и блокируем незавершенные платежи (в режиме просмотра - без блокировки)
+        if dry_run:
+            pending_payments = list(
+                Payment.objects.filter(status__in=PENDING_STATUSES).select_related('user', 'student_profile')
             )
+            skipped = 0
         else:
+            pending_payments, skipped = self.claim_payments(run_id, options['lease'])
+        summary['claimed'] = len(pending_payments)
+        summary['skipped_locked'] = skipped
+
+        try:
+            if not pending_payments:
+                self.stdout.write(
+                    self.style.SUCCESS('✅ Нет незавершенных платежей для проверки')
+                )
+                return
+
             self.stdout.write(
-                self.style.SUCCESS('\n✅ Проверка завершена успешно!')
+                self.style.WARNING(
+                    f'📋 Найдено {len(pending_payments)} незавершенных платежей'
+                    + (f' (заблокировано другим запуском: {skipped})' if skipped else '')
+                )
             )
+
+            # Инициализируем клиент ЮKassa
+            try:
+                client = get_client()
+            except Exception as e:
+                self.stdout.write(
+                    self.style.ERROR(f'❌ Ошибка инициализации клиента ЮKassa: {e}')
+                )
+                stats['errors'] += len(pending_payments)
+                return
+
+            # Запросы к ЮKassa выполняются параллельно, обновления БД - пакетами в основном потоке
+            batch = []
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reconcile') as executor:
+                futures = [executor.submit(self.fetch_status, client, payment) for payment in pending_payments]
+                for future in as_completed(futures):
+                    payment, payment_info, error, elapsed = future.result()
+                    fetch_times.append(elapsed)
+
+                    if error is not None or not payment_info:
+                        self.stdout.write(
+                            self.style.ERROR(
+                                f'  ❌ Не удалось получить информацию о платеже {payment.yookassa_payment_id}'
+                                + (f': {error}' if error is not None else '')
+                            )
+                        )
+                        stats['errors'] += 1
+                        continue
+
+                    batch.append((payment, payment_info))
+                    if len(batch) >= batch_size:
+                        self.apply_batch(batch, dry_run, stats)
+
+            if batch:
+                self.apply_batch(batch, dry_run, stats)
+
+            if not dry_run and stats['succeeded']:
+                # Команда завершается сразу, поэтому очередь отправляется здесь
+                summary['notifications'] = drain_all()
+
+        finally:
+            if not dry_run:
+                self.release_payments(run_id)
+
+            # Выводим итоговую статистику
+            self.stdout.write('\n' + '='*50)
+            self.stdout.write(self.style.SUCCESS('📊 РЕЗУЛЬТАТЫ ПРОВЕРКИ:'))
+            self.stdout.write(f'  🔄 Обновлено платежей: {stats["updated"]}')
+            self.stdout.write(f'  ✅ Успешно оплаченных: {stats["succeeded"]}')
+            self.stdout.write(f'  ❌ Отмененных: {stats["canceled"]}')
+            self.stdout.write(f'  ⚠️ Ошибок: {stats["errors"]}')
+
+            if dry_run:
+                self.stdout.write(
+                    self.style.WARNING('\n🔍 Это был предварительный просмотр. Запустите без --dry-run для применения изменений.')
+                )
+            else:
+                self.stdout.write(
+                    self.style.SUCCESS('\n✅ Проверка завершена успешно!')
+                )
+
+            # Машиночитаемая сводка - последней строкой вывода
+            fetch_times.sort()
+            summary.update(stats)
+            summary['duration_seconds'] = round(time.perf_counter() - started, 3)
+            summary['fetch_seconds'] = {
+                'total': round(sum(fetch_times), 3),
+                'max': round(fetch_times[-1], 3) if fetch_times else 0.0,
+                'p95': round(fetch_times[min(len(fetch_times) - 1, int(len(fetch_times) * 0.95))], 3) if fetch_times else 0.0,
+            }
+            self.stdout.write(json.dumps(summary, ensure_ascii=False))
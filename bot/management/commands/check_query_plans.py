@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from bot.models import Payment, PaymentHistory
+
+
+class Command(BaseCommand):
+    help = 'Проверяет, что частые запросы к платежам используют индексы (EXPLAIN, SQLite и MySQL)'
+
+    def get_cases(self):
+        """Типовые запросы к платежам и индексы, которые они должны использовать"""
+        return [
+            (
+                'is_month_paid',
+                PaymentHistory.objects.filter(user_id='0', month=1, year=2025),
+                # Индекс уникального ключа unique_together (имя с хэшем и суффиксом _uniq)
+                ['bot_paymenthistory_user_id_month_year'],
+            ),
+            (
+                'is_month_paid (профиль)',
+                PaymentHistory.objects.filter(student_profile_id=0, month=1, year=2025),
+                ['bot_ph_profile_period_idx'],
+            ),
+            (
+                'история оплат пользователя',
+                PaymentHistory.objects.filter(user_id='0', status='completed').order_by('year', 'month'),
+                ['bot_ph_user_status_idx'],
+            ),
+            (
+                'незавершенные платежи',
+                Payment.objects.filter(status__in=['pending', 'waiting_for_capture']),
+                ['bot_pay_status_lock_idx'],
+            ),
+            (
+                'незавершенные платежи пользователя',
+                Payment.objects.filter(user_id='0', status__in=['pending', 'waiting_for_capture']),
+                ['bot_pay_user_status_idx'],
+            ),
+            (
+                'платежи за период',
+                Payment.objects.filter(payment_year=2025, payment_month=1),
+                ['bot_pay_period_idx'],
+            ),
+        ]
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'mysql'):
+            raise CommandError(f'Проверка планов поддерживает SQLite и MySQL, а не {connection.vendor}')
+
+        failed = []
+        for name, queryset, indexes in self.get_cases():
+            plan = queryset.explain()
+            used = next((index for index in indexes if index in plan), None)
+            if used:
+                self.stdout.write(self.style.SUCCESS(f'✅ {name}: {used}'))
+            else:
+                self.stdout.write(self.style.ERROR(f'❌ {name}: индекс не используется\n{plan}'))
+                failed.append(name)
+
+        if failed:
+            raise CommandError(f'Запросы без индекса: {", ".join(failed)}')
@@ -0,0 +1,37 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from bot.outbox import drain_all
+
+
+class Command(BaseCommand):
+    help = 'Отправляет очередь уведомлений (NotificationOutbox). С --loop работает постоянно'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.OUTBOX_BATCH_SIZE,
+            help='Уведомлений в пакете отправки'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Не завершаться: опрашивать очередь раз в OUTBOX_POLL_INTERVAL секунд'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+
+        while True:
+            counts = drain_all(batch_size)
+            if counts['claimed']:
+                self.stdout.write(json.dumps(counts, ensure_ascii=False))
+            if not options['loop']:
+                break
+            time.sleep(settings.OUTBOX_POLL_INTERVAL)
+
+        if not options['loop'] and not counts['claimed']:
+            self.stdout.write(self.style.SUCCESS('✅ Очередь уведомлений пуста'))
@@ -1,9 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from datetime import datetime
-from bot.models import User, PaymentHistory
+from bot.broadcast import Broadcast, get_unpaid_recipients
 from bot.pricing import get_price_by_class
-from bot import bot
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,68 +9,58 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Отправляет напоминания об оплате за следующий месяц всем пользователям'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--campaign',
+            help='Идентификатор рассылки (повторный запуск с тем же идентификатором продолжает прерванную рассылку)'
+        )
+
     def handle(self, *args, **options):
         current_date = timezone.now()
-        current_month = current_date.month + 1
-        current_year = current_date.year
+        # Следующий месяц (с переходом через декабрь)
+        current_month = current_date.month % 12 + 1
+        current_year = current_date.year + (1 if current_date.month == 12 else 0)
+        campaign = options['campaign'] or f"monthly-{current_date:%Y-%m-%d}"
         
-        # Получаем всех зарегистрированных пользователей (не админов)
-        users = User.objects.filter(is_admin=False, is_registered=True)
+        def messages():
+            # Пользователи (не админы) без оплаты следующего месяца - одним запросом
+            for telegram_id, full_name, class_number in get_unpaid_recipients(current_month, current_year).iterator():
+                # Получаем цену для конкретного ученика
+                price_info = get_price_by_class(class_number)
+                
+                if price_info:
+                    price = price_info['price']
+                    class_name = price_info['name']
+                else:
+                    # Если не удалось определить цену, используем базовую
+                    price = 5000
+                    class_name = "стандартный тариф"
+                
+                yield telegram_id, (
+                    f"🔔 Напоминание об оплате\n\n"
+                    f"Здравствуйте, {full_name or 'дорогой ученик'}!\n\n"
+                    f"Напоминаем, что необходимо оплатить занятия за {str(current_month).rjust(2, '0')}.{current_year}.\n"
+                    f"Своевременная оплата обеспечивает непрерывность обучения.\n\n"
+                    f"📚 Тариф: {class_name}\n"
+                    f"💰 Сумма к оплате: {price} ₽\n\n"
+                    f"Для оплаты используйте кнопку '💰 Оплата 💰' в главном меню бота.\n\n"
+                    f"Спасибо за понимание! 📚"
+                )
         
-        reminder_count = 0
-        success_count = 0
+        def on_result(telegram_id, status, error):
+            if error:
+                logger.error(f"Ошибка при отправке напоминания пользователю {telegram_id}: {error}")
+                self.stdout.write(f"❌ Ошибка для пользователя {telegram_id}: {error}")
+            else:
+                self.stdout.write(f"✅ Напоминание отправлено пользователю {telegram_id}")
         
-        for user in users:
-            try:
-                # Проверяем, оплачен ли текущий месяц
-                is_paid = PaymentHistory.objects.filter(
-                    user=user,
-                    month=current_month,
-                    year=current_year,
-                    payment__status='succeeded'
-                ).exists()
-
-
-                if not is_paid:
-                    # Получаем цену для конкретного ученика
-                    price_info = get_price_by_class(user.course_or_class)
-                    
-                    if price_info:
-                        price = price_info['price']
-                        class_name = price_info['name']
-                    else:
-                        # Если не удалось определить цену, используем базовую
-                        price = 5000
-                        class_name = "стандартный тариф"
-                    
-                    # Отправляем напоминание
-                    message_text = (
-                        f"🔔 Напоминание об оплате\n\n"
-                        f"Здравствуйте, {user.full_name or 'дорогой ученик'}!\n\n"
-                        f"Напоминаем, что необходимо оплатить занятия за {str(current_month).rjust(2, '0')}.{current_year}.\n"
-                        f"Своевременная оплата обеспечивает непрерывность обучения.\n\n"
-                        f"📚 Тариф: {class_name}\n"
-                        f"💰 Сумма к оплате: {price} ₽\n\n"
-                        f"Для оплаты используйте кнопку '💰 Оплата 💰' в главном меню бота.\n\n"
-                        f"Спасибо за понимание! 📚"
-                    )
-                    
-                    bot.send_message(user.telegram_id, message_text)
-                    reminder_count += 1
-                    self.stdout.write(f"✅ Напоминание отправлено пользователю {user.telegram_id} (класс: {user.course_or_class}, цена: {price} ₽)")
-                    
-                else:
-                    self.stdout.write(f"ℹ️ Пользователь {user.telegram_id} уже оплатил следующий месяц")
-                    
-            except Exception as e:
-                logger.error(f"Ошибка при отправке напоминания пользователю {user.telegram_id}: {e}")
-                self.stdout.write(f"❌ Ошибка для пользователя {user.telegram_id}: {e}")
-                continue
+        counts = Broadcast(campaign).run(messages(), on_result=on_result)
         
         self.stdout.write(
             self.style.SUCCESS(
-                f'Напоминания об оплате отправлены! '
-                f'Отправлено: {reminder_count}, '
-                f'Успешно: {success_count}'
+                f'Напоминания об оплате отправлены ({campaign})! '
+                f'Отправлено: {counts["sent"]}, '
+                f'Ошибок: {counts["failed"]}, '
+                f'Пропущено (уже доставлено): {counts["skipped"]}'
             )
-        ) 
\ No newline at end of file
+        )
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from bot.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс учеников (ФИО и имена профилей)'
+
+    def handle(self, *args, **options):
+        total = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'✅ Поисковый индекс перестроен. Записей: {total}'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from bot import setup_bot
+
+
+class Command(BaseCommand):
+    help = 'Регистрирует команды бота в Telegram и проверяет токен (выполняется при деплое)'
+
+    def handle(self, *args, **options):
+        username = setup_bot()
+        self.stdout.write(self.style.SUCCESS(f'✅ Команды бота @{username} зарегистрированы'))
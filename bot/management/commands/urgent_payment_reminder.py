@@ -1,9 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from datetime import datetime
-from bot.models import User, PaymentHistory
+from bot.broadcast import Broadcast, get_unpaid_recipients
 from bot.pricing import get_price_by_class
-from bot import bot
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,69 +9,59 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Отправляет срочные напоминания об оплате за текущий месяц всем пользователям'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--campaign',
+            help='Идентификатор рассылки (повторный запуск с тем же идентификатором продолжает прерванную рассылку)'
+        )
+
     def handle(self, *args, **options):
         current_date = timezone.now()
         current_month = current_date.month
         current_year = current_date.year
+        campaign = options['campaign'] or f"urgent-{current_date:%Y-%m-%d}"
         
-        # Получаем всех зарегистрированных пользователей (не админов)
-        users = User.objects.filter(is_admin=False, is_registered=True)
-        
-        reminder_count = 0
-        success_count = 0
-        
-        for user in users:
-            try:
-                # Проверяем, оплачен ли текущий месяц
-                is_paid = PaymentHistory.objects.filter(
-                    user=user,
-                    month=current_month,
-                    year=current_year,
-                    payment__status='succeeded'
-                ).exists()
+        def messages():
+            # Пользователи (не админы) без оплаты текущего месяца - одним запросом
+            for telegram_id, full_name, class_number in get_unpaid_recipients(current_month, current_year).iterator():
+                # Получаем цену для конкретного ученика
+                price_info = get_price_by_class(class_number)
                 
-                if not is_paid:
-                    # Получаем цену для конкретного ученика
-                    price_info = get_price_by_class(user.course_or_class)
-                    
-                    if price_info:
-                        price = price_info['price']
-                        class_name = price_info['name']
-                    else:
-                        # Если не удалось определить цену, используем базовую
-                        price = 5000
-                        class_name = "стандартный тариф"
-                    
-                    # Отправляем срочное напоминание
-                    message_text = (
-                        f"⚠️ СРОЧНОЕ НАПОМИНАНИЕ ОБ ОПЛАТЕ ⚠️\n\n"
-                        f"Здравствуйте, {user.full_name or 'дорогой ученик'}!\n\n"
-                        f"🚨 ВНИМАНИЕ! Необходимо СРОЧНО оплатить занятия за {str(current_month).rjust(2, '0')}/{current_year}.\n\n"
-                        f"❌ Без оплаты доступ к занятиям может быть приостановлен.\n"
-                        f"⏰ Время для оплаты истекает!\n\n"
-                        f"📚 Тариф: {class_name}\n"
-                        f"💰 Сумма к оплате: {price} ₽\n\n"
-                        f"🔴 НЕМЕДЛЕННО используйте кнопку '💰 Оплата 💰' в главном меню бота.\n\n"
-                        f"📞 При возникновении вопросов свяжитесь с администратором.\n\n"
-                        f"С уважением, команда поддержки 📚"
-                    )
-                    
-                    bot.send_message(user.telegram_id, message_text)
-                    reminder_count += 1
-                    self.stdout.write(f"✅ Срочное напоминание отправлено пользователю {user.telegram_id} (класс: {user.course_or_class}, цена: {price} ₽)")
-                    
+                if price_info:
+                    price = price_info['price']
+                    class_name = price_info['name']
                 else:
-                    self.stdout.write(f"ℹ️ Пользователь {user.telegram_id} уже оплатил текущий месяц")
-                    
-            except Exception as e:
-                logger.error(f"Ошибка при отправке срочного напоминания пользователю {user.telegram_id}: {e}")
-                self.stdout.write(f"❌ Ошибка для пользователя {user.telegram_id}: {e}")
-                continue
+                    # Если не удалось определить цену, используем базовую
+                    price = 5000
+                    class_name = "стандартный тариф"
+                
+                yield telegram_id, (
+                    f"⚠️ СРОЧНОЕ НАПОМИНАНИЕ ОБ ОПЛАТЕ ⚠️\n\n"
+                    f"Здравствуйте, {full_name or 'дорогой ученик'}!\n\n"
+                    f"🚨 ВНИМАНИЕ! Необходимо СРОЧНО оплатить занятия за {str(current_month).rjust(2, '0')}/{current_year}.\n\n"
+                    f"❌ Без оплаты доступ к занятиям может быть приостановлен.\n"
+                    f"⏰ Время для оплаты истекает!\n\n"
+                    f"📚 Тариф: {class_name}\n"
+                    f"💰 Сумма к оплате: {price} ₽\n\n"
+                    f"🔴 НЕМЕДЛЕННО используйте кнопку '💰 Оплата 💰' в главном меню бота.\n\n"
+                    f"📞 При возникновении вопросов свяжитесь с администратором.\n\n"
+                    f"С уважением, команда поддержки 📚"
+                )
+        
+        def on_result(telegram_id, status, error):
+            if error:
+                logger.error(f"Ошибка при отправке срочного напоминания пользователю {telegram_id}: {error}")
+                self.stdout.write(f"❌ Ошибка для пользователя {telegram_id}: {error}")
+            else:
+                self.stdout.write(f"✅ Срочное напоминание отправлено пользователю {telegram_id}")
+        
+        counts = Broadcast(campaign).run(messages(), on_result=on_result)
         
         self.stdout.write(
             self.style.SUCCESS(
-                f'Срочные напоминания об оплате отправлены! '
-                f'Отправлено: {reminder_count}, '
-                f'Успешно: {success_count}'
+                f'Срочные напоминания об оплате отправлены ({campaign})! '
+                f'Отправлено: {counts["sent"]}, '
+                f'Ошибок: {counts["failed"]}, '
+                f'Пропущено (уже доставлено): {counts["skipped"]}'
             )
-        ) 
\ No newline at end of file
+        )
@@ -0,0 +1,86 @@
+"""Простые внутрипроцессные метрики бота (счётчики, задержки, gauge)"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class LatencyStats:
+    """Статистика задержек: количество, сумма, максимум и окно последних значений"""
+
+    def __init__(self, window=500):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.samples.append(seconds)
+
+    def snapshot(self):
+        samples = sorted(self.samples)
+
+        def percentile(p):
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            'p50_ms': round(percentile(0.5) * 1000, 2),
+            'p95_ms': round(percentile(0.95) * 1000, 2),
+            'max_ms': round(self.max * 1000, 2),
+        }
+
+
+class MetricsRegistry:
+    """Потокобезопасный реестр метрик процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def observe(self, name, seconds):
+        with self._lock:
+            stats = self._timers.get(name)
+            if stats is None:
+                stats = self._timers[name] = LatencyStats()
+            stats.observe(seconds)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def register_gauge(self, name, func):
+        """Регистрирует функцию, значение которой считывается при снятии снимка"""
+        with self._lock:
+            self._gauges[name] = func
+
+    @contextmanager
+    def timer(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self):
+        with self._lock:
+            timers = {name: stats.snapshot() for name, stats in self._timers.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        return {
+            'timers': timers,
+            'counters': counters,
+            'gauges': {name: func() for name, func in gauges.items()},
+        }
+
+
+metrics = MetricsRegistry()
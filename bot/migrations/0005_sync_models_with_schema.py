@@ -0,0 +1,151 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# Схема рабочих баз создавалась makemigrations при деплое, поэтому таблицы
+# и колонки этой миграции там уже могут быть. Операции ниже меняют базу,
+# только если изменения в ней еще нет; состояние моделей меняется всегда.
+
+def _columns(schema_editor, table):
+    with schema_editor.connection.cursor() as cursor:
+        return {
+            column.name: column
+            for column in schema_editor.connection.introspection.get_table_description(cursor, table)
+        }
+
+
+class CreateModelIfMissing(migrations.CreateModel):
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.name)
+        if model._meta.db_table in schema_editor.connection.introspection.table_names():
+            return
+        super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+
+class AddFieldIfMissing(migrations.AddField):
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        column = model._meta.get_field(self.name).column
+        if column in _columns(schema_editor, model._meta.db_table):
+            return
+        super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+
+class AlterFieldIfNotNull(migrations.AlterField):
+    """Делает колонку NULL, если она еще NOT NULL"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        column = model._meta.get_field(self.name).column
+        if _columns(schema_editor, model._meta.db_table)[column].null_ok:
+            return
+        super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0004_user_is_admin_payment_paymenthistory'),
+    ]
+
+    operations = [
+        # Колонки допускают NULL и больше не используются: удаляются только
+        # из состояния, данные рабочих баз не теряются
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='user',
+                    name='course_or_class',
+                ),
+                migrations.RemoveField(
+                    model_name='user',
+                    name='education_type',
+                ),
+            ],
+        ),
+        AddFieldIfMissing(
+            model_name='paymenthistory',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата создания'),
+            preserve_default=False,
+        ),
+        AddFieldIfMissing(
+            model_name='paymenthistory',
+            name='payment_type',
+            field=models.CharField(choices=[('card', 'Банковская карта'), ('cash', 'Наличные'), ('transfer', 'Перевод')], default='card', max_length=20, verbose_name='Тип оплаты'),
+        ),
+        AddFieldIfMissing(
+            model_name='paymenthistory',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Ожидает оплаты'), ('completed', 'Завершено'), ('cancelled', 'Отменено')], default='completed', max_length=20, verbose_name='Статус оплаты'),
+        ),
+        AddFieldIfMissing(
+            model_name='user',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Баланс'),
+        ),
+        AddFieldIfMissing(
+            model_name='user',
+            name='class_number',
+            field=models.CharField(blank=True, max_length=10, null=True, verbose_name='Класс'),
+        ),
+        AddFieldIfMissing(
+            model_name='user',
+            name='register_date',
+            field=models.DateField(default='2025-08-25', verbose_name='Дата регистрации'),
+        ),
+        AlterFieldIfNotNull(
+            model_name='paymenthistory',
+            name='payment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='history_records', to='bot.payment', verbose_name='Платеж'),
+        ),
+        CreateModelIfMissing(
+            name='AdminState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('admin_id', models.CharField(max_length=50, verbose_name='ID администратора')),
+                ('state', models.CharField(max_length=100, verbose_name='Состояние')),
+                ('data', models.JSONField(default=dict, verbose_name='Данные состояния')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Состояние администратора',
+                'verbose_name_plural': 'Состояния администраторов',
+                'unique_together': {('admin_id', 'state')},
+            },
+        ),
+        CreateModelIfMissing(
+            name='StudentProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profile_name', models.CharField(help_text="Например: 'Иван Петров' или 'Мария Сидорова'", max_length=100, verbose_name='Имя профиля')),
+                ('full_name', models.CharField(blank=True, max_length=200, null=True, verbose_name='ФИО')),
+                ('class_number', models.CharField(blank=True, max_length=10, null=True, verbose_name='Класс')),
+                ('education_level', models.CharField(blank=True, choices=[('base', 'База'), ('profile', 'Профиль')], max_length=20, null=True, verbose_name='Уровень (база/профиль)')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активный профиль')),
+                ('is_registered', models.BooleanField(default=False, verbose_name='Завершена регистрация')),
+                ('register_date', models.DateField(default='2025-08-25', verbose_name='Дата регистрации')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Баланс')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='student_profiles', to='bot.user', verbose_name='Пользователь Telegram')),
+            ],
+            options={
+                'verbose_name': 'Профиль ученика',
+                'verbose_name_plural': 'Профили учеников',
+                'unique_together': {('user', 'profile_name')},
+            },
+        ),
+        AddFieldIfMissing(
+            model_name='payment',
+            name='student_profile',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='bot.studentprofile', verbose_name='Профиль ученика'),
+        ),
+        AddFieldIfMissing(
+            model_name='paymenthistory',
+            name='student_profile',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payment_history', to='bot.studentprofile', verbose_name='Профиль ученика'),
+        ),
+    ]
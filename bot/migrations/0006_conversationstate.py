@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0005_sync_models_with_schema'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('namespace', models.CharField(max_length=50, verbose_name='Тип диалога')),
+                ('key', models.CharField(max_length=50, verbose_name='Ключ')),
+                ('data', models.JSONField(default=dict, verbose_name='Данные состояния')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Истекает')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Состояние диалога',
+                'verbose_name_plural': 'Состояния диалогов',
+                'unique_together': {('namespace', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0006_conversationstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BroadcastDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campaign', models.CharField(max_length=100, verbose_name='Рассылка')),
+                ('telegram_id', models.CharField(max_length=50, verbose_name='Telegram ID получателя')),
+                ('status', models.CharField(choices=[('sent', 'Отправлено'), ('failed', 'Ошибка')], max_length=20, verbose_name='Статус доставки')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Ошибка')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Доставка рассылки',
+                'verbose_name_plural': 'Доставки рассылок',
+                'unique_together': {('campaign', 'telegram_id')},
+            },
+        ),
+    ]
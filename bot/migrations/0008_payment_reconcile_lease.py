@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0007_broadcastdelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='reconcile_locked_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Заблокирован для сверки до'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='reconcile_owner',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Запуск сверки, владеющий блокировкой'),
+        ),
+    ]
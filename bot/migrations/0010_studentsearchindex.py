@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0009_payment_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentSearchIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(db_index=True, max_length=100, verbose_name='Слово (в нижнем регистре, ё→е)')),
+                ('source', models.CharField(choices=[('user', 'ФИО пользователя'), ('profile_name', 'Имя профиля'), ('profile_full_name', 'ФИО профиля')], max_length=20, verbose_name='Источник')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='bot.user', verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Поисковый индекс ученика',
+                'verbose_name_plural': 'Поисковый индекс учеников',
+            },
+        ),
+    ]
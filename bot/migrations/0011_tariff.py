@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0010_studentsearchindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tariff',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, verbose_name='Ключ тарифа (например, 10_profile)')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('price', models.PositiveIntegerField(verbose_name='Цена, руб.')),
+                ('description', models.TextField(blank=True, default='', verbose_name='Описание')),
+                ('keywords', models.JSONField(blank=True, default=list, verbose_name='Ключевые слова для поиска по классу')),
+                ('effective_from', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Действует с')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Тариф',
+                'verbose_name_plural': 'Тарифы',
+                'ordering': ['key', '-effective_from'],
+                'unique_together': {('key', 'effective_from')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0012_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('yookassa_payment_id', models.CharField(max_length=100, verbose_name='ID платежа в ЮKassa')),
+                ('event', models.CharField(max_length=50, verbose_name='Событие (например, payment.succeeded)')),
+                ('source', models.CharField(choices=[('webhook', 'Уведомление ЮKassa'), ('check_payment', 'Проверка пользователем'), ('reconcile', 'Сверка статусов')], max_length=20, verbose_name='Источник')),
+                ('previous_status', models.CharField(max_length=20, verbose_name='Предыдущий статус')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата обработки')),
+            ],
+            options={
+                'verbose_name': 'Событие платежа',
+                'verbose_name_plural': 'События платежей',
+                'unique_together': {('yookassa_payment_id', 'event')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0013_paymentevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening', 'Начальный остаток'), ('month_payment', 'Оплата месяца с баланса'), ('top_up', 'Пополнение'), ('adjustment', 'Корректировка')], max_length=20, verbose_name='Тип операции')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Сумма (списание - отрицательная)')),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Баланс после операции')),
+                ('month', models.IntegerField(blank=True, null=True, verbose_name='Месяц оплаты')),
+                ('year', models.IntegerField(blank=True, null=True, verbose_name='Год оплаты')),
+                ('description', models.CharField(blank=True, default='', max_length=200, verbose_name='Описание')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата операции')),
+                ('student_profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_transactions', to='bot.studentprofile', verbose_name='Профиль ученика')),
+            ],
+            options={
+                'verbose_name': 'Операция с балансом',
+                'verbose_name_plural': 'Операции с балансом',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['student_profile', 'created_at'], name='bot_balance_profile_idx')],
+            },
+        ),
+    ]
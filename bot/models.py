@@ -123,10 +123,31 @@ class Payment(models.Model):
         verbose_name='Тарифный план'
     )
     
+    # Аренда платежа запуском сверки статусов (check_pending_payments)
+    reconcile_locked_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Заблокирован для сверки до'
+    )
+    reconcile_owner = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        verbose_name='Запуск сверки, владеющий блокировкой'
+    )
+    
     class Meta:
         verbose_name = "Платеж"
         verbose_name_plural = "Платежи"
         ordering = ['-created_at']
+        indexes = [
+            # Незавершенные платежи (status__in) и их блокировка при сверке
+            models.Index(fields=['status', 'reconcile_locked_until'], name='bot_pay_status_lock_idx'),
+            # Незавершенные платежи пользователя
+            models.Index(fields=['user', 'status'], name='bot_pay_user_status_idx'),
+            # Платежи за период
+            models.Index(fields=['payment_year', 'payment_month'], name='bot_pay_period_idx'),
+        ]
     
     def __str__(self):
         return f"Платеж {self.yookassa_payment_id} - {self.user.full_name} - {self.amount} руб."
@@ -208,19 +229,32 @@ class PaymentHistory(models.Model):
     class Meta:
         verbose_name = "История оплат"
         verbose_name_plural = "История оплат"
+        # Уникальный ключ (user, month, year) также служит индексом для is_month_paid
         unique_together = ['user', 'month', 'year']
         ordering = ['-year', '-month']
+        indexes = [
+            # Оплаты профиля за период (is_month_paid с профилем, payment_info)
+            models.Index(fields=['student_profile', 'year', 'month'], name='bot_ph_profile_period_idx'),
+            # История оплат пользователя по статусу, отсортированная по периоду
+            models.Index(fields=['user', 'status', 'year', 'month'], name='bot_ph_user_status_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.full_name} - {self.month:02d}.{self.year} - {self.amount_paid} руб."
     
     @classmethod
     def is_month_paid(cls, user, month, year, student_profile=None):
-        """Проверить, оплачен ли указанный месяц"""
+        """
+        Проверить, оплачен ли указанный месяц.
+
+        Запрос к базе без кэша процесса: оплату могли подтвердить в другом
+        процессе, а проверка защищает от повторной оплаты месяца.
+        """
         query = cls.objects.filter(
             user=user,
             month=month,
-            year=year
+            year=year,
+            status='completed'
         )
         if student_profile:
             query = query.filter(student_profile=student_profile)
@@ -229,10 +263,9 @@ class PaymentHistory(models.Model):
     @classmethod
     def get_paid_months(cls, user, student_profile=None):
         """Получить все оплаченные месяцы для пользователя"""
-        query = cls.objects.filter(user=user)
-        if student_profile:
-            query = query.filter(student_profile=student_profile)
-        return query.values_list('month', 'year')
+        from bot.paid_months import get_paid_months
+        profile_id = student_profile.pk if student_profile else None
+        return list(get_paid_months(user.pk, profile_id))
 
 
 class AdminState(models.Model):
@@ -338,4 +371,332 @@ class StudentProfile(models.Model):
         for choice in self.EDUCATION_LEVEL_CHOICES:
             if choice[0] == self.education_level:
                 return choice[1]
-        return self.education_level
\ No newline at end of file
+        return self.education_level
+
+
+class ConversationState(models.Model):
+    """Модель для хранения состояний диалогов (регистрация, создание профиля)"""
+
+    namespace = models.CharField(
+        max_length=50,
+        verbose_name="Тип диалога"
+    )
+    key = models.CharField(
+        max_length=50,
+        verbose_name="Ключ"
+    )
+    data = models.JSONField(
+        default=dict,
+        verbose_name="Данные состояния"
+    )
+    expires_at = models.DateTimeField(
+        db_index=True,
+        verbose_name="Истекает"
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата обновления"
+    )
+
+    class Meta:
+        verbose_name = "Состояние диалога"
+        verbose_name_plural = "Состояния диалогов"
+        unique_together = ['namespace', 'key']
+
+    def __str__(self):
+        return f"{self.namespace} - {self.key}"
+
+
+class BroadcastDelivery(models.Model):
+    """Модель журнала доставки сообщений массовой рассылки"""
+
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    campaign = models.CharField(
+        max_length=100,
+        verbose_name="Рассылка"
+    )
+    telegram_id = models.CharField(
+        max_length=50,
+        verbose_name="Telegram ID получателя"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        verbose_name="Статус доставки"
+    )
+    error = models.TextField(
+        blank=True,
+        default='',
+        verbose_name="Ошибка"
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата обновления"
+    )
+
+    class Meta:
+        verbose_name = "Доставка рассылки"
+        verbose_name_plural = "Доставки рассылок"
+        unique_together = ['campaign', 'telegram_id']
+
+    def __str__(self):
+        return f"{self.campaign} - {self.telegram_id} - {self.status}"
+
+
+class StudentSearchIndex(models.Model):
+    """Модель поискового индекса учеников: нормализованные слова имён"""
+
+    SOURCE_CHOICES = [
+        ('user', 'ФИО пользователя'),
+        ('profile_name', 'Имя профиля'),
+        ('profile_full_name', 'ФИО профиля'),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='search_tokens',
+        verbose_name='Пользователь'
+    )
+    token = models.CharField(
+        max_length=100,
+        db_index=True,
+        verbose_name="Слово (в нижнем регистре, ё→е)"
+    )
+    source = models.CharField(
+        max_length=20,
+        choices=SOURCE_CHOICES,
+        verbose_name="Источник"
+    )
+
+    class Meta:
+        verbose_name = "Поисковый индекс ученика"
+        verbose_name_plural = "Поисковый индекс учеников"
+
+    def __str__(self):
+        return f"{self.token} ({self.user_id})"
+
+
+class Tariff(models.Model):
+    """Модель тарифа: цена плана, действующая с указанной даты"""
+
+    key = models.CharField(
+        max_length=50,
+        verbose_name="Ключ тарифа (например, 10_profile)"
+    )
+    name = models.CharField(
+        max_length=100,
+        verbose_name="Название"
+    )
+    price = models.PositiveIntegerField(
+        verbose_name="Цена, руб."
+    )
+    description = models.TextField(
+        blank=True,
+        default='',
+        verbose_name="Описание"
+    )
+    keywords = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name="Ключевые слова для поиска по классу"
+    )
+    effective_from = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Действует с"
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата обновления"
+    )
+
+    class Meta:
+        verbose_name = "Тариф"
+        verbose_name_plural = "Тарифы"
+        ordering = ['key', '-effective_from']
+        unique_together = ['key', 'effective_from']
+
+    def __str__(self):
+        return f"{self.name} - {self.price} руб. с {self.effective_from:%d.%m.%Y}"
+
+
+class NotificationOutbox(models.Model):
+    """Модель очереди исходящих уведомлений (пишется в транзакции с изменением данных)"""
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает отправки'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    dedup_key = models.CharField(
+        max_length=150,
+        unique=True,
+        verbose_name="Ключ уникальности уведомления"
+    )
+    chat_id = models.CharField(
+        max_length=50,
+        verbose_name="Telegram ID получателя"
+    )
+    text = models.TextField(
+        verbose_name="Текст"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name="Статус"
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Попыток отправки"
+    )
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Следующая попытка"
+    )
+    locked_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Заблокировано отправителем до"
+    )
+    error = models.TextField(
+        blank=True,
+        default='',
+        verbose_name="Ошибка"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Дата создания"
+    )
+    sent_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Дата отправки"
+    )
+
+    class Meta:
+        verbose_name = "Исходящее уведомление"
+        verbose_name_plural = "Исходящие уведомления"
+        indexes = [
+            # Выборка готовых к отправке уведомлений
+            models.Index(fields=['status', 'next_attempt_at'], name='bot_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.dedup_key} - {self.status}"
+
+
+class PaymentEvent(models.Model):
+    """Модель журнала применённых событий платежа (повторы webhook отбрасываются)"""
+
+    SOURCE_CHOICES = [
+        ('webhook', 'Уведомление ЮKassa'),
+        ('check_payment', 'Проверка пользователем'),
+        ('reconcile', 'Сверка статусов'),
+    ]
+
+    yookassa_payment_id = models.CharField(
+        max_length=100,
+        verbose_name="ID платежа в ЮKassa"
+    )
+    event = models.CharField(
+        max_length=50,
+        verbose_name="Событие (например, payment.succeeded)"
+    )
+    source = models.CharField(
+        max_length=20,
+        choices=SOURCE_CHOICES,
+        verbose_name="Источник"
+    )
+    previous_status = models.CharField(
+        max_length=20,
+        verbose_name="Предыдущий статус"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Дата обработки"
+    )
+
+    class Meta:
+        verbose_name = "Событие платежа"
+        verbose_name_plural = "События платежей"
+        unique_together = ['yookassa_payment_id', 'event']
+
+    def __str__(self):
+        return f"{self.yookassa_payment_id} - {self.event} ({self.source})"
+
+
+class BalanceTransaction(models.Model):
+    """Модель журнала операций с балансом профиля"""
+
+    KIND_CHOICES = [
+        ('opening', 'Начальный остаток'),
+        ('month_payment', 'Оплата месяца с баланса'),
+        ('top_up', 'Пополнение'),
+        ('adjustment', 'Корректировка'),
+    ]
+
+    student_profile = models.ForeignKey(
+        'StudentProfile',
+        on_delete=models.CASCADE,
+        related_name='balance_transactions',
+        verbose_name='Профиль ученика'
+    )
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES,
+        verbose_name="Тип операции"
+    )
+    amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name="Сумма (списание - отрицательная)"
+    )
+    balance_after = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name="Баланс после операции"
+    )
+    month = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Месяц оплаты"
+    )
+    year = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Год оплаты"
+    )
+    description = models.CharField(
+        max_length=200,
+        blank=True,
+        default='',
+        verbose_name="Описание"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Дата операции"
+    )
+
+    class Meta:
+        verbose_name = "Операция с балансом"
+        verbose_name_plural = "Операции с балансом"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['student_profile', 'created_at'], name='bot_balance_profile_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.student_profile_id} - {self.kind} - {self.amount} руб."
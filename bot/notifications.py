@@ -0,0 +1,73 @@
+"""Тексты уведомлений об оплате и их постановка в очередь отправки"""
+from bot.admins import get_admin_ids
+from bot.outbox import enqueue
+from bot.pricing import get_payment_price, get_price_by_class
+
+
+def render_payment_success_text(payment):
+    """Уведомление ученику об успешной оплате картой"""
+    profile = payment.student_profile
+
+    # Тариф, действовавший при создании платежа
+    price_info = get_payment_price(payment) or get_price_by_class(profile.class_number, at=payment.created_at)
+
+    if price_info:
+        class_name = price_info['name']
+        description = price_info['description']
+    else:
+        class_name = payment.pricing_plan
+        description = ""
+
+    text = f"✅ Оплата успешно выполнена!\n\n"
+    text += f"👤 Профиль: {profile.profile_name}\n"
+    text += f"📚 Класс: {profile.class_number}\n"
+    text += f"📊 Уровень: {profile.get_education_level_display() or 'Не указан'}\n"
+    text += f"💰 Тариф: {class_name}\n"
+    text += f"ℹ️ {description}\n"
+    text += f"📅 Период: {payment.payment_month:02d}.{payment.payment_year}\n"
+    text += f"💵 Сумма: {payment.amount} ₽"
+    return text
+
+
+def render_admin_payment_text(profile, month, year, amount, payment_type):
+    """Уведомление администраторам о новой оплате"""
+    price_info = get_price_by_class(profile.class_number)
+
+    if price_info:
+        class_name = price_info['name']
+        description = price_info['description']
+    else:
+        class_name = "Тариф не определен"
+        description = ""
+
+    text = f"💰 Новая оплата!\n\n"
+    text += f"👤 Ученик: {profile.full_name}\n"
+    text += f"📚 Класс: {profile.class_number}\n"
+    text += f"📊 Уровень: {profile.get_education_level_display() or 'Не указан'}\n"
+    text += f"💰 Тариф: {class_name}\n"
+    text += f"ℹ️ {description}\n"
+    text += f"📅 Период: {month:02d}.{year}\n"
+    text += f"💳 Способ: {'Банковская карта' if payment_type == 'card' else 'С баланса'}\n"
+    text += f"💵 Сумма: {amount} ₽"
+    return text
+
+
+def enqueue_payment_success(payment):
+    """
+    Ставит в очередь уведомления ученику и администраторам об оплате картой.
+
+    Вызывается в транзакции, создающей запись PaymentHistory. Повторный
+    вызов для того же платежа (повтор webhook, сверка) не дублирует сообщения.
+    """
+    key = f"payment:{payment.yookassa_payment_id}"
+    enqueue(f"{key}:user", payment.user_id, render_payment_success_text(payment))
+
+    admin_text = render_admin_payment_text(
+        payment.student_profile,
+        payment.payment_month,
+        payment.payment_year,
+        payment.amount,
+        'card'
+    )
+    for admin_id in get_admin_ids():
+        enqueue(f"{key}:admin:{admin_id}", admin_id, admin_text)
@@ -0,0 +1,224 @@
+"""Очередь исходящих уведомлений: запись в транзакции, отправка после фиксации"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from telebot.apihelper import ApiTelegramException
+
+from bot.metrics import metrics
+from bot.models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+# Запас аренды сверх таймаутов одной отправки, сек
+LEASE_MARGIN_SECONDS = 30
+
+# Ошибки Telegram, после которых повтор бесполезен (чат не найден, бот заблокирован)
+PERMANENT_ERROR_CODES = (400, 403)
+
+
+def enqueue(dedup_key, chat_id, text):
+    """
+    Добавляет уведомление в очередь. Повтор с тем же dedup_key игнорируется.
+
+    Вызывается внутри транзакции изменения данных: уведомление появится
+    в очереди только вместе с ним, отправка начнется после фиксации.
+    """
+    NotificationOutbox.objects.bulk_create(
+        [NotificationOutbox(dedup_key=dedup_key, chat_id=str(chat_id), text=text)],
+        ignore_conflicts=True,
+    )
+    if settings.OUTBOX_DRAIN_IN_PROCESS:
+        transaction.on_commit(drainer.wake)
+
+
+def _lease_until():
+    """
+    Срок аренды пакета: одна отправка с таймаутами запроса к Telegram и запасом.
+
+    Аренда продлевается перед каждой отправкой, поэтому ее длительность
+    не зависит от размера пакета.
+    """
+    timeout = settings.TELEGRAM_CONNECT_TIMEOUT + settings.TELEGRAM_READ_TIMEOUT
+    return timezone.now() + timedelta(seconds=timeout + LEASE_MARGIN_SECONDS)
+
+
+def _claim(batch_size):
+    now = timezone.now()
+    due = NotificationOutbox.objects.filter(
+        status=NotificationOutbox.STATUS_PENDING,
+        next_attempt_at__lte=now,
+    ).filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+    ids = list(due.order_by('next_attempt_at').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return [], None
+
+    # Условное обновление: параллельный отправитель не заберет те же записи
+    locked_until = _lease_until()
+    due.filter(id__in=ids).update(locked_until=locked_until)
+    items = list(NotificationOutbox.objects.filter(id__in=ids, locked_until=locked_until).order_by('id'))
+    return items, locked_until
+
+
+def _renew(items, locked_until):
+    """
+    Продлевает аренду записей пакета.
+
+    Returns:
+        tuple: (новый срок аренды, ID записей, которые забрал другой отправитель)
+    """
+    renewed = _lease_until()
+    ids = [item.id for item in items]
+    updated = NotificationOutbox.objects.filter(id__in=ids, locked_until=locked_until).update(locked_until=renewed)
+    if updated == len(ids):
+        return renewed, set()
+    owned = set(NotificationOutbox.objects.filter(id__in=ids, locked_until=renewed).values_list('id', flat=True))
+    return renewed, set(ids) - owned
+
+
+def _backoff(attempts):
+    return timedelta(seconds=min(5 * 2 ** attempts, 3600))
+
+
+def _send_message(chat_id, text):
+    from bot import bot
+    return bot.send_message(chat_id, text)
+
+
+def drain(batch_size=None, send=None):
+    """
+    Отправляет один пакет готовых уведомлений.
+
+    Returns:
+        dict: количество забранных, отправленных, отложенных и ошибочных уведомлений
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    send = send or _send_message
+    counts = {'claimed': 0, 'sent': 0, 'retry': 0, 'failed': 0}
+
+    items, locked_until = _claim(batch_size)
+    counts['claimed'] = len(items)
+    throttled_until = None
+    lost = set()
+
+    for item in items:
+        if throttled_until is not None:
+            # После 429 остаток пакета ждет окончания паузы без расхода попыток
+            item.next_attempt_at = throttled_until
+            counts['retry'] += 1
+            continue
+
+        # Аренда истекла (процесс надолго остановился), записи забрал другой отправитель
+        locked_until, taken = _renew([item for item in items if item.id not in lost], locked_until)
+        lost |= taken
+        if item.id in lost:
+            continue
+
+        now = timezone.now()
+        try:
+            with metrics.timer('outbox.send'):
+                send(item.chat_id, item.text)
+        except ApiTelegramException as e:
+            item.error = str(e)
+            if e.error_code == 429:
+                retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 1)
+                throttled_until = now + timedelta(seconds=retry_after)
+                item.next_attempt_at = throttled_until
+                metrics.increment('outbox.throttled')
+                counts['retry'] += 1
+                continue
+            item.attempts += 1
+            if e.error_code in PERMANENT_ERROR_CODES or item.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                item.status = NotificationOutbox.STATUS_FAILED
+                counts['failed'] += 1
+            else:
+                item.next_attempt_at = now + _backoff(item.attempts)
+                counts['retry'] += 1
+        except Exception as e:
+            item.error = str(e)
+            item.attempts += 1
+            if item.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                item.status = NotificationOutbox.STATUS_FAILED
+                counts['failed'] += 1
+            else:
+                item.next_attempt_at = now + _backoff(item.attempts)
+                counts['retry'] += 1
+        else:
+            item.status = NotificationOutbox.STATUS_SENT
+            item.attempts += 1
+            item.error = ''
+            item.sent_at = now
+            counts['sent'] += 1
+
+    items = [item for item in items if item.id not in lost]
+    if lost:
+        logger.warning(f"Outbox: аренда {len(lost)} уведомлений перехвачена другим отправителем")
+    for item in items:
+        item.locked_until = None
+    if items:
+        NotificationOutbox.objects.bulk_update(
+            items,
+            ['status', 'attempts', 'next_attempt_at', 'locked_until', 'error', 'sent_at'],
+        )
+        if counts['failed']:
+            logger.warning(f"Outbox: {counts['failed']} уведомлений не доставлено")
+    return counts
+
+
+def drain_all(batch_size=None, send=None):
+    """Отправляет пакеты, пока очередь не опустеет. Возвращает суммарные счетчики"""
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    total = {'claimed': 0, 'sent': 0, 'retry': 0, 'failed': 0}
+    while True:
+        counts = drain(batch_size, send)
+        for key, value in counts.items():
+            total[key] += value
+        if counts['claimed'] < batch_size or counts['sent'] == 0:
+            return total
+
+
+class OutboxDrainer:
+    """
+    Фоновый поток отправки очереди в процессе веб-сервера.
+
+    Запускается при старте процесса (start_process) или при первом wake(),
+    сразу отправляет накопившуюся очередь и будится после фиксации
+    транзакций, добавивших уведомления. Между пробуждениями раз
+    в poll_interval подбирает отложенные повторы и записи других процессов.
+    """
+
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+        self._event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        # После fork поток родителя в дочернем процессе не работает
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='outbox-drainer', daemon=True)
+                    self._thread.start()
+
+    def wake(self):
+        self.start()
+        self._event.set()
+
+    def _run(self):
+        while True:
+            try:
+                drain_all()
+            except Exception:
+                logger.exception('Ошибка отправки очереди уведомлений')
+            finally:
+                close_old_connections()
+            self._event.wait(self.poll_interval)
+            self._event.clear()
+
+
+drainer = OutboxDrainer(poll_interval=settings.OUTBOX_POLL_INTERVAL)
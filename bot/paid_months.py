@@ -0,0 +1,99 @@
+"""Оплаченные месяцы пользователя или профиля в виде битовых масок по годам"""
+from datetime import datetime
+from functools import lru_cache
+
+from django.conf import settings
+
+from bot.cache import TTLCache
+from bot.models import PaymentHistory
+
+# Кэш процесса для отображения (клавиатуры, карточки), сбрасывается сигналами
+# сохранения и удаления PaymentHistory. Проверки перед оплатой идут в базу
+_cache = TTLCache(ttl=settings.PAID_MONTHS_CACHE_TTL)
+
+
+class PaidMonths:
+    """
+    Оплаченные месяцы: год -> 12-битная маска (бит month - 1).
+
+    Поддерживает проверку (month, year) in paid_months.
+    """
+
+    __slots__ = ('masks',)
+
+    def __init__(self, masks):
+        self.masks = masks
+
+    def is_paid(self, month, year):
+        return bool(self.masks.get(year, 0) >> (month - 1) & 1)
+
+    def __contains__(self, item):
+        month, year = item
+        return self.is_paid(month, year)
+
+    def __iter__(self):
+        """Оплаченные (month, year) от последнего к первому"""
+        for year in sorted(self.masks, reverse=True):
+            mask = self.masks[year]
+            for month in range(12, 0, -1):
+                if mask >> (month - 1) & 1:
+                    yield month, year
+
+    def __len__(self):
+        return sum(bin(mask).count('1') for mask in self.masks.values())
+
+    def last(self):
+        """Последний оплаченный месяц (month, year) или None"""
+        return next(iter(self), None)
+
+    def window_mask(self, window):
+        """Маска окна месяцев: бит i - оплачен i-й месяц window"""
+        mask = 0
+        for i, (month, year) in enumerate(window):
+            if self.is_paid(month, year):
+                mask |= 1 << i
+        return mask
+
+
+@lru_cache(maxsize=2)
+def _month_window(today):
+    return tuple(
+        ((today.month - 1 + i) % 12 + 1, today.year + (today.month - 1 + i) // 12)
+        for i in range(12)
+    )
+
+
+def month_window():
+    """12 месяцев (month, year) начиная с текущего; вычисляется раз в день"""
+    return _month_window(datetime.now().date())
+
+
+def load_paid_months(user_id, profile_id=None):
+    """Строит маски одним запросом (учитываются только завершенные оплаты)"""
+    query = PaymentHistory.objects.filter(user_id=user_id, status='completed')
+    if profile_id is not None:
+        query = query.filter(student_profile_id=profile_id)
+
+    masks = {}
+    for year, month in query.order_by().values_list('year', 'month'):
+        masks[year] = masks.get(year, 0) | 1 << (month - 1)
+    return PaidMonths(masks)
+
+
+def get_paid_months(user_id, profile_id=None):
+    """
+    Оплаченные месяцы пользователя (profile_id=None - по всем профилям) или профиля
+    """
+    key = (str(user_id), profile_id)
+    paid_months = _cache.get(key)
+    if paid_months is None:
+        paid_months = load_paid_months(user_id, profile_id)
+        _cache.set(key, paid_months)
+    return paid_months
+
+
+def invalidate_paid_months(user_id, profile_id=None):
+    """Сбрасывает маски пользователя и профиля"""
+    _cache.delete((str(user_id), None))
+    if profile_id is not None:
+        _cache.delete((str(user_id), profile_id))
@@ -0,0 +1,137 @@
+"""Переходы статусов платежа: проверка, блокировка строки и журнал событий"""
+import logging
+from collections import namedtuple
+
+from django.db import IntegrityError, transaction
+
+from bot.metrics import metrics
+from bot.models import Payment, PaymentEvent, PaymentHistory
+from bot.notifications import enqueue_payment_success
+
+logger = logging.getLogger(__name__)
+
+# Допустимые переходы; из конечных статусов выхода нет
+TRANSITIONS = {
+    'pending': {'waiting_for_capture', 'succeeded', 'canceled'},
+    'waiting_for_capture': {'succeeded', 'canceled'},
+    'succeeded': set(),
+    'canceled': set(),
+}
+
+# Результаты применения статуса
+APPLIED = 'applied'        # статус изменён
+NOOP = 'noop'              # платеж уже в этом статусе
+DUPLICATE = 'duplicate'    # событие уже обработано параллельно
+REJECTED = 'rejected'      # переход недопустим (например, canceled -> succeeded)
+
+Transition = namedtuple('Transition', ['outcome', 'payment', 'previous_status'])
+
+
+def _check(current, status):
+    if current == status:
+        return NOOP
+    if status not in TRANSITIONS.get(current, ()):
+        return REJECTED
+    return None
+
+
+def record_payment_success(payment):
+    """
+    Запись в истории оплат и уведомления по успешному платежу.
+
+    Вызывается в транзакции, удерживающей блокировку строки платежа.
+    """
+    existing = list(PaymentHistory.objects.filter(
+        user_id=payment.user_id,
+        month=payment.payment_month,
+        year=payment.payment_year
+    ).values_list('payment_id', flat=True)[:1])
+
+    if not existing:
+        PaymentHistory.objects.create(
+            user_id=payment.user_id,
+            student_profile=payment.student_profile,
+            payment=payment,
+            month=payment.payment_month,
+            year=payment.payment_year,
+            amount_paid=payment.amount,
+            pricing_plan=payment.pricing_plan,
+            payment_type='card',
+            status='completed'
+        )
+    elif existing[0] != payment.pk:
+        # Уникальный ключ (user, month, year) уже занят другой оплатой
+        logger.warning(
+            f"Платеж {payment.yookassa_payment_id}: месяц {payment.payment_month:02d}.{payment.payment_year} "
+            f"уже оплачен другой записью истории"
+        )
+
+    enqueue_payment_success(payment)
+
+
+def apply_payment_status(yookassa_payment_id, status, payment_method=None, source='webhook'):
+    """
+    Применяет статус из ЮKassa к платежу.
+
+    Повторы уже применённого статуса отсекаются одним чтением без
+    блокировки. Иначе строка платежа блокируется (select_for_update),
+    переход проверяется повторно и фиксируется в PaymentEvent - уникальная
+    пара (платеж, событие) не даёт применить его дважды. Для succeeded
+    в той же транзакции создаются запись истории и уведомления.
+
+    Raises:
+        Payment.DoesNotExist: платеж не найден
+
+    Returns:
+        Transition: (outcome, payment или None, предыдущий статус)
+    """
+    current = Payment.objects.filter(
+        yookassa_payment_id=yookassa_payment_id
+    ).values_list('status', flat=True).first()
+    if current is None:
+        raise Payment.DoesNotExist(yookassa_payment_id)
+
+    outcome = _check(current, status)
+    if outcome is not None:
+        metrics.increment(f'payment_state.{outcome}')
+        if outcome == REJECTED:
+            logger.warning(f"Платеж {yookassa_payment_id}: переход {current} -> {status} ({source}) отклонён")
+        return Transition(outcome, None, current)
+
+    with transaction.atomic():
+        payment = Payment.objects.select_for_update().select_related('student_profile').get(
+            yookassa_payment_id=yookassa_payment_id
+        )
+        previous = payment.status
+
+        # Статус мог измениться, пока ждали блокировку
+        outcome = _check(previous, status)
+        if outcome is not None:
+            metrics.increment(f'payment_state.{outcome}')
+            return Transition(outcome, payment, previous)
+
+        try:
+            with transaction.atomic():
+                PaymentEvent.objects.create(
+                    yookassa_payment_id=yookassa_payment_id,
+                    event=f'payment.{status}',
+                    source=source,
+                    previous_status=previous
+                )
+        except IntegrityError:
+            metrics.increment(f'payment_state.{DUPLICATE}')
+            return Transition(DUPLICATE, payment, previous)
+
+        payment.status = status
+        update_fields = ['status', 'updated_at']
+        if payment_method is not None:
+            payment.payment_method = payment_method
+            update_fields.append('payment_method')
+        payment.save(update_fields=update_fields)
+
+        if status == 'succeeded':
+            record_payment_success(payment)
+
+    metrics.increment(f'payment_state.{APPLIED}')
+    logger.info(f"Платеж {yookassa_payment_id}: {previous} -> {status} ({source})")
+    return Transition(APPLIED, payment, previous)
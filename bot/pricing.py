@@ -1,4 +1,22 @@
-# Конфигурация цен для разных классов обучения
+import bisect
+import logging
+import re
+import threading
+import time
+from functools import lru_cache
+from types import MappingProxyType
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from bot.models import Tariff
+
+logger = logging.getLogger(__name__)
+
+# Конфигурация цен для разных классов обучения.
+# Базовые тарифы: действуют, пока в таблице Tariff нет записи с тем же ключом
 
 PRICING_CONFIG = {
     # Младшие классы (5-6)
@@ -67,42 +85,183 @@ PRICING_CONFIG = {
         'keywords': ['11_profile']
     }
 }
-def get_price_by_class(class_info):
+
+
+def normalize_class_info(class_info):
+    """Нормализует строку класса: нижний регистр, ё→е, одиночные пробелы"""
+    return ' '.join(str(class_info).lower().replace('ё', 'е').split())
+
+
+class PricingIndex:
+    """
+    Скомпилированный поиск тарифа по классу.
+
+    Порядок правил:
+        exact   - точное совпадение с ключом тарифа
+        alias   - нормализованная строка совпадает с ключом, названием или ключевым словом
+        keyword - самое длинное ключевое слово внутри строки; числа совпадают
+                  только целиком ('1' не находится внутри '11' или '10')
+
+    Результаты неизменяемы (MappingProxyType) и содержат поле 'rule'.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.exact = {key: self._result(key, 'exact') for key in config}
+
+        self.aliases = {}
+        keywords = {}
+        for key, data in config.items():
+            for alias in (key, data['name'], *data.get('keywords', ())):
+                normalized = normalize_class_info(alias)
+                # При совпадении псевдонимов побеждает тариф, объявленный раньше
+                self.aliases.setdefault(normalized, key)
+            for keyword in data.get('keywords', ()):
+                keywords.setdefault(normalize_class_info(keyword), key)
+        self.keywords = keywords
+
+        # Более длинные ключевые слова - раньше в альтернативе
+        alternatives = sorted(keywords, key=len, reverse=True)
+        self.pattern = re.compile(
+            r'(?<!\d)(?:' + '|'.join(re.escape(keyword) for keyword in alternatives) + r')(?!\d)'
+        ) if alternatives else None
+
+        self._match = lru_cache(maxsize=512)(self._match_normalized)
+
+    def _result(self, key, rule):
+        data = self.config[key]
+        return MappingProxyType({
+            'key': key,
+            'name': data['name'],
+            'price': data['price'],
+            'description': data['description'],
+            'rule': rule,
+        })
+
+    def _match_normalized(self, normalized):
+        key = self.aliases.get(normalized)
+        if key is not None:
+            return self._result(key, 'alias')
+
+        if self.pattern is None:
+            return None
+        best = None
+        for match in self.pattern.finditer(normalized):
+            if best is None or len(match.group()) > len(best.group()):
+                best = match
+        if best is None:
+            return None
+        return self._result(self.keywords[best.group()], f'keyword:{best.group()}')
+
+    def resolve(self, class_info):
+        if not class_info:
+            return None
+        result = self.exact.get(class_info)
+        if result is not None:
+            return result
+        return self._match(normalize_class_info(class_info))
+
+
+class PricingSnapshot:
+    """
+    Неизменяемый снимок тарифов: индексы поиска по датам начала действия.
+
+    До первой даты из таблицы Tariff действует PRICING_CONFIG, далее каждый
+    ключ берётся из последней вступившей в силу записи.
+    """
+
+    def __init__(self, tariffs=(), version=None):
+        self.version = version
+        self.starts = []
+        self.indexes = [PricingIndex(PRICING_CONFIG)]
+
+        config = dict(PRICING_CONFIG)
+        for tariff in sorted(tariffs, key=lambda tariff: tariff.effective_from):
+            config[tariff.key] = {
+                'name': tariff.name,
+                'price': tariff.price,
+                'description': tariff.description,
+                'keywords': tariff.keywords or [],
+            }
+            if self.starts and self.starts[-1] == tariff.effective_from:
+                self.indexes[-1] = PricingIndex(dict(config))
+            else:
+                self.starts.append(tariff.effective_from)
+                self.indexes.append(PricingIndex(dict(config)))
+
+    def index_at(self, at=None):
+        if at is None:
+            at = timezone.now()
+        return self.indexes[bisect.bisect_right(self.starts, at)]
+
+
+class TariffRegistry:
+    """
+    Тарифы в памяти процесса.
+
+    Раз в refresh_interval сверяет версию таблицы (число записей и время
+    последнего изменения) и при изменении строит новый снимок. Снимок
+    заменяется одним присваиванием, чтение идёт без блокировок.
+    """
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self._snapshot = PricingSnapshot()
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _version(self):
+        stamp = Tariff.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+        return stamp['count'], stamp['updated']
+
+    def reload(self, force=False):
+        try:
+            version = self._version()
+            if force or version != self._snapshot.version:
+                self._snapshot = PricingSnapshot(Tariff.objects.all(), version)
+        except DatabaseError:
+            logger.exception('Не удалось загрузить тарифы, используется текущий снимок')
+        self._checked_at = time.monotonic()
+        return self._snapshot
+
+    def snapshot(self):
+        checked_at = self._checked_at
+        if checked_at is None or time.monotonic() - checked_at > self.refresh_interval:
+            # Проверку выполняет один поток, остальные читают текущий снимок
+            if self._lock.acquire(blocking=checked_at is None):
+                try:
+                    if self._checked_at is checked_at:
+                        self.reload()
+                finally:
+                    self._lock.release()
+        return self._snapshot
+
+    def invalidate(self):
+        """Проверить версию при следующем обращении"""
+        self._checked_at = None
+
+
+tariff_registry = TariffRegistry(refresh_interval=settings.TARIFF_RELOAD_INTERVAL)
+
+
+def get_price_by_class(class_info, at=None):
     """
     Получить цену по информации о классе пользователя
     
     Args:
         class_info (str): Информация о классе пользователя
+        at (datetime): Момент, на который нужен тариф (по умолчанию - сейчас)
     
     Returns:
-        dict: Словарь с информацией о цене или None если не найдено
+        Mapping: Информация о цене (key, name, price, description, rule) или None если не найдено
     """
-    if not class_info:
-        return None
-    
-    # Проверяем точное совпадение
-    if class_info in PRICING_CONFIG:
-        price_data = PRICING_CONFIG[class_info]
-        return {
-            'key': class_info,
-            'name': price_data['name'],
-            'price': price_data['price'],
-            'description': price_data['description']
-        }
-    
-    # Если точного совпадения нет, ищем по ключевым словам
-    class_info_lower = class_info.lower().strip()
-    for price_key, price_data in PRICING_CONFIG.items():
-        for keyword in price_data['keywords']:
-            if keyword in class_info_lower:
-                return {
-                    'key': price_key,
-                    'name': price_data['name'],
-                    'price': price_data['price'],
-                    'description': price_data['description']
-                }
-    
-    return None
+    return tariff_registry.snapshot().index_at(at).resolve(class_info)
+
+
+def get_payment_price(payment):
+    """Тариф, действовавший при создании платежа (по Payment.pricing_plan)"""
+    return get_price_by_class(payment.pricing_plan, at=payment.created_at)
+
 
 def get_all_price_options():
     """
@@ -111,6 +270,7 @@ def get_all_price_options():
     Returns:
         list: Список всех ценовых планов
     """
+    index = tariff_registry.snapshot().index_at()
     return [
         {
             'key': key,
@@ -118,5 +278,5 @@ def get_all_price_options():
             'price': data['price'],
             'description': data['description']
         }
-        for key, data in PRICING_CONFIG.items()
-    ]
\ No newline at end of file
+        for key, data in index.config.items()
+    ]
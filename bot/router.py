@@ -0,0 +1,121 @@
+"""Индексированный маршрутизатор callback-запросов"""
+import logging
+import time
+
+from bot import bot
+from bot.metrics import metrics
+
+logger = logging.getLogger('bot')
+
+
+class Route:
+    """Маршрут: обработчик и типы параметров, закодированных после префикса"""
+
+    __slots__ = ('name', 'handler', 'param_types')
+
+    def __init__(self, name, handler, param_types=()):
+        self.name = name
+        self.handler = handler
+        self.param_types = param_types
+
+    def parse(self, suffix):
+        """
+        Разбирает параметры из остатка callback_data.
+
+        Параметры разделены '_'; лишние подчёркивания остаются в первом
+        параметре, поэтому 'class_10_base' с одним str-параметром даёт '10_base'.
+        """
+        if not self.param_types:
+            return ()
+        parts = suffix.rsplit('_', len(self.param_types) - 1)
+        if len(parts) != len(self.param_types) or not all(parts):
+            raise ValueError(f"Неверные параметры маршрута {self.name}: {suffix!r}")
+        return tuple(cast(part.strip()) for cast, part in zip(self.param_types, parts))
+
+
+class CallbackRouter:
+    """
+    Маршрутизатор callback_data.
+
+    Точные ключи разрешаются через словарь за O(1), параметризованные -
+    по префиксному дереву с выбором самого длинного совпавшего префикса,
+    поэтому порядок регистрации не влияет на результат.
+    """
+
+    def __init__(self):
+        self._exact = {}
+        self._trie = {}
+
+    def exact(self, data, handler):
+        """Регистрирует обработчик для точного значения callback_data"""
+        if data in self._exact:
+            raise ValueError(f"Маршрут {data!r} уже зарегистрирован")
+        self._exact[data] = Route(data, handler)
+
+    def prefix(self, prefix, handler, *param_types):
+        """
+        Регистрирует обработчик для callback_data вида '<prefix><параметры>'.
+
+        Args:
+            prefix (str): префикс, например 'select_profile_'
+            handler (callable): обработчик callback-запроса
+            param_types: типы параметров после префикса (по умолчанию одна строка)
+        """
+        node = self._trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        if None in node:
+            raise ValueError(f"Префикс {prefix!r} уже зарегистрирован")
+        node[None] = Route(prefix, handler, param_types or (str,))
+
+    def resolve(self, data):
+        """
+        Находит маршрут для callback_data.
+
+        Returns:
+            tuple: (Route, параметры) или (None, ()) если маршрут не найден
+        """
+        route = self._exact.get(data)
+        if route is not None:
+            return route, ()
+
+        node = self._trie
+        match, match_end = None, 0
+        for index, char in enumerate(data):
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                match, match_end = node[None], index + 1
+        if match is None:
+            return None, ()
+        return match, match.parse(data[match_end:])
+
+    def dispatch(self, call):
+        """Обработчик для telebot: вызывает обработчик найденного маршрута"""
+        started = time.perf_counter()
+        try:
+            route, params = self.resolve(call.data or '')
+        except ValueError as e:
+            metrics.increment('router.invalid')
+            logger.warning(f"Callback {call.data!r}: {e}")
+            bot.answer_callback_query(call.id, "❌ Неверный формат данных")
+            return
+        metrics.observe('router.resolve', time.perf_counter() - started)
+
+        if route is None:
+            metrics.increment('router.unmatched')
+            logger.debug(f"Callback {call.data!r} не соответствует ни одному маршруту")
+            return
+
+        call.route = route.name
+        call.route_params = params
+        try:
+            route.handler(call)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe(f"route.{route.name}", elapsed)
+            logger.debug(f"Callback {call.data!r} -> {route.name} ({elapsed * 1000:.1f} ms)")
+
+
+router = CallbackRouter()
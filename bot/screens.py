@@ -0,0 +1,136 @@
+"""
+Экраны частых сценариев: текст и клавиатура без обращений к Telegram.
+
+Используются синхронными обработчиками и их асинхронными вариантами
+(bot.async_handlers), поэтому выполняют только запросы к базе.
+"""
+from collections import namedtuple
+
+from bot.context import get_user_context
+from bot.keyboards import (
+    generate_balance_payment_months_keyboard,
+    generate_payment_menu_keyboard,
+    generate_payment_months_keyboard,
+    generate_profile_management_keyboard,
+    main_markup,
+)
+from bot.models import StudentProfile, User
+from bot.paid_months import get_paid_months
+from bot.pricing import get_price_by_class
+from bot.texts import MAIN_TEXT, PROFILE_INFO_TEXT
+
+Screen = namedtuple('Screen', ['text', 'markup'])
+
+
+class Alert(Exception):
+    """Экран не показывается, пользователю отвечают всплывающим уведомлением"""
+
+
+class NeedsRegistration(Exception):
+    """Пользователь не зарегистрирован или у него нет профилей"""
+
+
+def _registered_context(telegram_id):
+    try:
+        context = get_user_context(telegram_id)
+    except User.DoesNotExist:
+        raise NeedsRegistration(telegram_id)
+    if not context.user.student_profiles.exists():
+        raise NeedsRegistration(telegram_id)
+    return context
+
+
+def _active_price(context):
+    """Активный профиль и тариф с учетом уровня образования"""
+    active_profile = context.active_profile
+    if not active_profile:
+        raise Alert("❌ У вас нет активного профиля")
+
+    class_key = active_profile.class_number
+    if active_profile.education_level:
+        if active_profile.class_number in ['10', '11']:
+            class_key = f"{active_profile.class_number}_{active_profile.education_level}"
+
+    price_info = get_price_by_class(class_key)
+    if not price_info:
+        raise Alert("❌ Не удалось определить тариф для вашего класса")
+    return active_profile, price_info
+
+
+def render_main_menu(telegram_id):
+    """Главное меню"""
+    _registered_context(telegram_id)
+    return Screen(MAIN_TEXT, main_markup)
+
+
+def render_payment_menu(telegram_id, check_pending=None):
+    """
+    Меню оплаты.
+
+    Args:
+        check_pending: вызов check_pending(user) для сверки незавершенных платежей
+    """
+    context = _registered_context(telegram_id)
+    if check_pending is not None:
+        check_pending(context.user)
+
+    active_profile, price_info = _active_price(context)
+
+    text = f"💳 Меню оплаты\n\n"
+    text += f"👤 Профиль: {active_profile.profile_name}\n"
+    text += f"📚 Класс: {active_profile.class_number}\n"
+    text += f"📊 Уровень: {active_profile.get_education_level_display() or 'Не указан'}\n"
+    text += f"💰 Тариф: {price_info['name']}\n"
+    text += f"ℹ️ {price_info['description']}\n"
+    text += f"💵 Стоимость: {price_info['price']} ₽\n"
+    text += f"💳 Баланс: {active_profile.balance} ₽\n\n"
+    text += f"Выберите действие:"
+    return Screen(text, generate_payment_menu_keyboard())
+
+
+def render_payment_months(telegram_id, with_balance=False):
+    """Выбор месяца для оплаты картой или с баланса"""
+    try:
+        context = get_user_context(telegram_id)
+    except User.DoesNotExist:
+        raise Alert("❌ Пользователь не найден")
+    active_profile, price_info = _active_price(context)
+
+    if with_balance and active_profile.balance <= 0:
+        raise Alert("❌ На балансе недостаточно средств")
+
+    paid_months = get_paid_months(context.user.pk, active_profile.pk)
+    if with_balance:
+        markup = generate_balance_payment_months_keyboard(paid_months)
+        text = f"📅 Выберите месяц для оплаты с баланса\n\n"
+    else:
+        markup = generate_payment_months_keyboard(paid_months)
+        text = f"📅 Выберите месяц для оплаты\n\n"
+    text += f"👤 Профиль: {active_profile.profile_name}\n"
+    text += f"📚 Класс: {active_profile.class_number}\n"
+    text += f"📊 Уровень: {active_profile.get_education_level_display() or 'Не указан'}\n"
+    text += f"💰 Тариф: {price_info['name']}\n"
+    text += f"ℹ️ {price_info['description']}\n"
+    text += f"💵 Стоимость: {price_info['price']} ₽"
+    if with_balance:
+        text += f"\n💳 Баланс: {active_profile.balance} ₽"
+    return Screen(text, markup)
+
+
+def render_profile(telegram_id, profile_id):
+    """Информация о профиле пользователя"""
+    try:
+        profile = StudentProfile.objects.get(id=profile_id, user__telegram_id=telegram_id)
+    except StudentProfile.DoesNotExist:
+        raise Alert("Профиль не найден")
+
+    text = PROFILE_INFO_TEXT.format(
+        profile_name=profile.profile_name,
+        full_name=profile.full_name or "Не указано",
+        class_number=profile.class_number,
+        education_level=profile.get_education_level_display() or 'Не указан',
+        balance=profile.balance,
+        created_at=profile.created_at.strftime('%d.%m.%Y'),
+        status="Активный" if profile.is_active else "Неактивный"
+    )
+    return Screen(text, generate_profile_management_keyboard(profile.id))
@@ -0,0 +1,128 @@
+"""Поиск учеников по ФИО и именам профилей"""
+import re
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+
+from bot.models import StudentProfile, StudentSearchIndex, User
+
+# Минимальная длина слова запроса и ограничения выборки
+MIN_QUERY_LENGTH = 2
+MAX_CANDIDATES = 500
+MAX_QUERY_TOKENS = 4
+
+# Вес точного совпадения слова и совпадения по префиксу
+EXACT_SCORE = 3
+PREFIX_SCORE = 1
+SOURCE_SCORE = {'user': 1, 'profile_full_name': 1, 'profile_name': 0}
+
+_word_re = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Разбивает текст на слова: нижний регистр, ё→е"""
+    if not text:
+        return []
+    text = text.casefold().replace('ё', 'е')
+    return [word[:100] for word in _word_re.findall(text)]
+
+
+def _index_rows(user, profiles):
+    sources = [('user', user.full_name)]
+    for profile_name, full_name in profiles:
+        sources.append(('profile_name', profile_name))
+        sources.append(('profile_full_name', full_name))
+
+    rows = set()
+    for source, text in sources:
+        for token in normalize(text):
+            rows.add((token, source))
+    return [StudentSearchIndex(user=user, token=token, source=source) for token, source in rows]
+
+
+def reindex_student(telegram_id):
+    """Перестраивает записи индекса одного пользователя, если имена изменились"""
+    user = User.objects.filter(telegram_id=telegram_id).only('telegram_id', 'full_name').first()
+    if user is None:
+        return
+
+    rows = _index_rows(user, user.student_profiles.values_list('profile_name', 'full_name'))
+    existing = set(StudentSearchIndex.objects.filter(user=user).values_list('token', 'source'))
+    if existing == {(row.token, row.source) for row in rows}:
+        return
+
+    with transaction.atomic():
+        StudentSearchIndex.objects.filter(user=user).delete()
+        StudentSearchIndex.objects.bulk_create(rows)
+
+
+def rebuild_index(batch_size=500):
+    """Полностью перестраивает индекс. Возвращает количество записей"""
+    profiles = defaultdict(list)
+    for user_id, profile_name, full_name in StudentProfile.objects.values_list('user_id', 'profile_name', 'full_name'):
+        profiles[user_id].append((profile_name, full_name))
+
+    total = 0
+    with transaction.atomic():
+        StudentSearchIndex.objects.all().delete()
+        rows = []
+        for user in User.objects.only('telegram_id', 'full_name').iterator():
+            rows.extend(_index_rows(user, profiles.get(user.telegram_id, [])))
+            if len(rows) >= batch_size:
+                StudentSearchIndex.objects.bulk_create(rows)
+                total += len(rows)
+                rows = []
+        StudentSearchIndex.objects.bulk_create(rows)
+        total += len(rows)
+    return total
+
+
+def search_students(query, limit=8):
+    """
+    Ищет учеников (не администраторов) по началу слов ФИО и имён профилей.
+
+    Все слова запроса должны совпасть. Точные совпадения слов ранжируются
+    выше совпадений по префиксу. Ранжируются не более MAX_CANDIDATES
+    совпавших учеников (первые по telegram_id).
+
+    Returns:
+        list: [(telegram_id, full_name), ...] не длиннее limit
+    """
+    tokens = [token for token in normalize(query) if len(token) >= MIN_QUERY_LENGTH][:MAX_QUERY_TOKENS]
+    if not tokens:
+        return []
+
+    # Пользователи, у которых совпали все слова: пересечение в базе до ограничения выборки
+    students = User.objects.filter(is_admin=False)
+    for token in tokens:
+        students = students.filter(
+            telegram_id__in=StudentSearchIndex.objects.filter(token__startswith=token).values('user_id')
+        )
+    students = dict(students.order_by('telegram_id').values_list('telegram_id', 'full_name')[:MAX_CANDIDATES])
+    if not students:
+        return []
+
+    condition = Q()
+    for token in tokens:
+        condition |= Q(token__startswith=token)
+    candidates = StudentSearchIndex.objects.filter(condition, user_id__in=students).values_list('user_id', 'token', 'source')
+
+    # Лучший балл каждого слова запроса для каждого пользователя
+    best = defaultdict(dict)
+    for user_id, token, source in candidates:
+        for query_token in tokens:
+            if not token.startswith(query_token):
+                continue
+            score = (EXACT_SCORE if token == query_token else PREFIX_SCORE) + SOURCE_SCORE.get(source, 0)
+            if score > best[user_id].get(query_token, 0):
+                best[user_id][query_token] = score
+
+    scores = {
+        user_id: sum(matched.values())
+        for user_id, matched in best.items()
+        if len(matched) == len(tokens)
+    }
+    students = {user_id: full_name for user_id, full_name in students.items() if user_id in scores}
+    ranked = sorted(students, key=lambda user_id: (-scores[user_id], students[user_id] or '', user_id))
+    return [(user_id, students[user_id]) for user_id in ranked[:limit]]
@@ -0,0 +1,41 @@
+"""Обработчики сигналов моделей: сброс кэшей при изменении данных"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from bot.admins import admin_registry
+from bot.context import invalidate_user_context
+from bot.models import PaymentHistory, StudentProfile, Tariff, User
+from bot.paid_months import invalidate_paid_months
+from bot.pricing import tariff_registry
+from bot.search import reindex_student
+from bot.students import invalidate_students_count
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, signal, **kwargs):
+    invalidate_user_context(instance.telegram_id)
+    admin_registry.update(instance.telegram_id, instance.is_admin and signal is post_save)
+    invalidate_students_count()
+    if signal is post_save:
+        # После фиксации: профили могут сохраняться в той же транзакции
+        transaction.on_commit(lambda: reindex_student(instance.telegram_id))
+
+
+@receiver([post_save, post_delete], sender=StudentProfile)
+def student_profile_changed(sender, instance, **kwargs):
+    invalidate_user_context(instance.user_id)
+    transaction.on_commit(lambda: reindex_student(instance.user_id))
+
+
+@receiver([post_save, post_delete], sender=PaymentHistory)
+def payment_history_changed(sender, instance, **kwargs):
+    invalidate_paid_months(instance.user_id, instance.student_profile_id)
+    # Повторно после фиксации: маски, прочитанные до коммита другими потоками, устаревают
+    transaction.on_commit(lambda: invalidate_paid_months(instance.user_id, instance.student_profile_id))
+
+
+@receiver([post_save, post_delete], sender=Tariff)
+def tariff_changed(sender, **kwargs):
+    # Другие процессы подхватят изменение по версии таблицы
+    transaction.on_commit(tariff_registry.invalidate)
@@ -0,0 +1,164 @@
+"""Хранилища состояний диалогов (регистрация, создание профиля)"""
+import random
+from abc import ABC, abstractmethod
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from bot.cache import TTLCache
+
+
+class StateStore(ABC):
+    """
+    Базовое хранилище состояний: ключ - telegram_id, значение - словарь.
+
+    Поддерживает словарный протокол (in, [], del), но возвращает копии:
+    изменённое состояние нужно явно записать обратно.
+    """
+
+    def __init__(self, namespace, ttl):
+        self.namespace = namespace
+        self.ttl = ttl
+
+    @abstractmethod
+    def get(self, key, default=None):
+        """Состояние key или default"""
+
+    @abstractmethod
+    def set(self, key, data):
+        """Записывает состояние key"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Удаляет состояние key"""
+
+    @classmethod
+    def lookup(cls, key, stores):
+        """
+        Первое состояние key по порядку хранилищ stores.
+
+        Returns:
+            tuple: (хранилище, состояние) или (None, None)
+        """
+        for store in stores:
+            data = store.get(key)
+            if data is not None:
+                return store, data
+        return None, None
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        data = self.get(key)
+        if data is None:
+            raise KeyError(key)
+        return data
+
+    def __setitem__(self, key, data):
+        self.set(key, data)
+
+    def __delitem__(self, key):
+        self.delete(key)
+
+
+class MemoryStateStore(StateStore):
+    """Хранилище в памяти процесса с ограничением размера (LRU) и временем жизни"""
+
+    def __init__(self, namespace, ttl, maxsize):
+        super().__init__(namespace, ttl)
+        self._cache = TTLCache(ttl=ttl, maxsize=maxsize)
+
+    def get(self, key, default=None):
+        data = self._cache.get(str(key))
+        return default if data is None else dict(data)
+
+    def set(self, key, data):
+        self._cache.set(str(key), dict(data))
+
+    def delete(self, key):
+        self._cache.delete(str(key))
+
+
+class DatabaseStateStore(StateStore):
+    """Хранилище в базе данных: общее для всех процессов и переживает перезапуск"""
+
+    # Доля операций записи, после которых удаляются просроченные состояния
+    purge_probability = 0.01
+
+    def get(self, key, default=None):
+        from bot.models import ConversationState
+
+        data = ConversationState.objects.filter(
+            namespace=self.namespace,
+            key=str(key),
+            expires_at__gt=timezone.now()
+        ).values_list('data', flat=True).first()
+        return default if data is None else data
+
+    def set(self, key, data):
+        from bot.models import ConversationState
+
+        ConversationState.objects.update_or_create(
+            namespace=self.namespace,
+            key=str(key),
+            defaults={
+                'data': data,
+                'expires_at': timezone.now() + timedelta(seconds=self.ttl),
+            }
+        )
+        if random.random() < self.purge_probability:
+            self.purge_expired()
+
+    def delete(self, key):
+        from bot.models import ConversationState
+
+        ConversationState.objects.filter(namespace=self.namespace, key=str(key)).delete()
+
+    @classmethod
+    def lookup(cls, key, stores):
+        """Состояния всех хранилищ читаются одним запросом"""
+        from bot.models import ConversationState
+
+        found = dict(ConversationState.objects.filter(
+            namespace__in=[store.namespace for store in stores],
+            key=str(key),
+            expires_at__gt=timezone.now()
+        ).values_list('namespace', 'data'))
+        for store in stores:
+            if store.namespace in found:
+                return store, found[store.namespace]
+        return None, None
+
+    def purge_expired(self):
+        from bot.models import ConversationState
+
+        ConversationState.objects.filter(expires_at__lte=timezone.now()).delete()
+
+
+STATE_STORE_BACKENDS = {
+    'memory': lambda namespace: MemoryStateStore(
+        namespace, settings.STATE_STORE_TTL, settings.STATE_STORE_MAX_SIZE
+    ),
+    'database': lambda namespace: DatabaseStateStore(namespace, settings.STATE_STORE_TTL),
+}
+
+
+def find_state(key, *stores):
+    """
+    Ищет состояние пользователя сразу в нескольких хранилищах одного типа.
+
+    Returns:
+        tuple: (хранилище, состояние) или (None, None)
+    """
+    return type(stores[0]).lookup(key, stores)
+
+
+def get_state_store(namespace):
+    """Создаёт хранилище состояний настроенного типа (STATE_STORE_BACKEND)"""
+    try:
+        backend = STATE_STORE_BACKENDS[settings.STATE_STORE_BACKEND]
+    except KeyError:
+        raise ValueError(f"Неизвестный STATE_STORE_BACKEND: {settings.STATE_STORE_BACKEND}")
+    return backend(namespace)
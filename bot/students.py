@@ -0,0 +1,54 @@
+"""Выборки учеников (не администраторов) для админских экранов"""
+from django.conf import settings
+
+from bot.cache import TTLCache
+from bot.models import User
+
+# Кэш количества учеников, сбрасывается сигналами сохранения User
+_count_cache = TTLCache(ttl=settings.STUDENTS_COUNT_CACHE_TTL, maxsize=1)
+
+# Направления перехода по курсору
+NEXT = 'n'
+PREV = 'p'
+
+
+def get_students_count():
+    """Количество учеников (кэшируется)"""
+    count = _count_cache.get('students')
+    if count is None:
+        count = User.objects.filter(is_admin=False).count()
+        _count_cache.set('students', count)
+    return count
+
+
+def invalidate_students_count():
+    _count_cache.clear()
+
+
+def get_students_page(cursor=None, direction=NEXT, per_page=8):
+    """
+    Страница учеников по курсору (keyset-пагинация по telegram_id).
+
+    Args:
+        cursor: telegram_id последнего (NEXT) или первого (PREV) ученика соседней страницы
+        direction: NEXT - страница после курсора, PREV - страница перед курсором
+
+    Returns:
+        tuple: ([(telegram_id, full_name), ...], есть_предыдущая, есть_следующая)
+    """
+    students = User.objects.filter(is_admin=False)
+
+    if direction == PREV and cursor is not None:
+        rows = list(
+            students.filter(telegram_id__lt=cursor)
+            .order_by('-telegram_id')
+            .values_list('telegram_id', 'full_name')[:per_page + 1]
+        )
+        return rows[:per_page][::-1], len(rows) > per_page, True
+
+    if cursor is not None:
+        students = students.filter(telegram_id__gt=cursor)
+    rows = list(
+        students.order_by('telegram_id').values_list('telegram_id', 'full_name')[:per_page + 1]
+    )
+    return rows[:per_page], cursor is not None, len(rows) > per_page
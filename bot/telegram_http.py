@@ -0,0 +1,74 @@
+"""Общий пул keep-alive соединений к Telegram Bot API для всех потоков процесса"""
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from telebot import apihelper
+
+from bot.metrics import metrics
+
+
+class TelegramSession:
+    """
+    Отправитель запросов для apihelper.CUSTOM_REQUEST_SENDER.
+
+    Одна requests.Session на процесс с ограниченным пулом соединений:
+    потоки обработки обновлений переиспользуют TLS-соединения вместо
+    собственных сессий. При занятом пуле запрос ждёт свободное соединение
+    (pool_block), а не открывает лишнее.
+    """
+
+    def __init__(self, pool_size):
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=0
+        )
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+    def __call__(self, method, url, **kwargs):
+        endpoint = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            metrics.increment(f'telegram.{endpoint}.errors')
+            raise
+        finally:
+            metrics.observe(f'telegram.{endpoint}', time.perf_counter() - started)
+
+    def reuse_rate(self):
+        """Доля запросов, выполненных по уже открытому соединению"""
+        requests_count = connections = 0
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            requests_count += pool.num_requests
+            connections += pool.num_connections
+        if not requests_count:
+            return None
+        return round(1 - connections / requests_count, 3)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def install():
+    """Подключает общий пул к pyTelegramBotAPI и задаёт таймауты из настроек"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            return _session
+        apihelper.CONNECT_TIMEOUT = settings.TELEGRAM_CONNECT_TIMEOUT
+        apihelper.READ_TIMEOUT = settings.TELEGRAM_READ_TIMEOUT
+        _session = TelegramSession(settings.TELEGRAM_POOL_SIZE)
+        apihelper.CUSTOM_REQUEST_SENDER = _session
+        metrics.register_gauge('telegram.pool_reuse_rate', _session.reuse_rate)
+    return _session
@@ -0,0 +1,26 @@
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+
+from bot import start_process
+from bot.admins import admin_registry
+from bot.models import User
+
+
+@override_settings(OUTBOX_DRAIN_IN_PROCESS=False)
+class StartProcessTests(TestCase):
+    def test_admin_ids_are_loaded_before_first_check(self):
+        User.objects.create(telegram_id='1', is_admin=True)
+        User.objects.create(telegram_id='2')
+        self.addCleanup(admin_registry.update, '1', False)
+
+        start_process()
+
+        with self.assertNumQueries(0):
+            self.assertTrue(admin_registry.is_admin(1))
+            self.assertFalse(admin_registry.is_admin(2))
+
+    def test_database_error_does_not_stop_startup(self):
+        with mock.patch('bot.admins.User.objects.filter', side_effect=DatabaseError):
+            start_process()
@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from bot import async_handlers
+from bot.models import Payment, User
+
+
+def callback_update(chat_id, data='payment_menu'):
+    message = SimpleNamespace(chat=SimpleNamespace(id=chat_id), message_id=1)
+    call = SimpleNamespace(id='1', data=data, message=message, from_user=SimpleNamespace(id=chat_id))
+    return SimpleNamespace(
+        update_id=1, message=None, edited_message=None, channel_post=None,
+        edited_channel_post=None, callback_query=call
+    )
+
+
+class PendingPaymentsFallbackTests(TestCase):
+    def test_pending_payment_check_goes_to_sync_pool(self):
+        user = User.objects.create(telegram_id='1')
+        async_handlers._fallback_if_pending(user)
+
+        Payment.objects.create(
+            user=user, yookassa_payment_id='p1', amount=100, payment_month=1, payment_year=2026, pricing_plan='5'
+        )
+        with self.assertRaises(async_handlers.Fallback):
+            async_handlers._fallback_if_pending(user)
+
+
+class DispatchOrderTests(SimpleTestCase):
+    def dispatch(self, update, pending):
+        with mock.patch.object(async_handlers, 'has_pending_updates', return_value=pending), \
+                mock.patch.object(async_handlers, 'process_update_async', mock.AsyncMock(return_value=True)) as handle, \
+                mock.patch.object(async_handlers, 'dispatch_update', return_value=True) as dispatch:
+            self.assertTrue(asyncio.run(async_handlers.dispatch_update_async(update)))
+        return handle, dispatch
+
+    def test_chat_with_queued_sync_updates_stays_in_sync_pool(self):
+        handle, dispatch = self.dispatch(callback_update(1), pending=True)
+        handle.assert_not_awaited()
+        dispatch.assert_called_once()
+
+    def test_idle_chat_is_handled_in_event_loop(self):
+        handle, dispatch = self.dispatch(callback_update(1), pending=False)
+        handle.assert_awaited_once()
+        dispatch.assert_not_called()
+        self.assertEqual(async_handlers._chat_turns, {})
+
+    def test_updates_of_one_chat_run_one_at_a_time(self):
+        order = []
+
+        async def slow_handler(update):
+            order.append(('start', update.update_id))
+            await asyncio.sleep(0.01)
+            order.append(('end', update.update_id))
+            return True
+
+        async def run():
+            first, second = callback_update(1), callback_update(1)
+            second.update_id = 2
+            await asyncio.gather(
+                async_handlers.dispatch_update_async(first),
+                async_handlers.dispatch_update_async(second),
+            )
+
+        with mock.patch.object(async_handlers, 'has_pending_updates', return_value=False), \
+                mock.patch.object(async_handlers, 'process_update_async', slow_handler):
+            asyncio.run(run())
+        self.assertEqual(order, [('start', 1), ('end', 1), ('start', 2), ('end', 2)])
@@ -0,0 +1,44 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+
+from bot.broadcast import Broadcast
+from bot.models import BroadcastDelivery
+
+
+class BroadcastFlushTests(TestCase):
+    """Журнал доставки записывается на любой поддерживаемой СУБД"""
+
+    def outcomes(self, status=BroadcastDelivery.STATUS_SENT):
+        return [('1', status, ''), ('2', BroadcastDelivery.STATUS_FAILED, 'blocked')]
+
+    def test_flush_upserts_on_current_backend(self):
+        broadcast = Broadcast('campaign')
+        broadcast._flush(self.outcomes(BroadcastDelivery.STATUS_FAILED))
+        outcomes = self.outcomes()
+        broadcast._flush(outcomes)
+
+        self.assertEqual(outcomes, [])
+        self.assertEqual(BroadcastDelivery.objects.count(), 2)
+        self.assertEqual(broadcast.delivered_ids(), {'1'})
+
+    def test_flush_without_conflict_target_mysql(self):
+        # Набор возможностей MySQL: upsert есть, но без указания уникальных полей
+        with mock.patch.object(connection.features, 'supports_update_conflicts', True), \
+                mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False), \
+                mock.patch.object(BroadcastDelivery.objects, 'bulk_create') as bulk_create:
+            Broadcast('campaign')._flush(self.outcomes())
+
+        kwargs = bulk_create.call_args.kwargs
+        self.assertTrue(kwargs['update_conflicts'])
+        self.assertIsNone(kwargs['unique_fields'])
+
+    def test_flush_without_upsert_support(self):
+        broadcast = Broadcast('campaign')
+        with mock.patch.object(connection.features, 'supports_update_conflicts', False):
+            broadcast._flush(self.outcomes(BroadcastDelivery.STATUS_FAILED))
+            broadcast._flush(self.outcomes())
+
+        self.assertEqual(BroadcastDelivery.objects.count(), 2)
+        self.assertEqual(broadcast.delivered_ids(), {'1'})
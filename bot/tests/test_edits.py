@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from bot.edits import EditScheduler
+
+
+def callback_message(text, chat_id=1, message_id=1):
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), message_id=message_id, text=text, reply_markup=None)
+
+
+class EditSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.sent = []
+        self.scheduler = EditScheduler(
+            min_interval=0,
+            send=lambda chat_id, message_id, text, reply_markup: self.sent.append(text)
+        )
+
+    def test_unchanged_content_is_not_sent(self):
+        self.scheduler.edit(callback_message('Страница 1'), 'Страница 1')
+        self.assertEqual(self.sent, [])
+
+    def test_edit_after_out_of_band_change_is_sent(self):
+        # Страница 1 -> 2 через планировщик
+        self.scheduler.edit(callback_message('Страница 1'), 'Страница 2')
+        # Карточка ученика и «Назад к списку» правят сообщение напрямую,
+        # следующее «➡️» снова нажато на странице 1
+        self.scheduler.edit(callback_message('Страница 1'), 'Страница 2')
+        self.assertEqual(self.sent, ['Страница 2', 'Страница 2'])
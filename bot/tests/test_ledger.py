@@ -0,0 +1,57 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from bot import ledger
+from bot.models import BalanceTransaction, StudentProfile, User
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(telegram_id='1')
+        self.profile = StudentProfile.objects.create(
+            user=user, profile_name='Профиль', class_number='5', balance=Decimal('1000')
+        )
+
+    def balance(self):
+        return StudentProfile.objects.get(pk=self.profile.pk).balance
+
+    def test_recompute_reports_drift_without_overwriting(self):
+        ledger.debit(self.profile.pk, 300)
+        StudentProfile.objects.filter(pk=self.profile.pk).update(balance=Decimal('900'))
+
+        with self.assertLogs('bot.ledger', 'WARNING'):
+            balance, running = ledger.recompute_balance(self.profile.pk)
+
+        self.assertEqual((balance, running), (Decimal('900'), Decimal('700')))
+        self.assertEqual(self.balance(), Decimal('900'))
+
+    def test_set_balance_records_adjustment(self):
+        ledger.debit(self.profile.pk, 300)
+        ledger.set_balance(self.profile.pk, 1500, description='admin')
+
+        self.assertEqual(self.balance(), Decimal('1500'))
+        self.assertEqual(ledger.get_running_balance(self.profile.pk), Decimal('1500'))
+        adjustment = BalanceTransaction.objects.get(student_profile=self.profile, kind='adjustment')
+        self.assertEqual(adjustment.amount, Decimal('800'))
+
+
+class StudentProfileAdminTests(TestCase):
+    def test_balance_edit_goes_through_ledger(self):
+        from django.contrib.admin.sites import site
+        from django.test import RequestFactory
+
+        user = User.objects.create(telegram_id='1')
+        profile = StudentProfile.objects.create(user=user, profile_name='Профиль', class_number='5')
+        model_admin = site._registry[StudentProfile]
+        request = RequestFactory().post('/')
+        request.user = 'admin'
+        form_class = model_admin.get_form(request, profile, fields=['profile_name', 'balance'])
+        form = form_class({'profile_name': 'Новое имя', 'balance': '250'}, instance=profile)
+        self.assertTrue(form.is_valid(), form.errors)
+
+        model_admin.save_model(request, form.save(commit=False), form, change=True)
+
+        profile.refresh_from_db()
+        self.assertEqual((profile.profile_name, profile.balance), ('Новое имя', Decimal('250')))
+        self.assertEqual(ledger.get_running_balance(profile.pk), Decimal('250'))
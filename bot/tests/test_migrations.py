@@ -0,0 +1,25 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class SyncSchemaMigrationTests(TransactionTestCase):
+    def test_existing_schema_is_left_in_place(self):
+        # Рабочая база, где схему 0005 уже создал makemigrations при деплое
+        executor = MigrationExecutor(connection)
+        migration = executor.loader.get_migration('bot', '0005_sync_models_with_schema')
+        state = executor.loader.project_state(('bot', '0004_user_is_admin_payment_paymenthistory'))
+        executor.recorder.record_unapplied('bot', migration.name)
+
+        statements = []
+
+        def capture(execute, sql, params, many, context):
+            statements.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            executor.apply_migration(state, migration)
+
+        self.assertIn(('bot', migration.name), executor.recorder.applied_migrations())
+        ddl = [sql for sql in statements if sql.lstrip().upper().startswith(('CREATE', 'ALTER', 'DROP'))]
+        self.assertEqual(ddl, [])
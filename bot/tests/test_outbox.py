@@ -0,0 +1,58 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from bot import outbox
+from bot.models import NotificationOutbox
+
+
+@override_settings(OUTBOX_DRAIN_IN_PROCESS=False)
+class DrainTests(TestCase):
+    def setUp(self):
+        for i in range(3):
+            outbox.enqueue(f'test:{i}', chat_id=i, text=f'Уведомление {i}')
+
+    def test_lease_is_renewed_before_each_send(self):
+        leases = []
+
+        def send(chat_id, text):
+            leases.append(NotificationOutbox.objects.get(chat_id=chat_id).locked_until)
+
+        with mock.patch.object(outbox, '_lease_until', side_effect=[
+            timezone.now() + timedelta(seconds=i) for i in range(1, 5)
+        ]):
+            counts = outbox.drain(send=send)
+
+        self.assertEqual(counts['sent'], 3)
+        self.assertEqual(leases, sorted(set(leases)))
+        self.assertFalse(NotificationOutbox.objects.filter(locked_until__isnull=False).exists())
+
+    def test_rows_taken_by_another_drainer_are_left_to_it(self):
+        other_lease = timezone.now() + timedelta(hours=1)
+        sent = []
+
+        def send(chat_id, text):
+            sent.append(chat_id)
+            # Аренда истекла во время отправки, запись забрал другой отправитель
+            NotificationOutbox.objects.filter(chat_id='2').update(locked_until=other_lease)
+
+        counts = outbox.drain(send=send)
+
+        self.assertEqual(sent, ['0', '1'])
+        self.assertEqual(counts['sent'], 2)
+        taken = NotificationOutbox.objects.get(chat_id='2')
+        self.assertEqual(taken.status, NotificationOutbox.STATUS_PENDING)
+        self.assertEqual(taken.locked_until, other_lease)
+
+
+class OutboxDrainerTests(SimpleTestCase):
+    def test_start_drains_backlog_without_wake(self):
+        drained = threading.Event()
+        drainer = outbox.OutboxDrainer(poll_interval=3600)
+
+        with mock.patch.object(outbox, 'drain_all', side_effect=lambda: drained.set()):
+            drainer.start()
+            self.assertTrue(drained.wait(5))
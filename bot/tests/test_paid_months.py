@@ -0,0 +1,32 @@
+from django.test import TestCase
+
+from bot.models import PaymentHistory, User
+from bot.paid_months import get_paid_months, invalidate_paid_months, load_paid_months
+
+
+class PaidMonthsTests(TestCase):
+    def test_only_completed_payments_count_as_paid(self):
+        user = User.objects.create(telegram_id='1')
+        for month, status in ((1, 'completed'), (2, 'pending'), (3, 'cancelled')):
+            PaymentHistory.objects.create(
+                user=user, month=month, year=2026, amount_paid=100, pricing_plan='5', status=status
+            )
+
+        paid_months = load_paid_months(user.pk)
+
+        self.assertTrue(paid_months.is_paid(1, 2026))
+        self.assertFalse(paid_months.is_paid(2, 2026))
+        self.assertFalse(paid_months.is_paid(3, 2026))
+        self.assertEqual(len(paid_months), 1)
+
+    def test_is_month_paid_ignores_process_cache(self):
+        user = User.objects.create(telegram_id='1')
+        self.addCleanup(invalidate_paid_months, user.pk)
+        self.assertFalse(get_paid_months(user.pk).is_paid(1, 2026))
+
+        # Оплата из другого процесса: сигналы этого процесса кэш не сбрасывают
+        PaymentHistory.objects.bulk_create([
+            PaymentHistory(user=user, month=1, year=2026, amount_paid=100, pricing_plan='5', status='completed')
+        ])
+
+        self.assertTrue(PaymentHistory.is_month_paid(user, 1, 2026))
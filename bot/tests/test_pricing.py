@@ -0,0 +1,58 @@
+from django.test import SimpleTestCase
+
+from bot.pricing import PRICING_CONFIG, PricingIndex
+
+
+def legacy_price_by_class(class_info):
+    """Поиск тарифа до PricingIndex: точный ключ, затем подстрока ключевого слова"""
+    if not class_info:
+        return None
+    if class_info in PRICING_CONFIG:
+        return class_info
+    class_info_lower = class_info.lower().strip()
+    for price_key, price_data in PRICING_CONFIG.items():
+        for keyword in price_data['keywords']:
+            if keyword in class_info_lower:
+                return price_key
+    return None
+
+
+class PricingIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = PricingIndex(PRICING_CONFIG)
+
+    def resolve_key(self, class_info):
+        result = self.index.resolve(class_info)
+        return result['key'] if result is not None else None
+
+    def test_matches_legacy_lookup(self):
+        cases = {
+            '1': None,
+            '11': '11',
+            '10_base': '10',
+            '11_profile': '11_profile',
+            '9 класс': '9',
+            '  11 КЛАСС ': '11',
+            'ОГЭ (9 класс)': '9',
+            'неизвестный класс': None,
+            '': None,
+            None: None,
+        }
+        for class_info, key in cases.items():
+            with self.subTest(class_info=class_info):
+                self.assertEqual(legacy_price_by_class(class_info), key)
+                self.assertEqual(self.resolve_key(class_info), key)
+
+    def test_result_matches_config(self):
+        result = self.index.resolve('10_base')
+        data = PRICING_CONFIG['10']
+        self.assertEqual(
+            (result['name'], result['price'], result['description']),
+            (data['name'], data['price'], data['description'])
+        )
+        self.assertEqual(result['rule'], 'keyword:10')
+
+    def test_digit_keywords_match_whole_numbers_only(self):
+        # Намеренное отличие: числа совпадают только целиком, '5' не находится внутри '15'
+        self.assertEqual(legacy_price_by_class('15'), '5')
+        self.assertIsNone(self.resolve_key('15'))
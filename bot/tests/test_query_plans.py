@@ -0,0 +1,20 @@
+from django.db import connection
+from django.test import TestCase
+
+from bot.management.commands.check_query_plans import Command
+
+
+class PaymentQueryPlanTests(TestCase):
+    """Частые запросы к платежам используют индексы из миграций (SQLite и MySQL)"""
+
+    def test_payment_lookups_use_indexes(self):
+        if connection.vendor not in ('sqlite', 'mysql'):
+            self.skipTest(f'планы проверяются только для SQLite и MySQL, а не {connection.vendor}')
+
+        for name, queryset, indexes in Command().get_cases():
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertTrue(
+                    any(index in plan for index in indexes),
+                    f'{name}: ожидался один из индексов {indexes}\n{plan}'
+                )
@@ -0,0 +1,29 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from bot import search
+from bot.models import User
+
+
+class SearchStudentsTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            User.objects.create(telegram_id=f'1{i}', full_name=f'Иван Сидоров{i}')
+        User.objects.create(telegram_id='20', full_name='Иван Петров')
+        User.objects.create(telegram_id='21', full_name='Иван Петровский')
+        User.objects.create(telegram_id='30', full_name='Иван Петров', is_admin=True)
+        search.rebuild_index()
+
+    def test_all_tokens_are_matched_before_candidate_limit(self):
+        # Частое первое слово не вытесняет настоящие совпадения
+        with mock.patch.object(search, 'MAX_CANDIDATES', 3):
+            found = search.search_students('иван петров')
+
+        self.assertEqual(found, [('20', 'Иван Петров'), ('21', 'Иван Петровский')])
+
+    def test_prefix_match_and_yo(self):
+        User.objects.create(telegram_id='40', full_name='Пётр Семёнов')
+        search.reindex_student('40')
+
+        self.assertEqual(search.search_students('петр сем'), [('40', 'Пётр Семёнов')])
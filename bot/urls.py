@@ -10,8 +10,10 @@ app_name = 'bot'
 
 urlpatterns = [
     path(settings.BOT_TOKEN, views.index, name="index"),
+    path(f"{settings.BOT_TOKEN}/async", views.async_index, name="async_index"),
     path('', views.set_webhook, name="set_webhook"),
     path("bot/status/", views.status, name="status"),
+    path("bot/metrics/", staff_member_required(views.bot_metrics), name="bot_metrics"),
     path("yookassa/webhook/", views.yookassa_webhook, name="yookassa_webhook"),
     path("crm/", staff_member_required(views.crm_dashboard), name="crm_dashboard"),
     path("payment-info/", staff_member_required(views.payment_info), name="payment_info"),
@@ -1,8 +1,7 @@
+from collections import namedtuple
 from datetime import datetime
 import json
-from traceback import format_exc
 
-from asgiref.sync import sync_to_async
 from django.shortcuts import render
 from django.contrib.admin.views.decorators import staff_member_required
 from django.db.models import Sum, Count
@@ -16,11 +15,18 @@ from telebot.apihelper import ApiTelegramException
 from telebot.types import Update
 import telebot
 
-from bot import bot, logger
+from bot import bot, logger, setup_bot
+from bot.admins import is_admin
+from bot.async_handlers import dispatch_update_async
+from bot.dispatcher import dispatch_update, instrument_handlers
+from bot.metrics import metrics
+from bot.router import router
+from bot.states import find_state
 from bot.handlers.admin.admin import (
     admin_menu,
     admin_menu_callback,
     handle_view_students,
+    handle_search_students,
     handle_students_page,
     handle_select_student,
     handle_view_payment_history,
@@ -58,143 +64,109 @@ def handle_start_command(message):
 
 bot.register_message_handler(admin_menu, commands=['admin'])
 
-# Регистрируем callback обработчики для просмотра учеников
-bot.register_callback_query_handler(
-    handle_view_students,
-    func=lambda call: call.data == "view_students"
-)
-
-bot.register_callback_query_handler(
-    handle_students_page,
-    func=lambda call: call.data.startswith("students_page_")
-)
-
-bot.register_callback_query_handler(
-    handle_select_student,
-    func=lambda call: call.data.startswith("select_student_")
-)
-
-bot.register_callback_query_handler(
-    handle_view_payment_history,
-    func=lambda call: call.data.startswith("view_payment_history_")
+# Регистрируем обработчик текстовых сообщений от админов (кроме команд)
+bot.register_message_handler(
+    handle_admin_text_input,
+    func=lambda msg: not msg.text.startswith('/') and is_admin(msg.from_user.id)
 )
 
-bot.register_callback_query_handler(
-    handle_mark_payment_for_student,
-    func=lambda call: call.data.startswith("mark_payment_for_student_")
-)
 
-# Регистрируем callback обработчики для отметки оплаты
-bot.register_callback_query_handler(
-    handle_mark_student_payment,
-    func=lambda call: call.data == "mark_student_payment"
-)
+# Месяцы отчёта по оплатам (от декабря к январю)
+REPORT_MONTHS = [
+    (12, 'Декабрь'), (11, 'Ноябрь'), (10, 'Октябрь'), (9, 'Сентябрь'),
+    (8, 'Август'), (7, 'Июль'), (6, 'Июнь'), (5, 'Май'),
+    (4, 'Апрель'), (3, 'Март'), (2, 'Февраль'), (1, 'Январь'),
+]
 
-bot.register_callback_query_handler(
-    handle_admin_mark_payment,
-    func=lambda call: call.data.startswith("admin_mark_payment_")
-)
+# Запись об оплате месяца профилем (для шаблона: как PaymentHistory)
+PaidRecord = namedtuple('PaidRecord', ['student_profile', 'amount_paid', 'pricing_plan'])
 
-# Регистрируем обработчики для выбора способа оплаты админом
-bot.register_callback_query_handler(
-    handle_admin_payment_method_selection,
-    func=lambda call: call.data.startswith("admin_month_payment_") or call.data.startswith("admin_balance_payment_")
-)
 
-# Регистрируем обработчик текстовых сообщений от админов (кроме команд)
-bot.register_message_handler(
-    handle_admin_text_input,
-    func=lambda msg: not msg.text.startswith('/') and User.objects.filter(telegram_id=str(msg.from_user.id), is_admin=True).exists()
-)
+def _int_param(params, name):
+    try:
+        return int(params.get(name, ''))
+    except ValueError:
+        return None
 
 
 def payment_info(request):
     # Переходим на уровень профилей учеников (а не пользователей)
-    all_profiles = StudentProfile.objects.select_related('user').all()
+    params = request.POST if request.method == 'POST' else request.GET
+    all_profiles = StudentProfile.objects.only('id', 'profile_name', 'class_number', 'register_date')
 
-    if request.method == 'POST':
-        course = request.POST.get('course', '*')
-        if course != "*":
-            all_profiles = all_profiles.filter(class_number=course)
+    course = params.get('course', '*')
+    if course != "*":
+        all_profiles = all_profiles.filter(class_number=course)
+    year_filter = _int_param(params, 'year')
+    month_filter = _int_param(params, 'month')
 
     # Получаем все года из PaymentHistory И из Payment (на случай если webhook не обработался)
-    years_from_history = set(PaymentHistory.objects.values_list('year', flat=True))
-    years_from_payments = set(Payment.objects.filter(status='succeeded').values_list('payment_year', flat=True))
-    years = years_from_history | years_from_payments
-    if len(years) == 0:
-        years = [datetime.now().year]
+    all_years = set(
+        PaymentHistory.objects.order_by().values_list('year', flat=True).distinct().union(
+            Payment.objects.filter(status='succeeded').order_by().values_list('payment_year', flat=True).distinct()
+        )
+    )
+    if year_filter is not None:
+        years = [year_filter]
+    else:
+        years = all_years or [datetime.now().year]
+
+    history = PaymentHistory.objects.filter(
+        student_profile__in=all_profiles.values('id'),
+        status='completed'
+    )
+    # Успешные платежи учитываются на случай, если webhook не обработался
+    payments = Payment.objects.filter(
+        student_profile__in=all_profiles.values('id'),
+        status='succeeded'
+    )
+    if year_filter is not None:
+        history = history.filter(year=year_filter)
+        payments = payments.filter(payment_year=year_filter)
+    if month_filter is not None:
+        history = history.filter(month=month_filter)
+        payments = payments.filter(payment_month=month_filter)
+
+    # Матрица оплат: (профиль, год, месяц) -> (сумма, тариф); PaymentHistory важнее Payment
+    paid = {}
+    for profile_id, year, month, amount, pricing_plan in payments.values_list(
+            'student_profile_id', 'payment_year', 'payment_month', 'amount', 'pricing_plan').order_by('created_at'):
+        paid[profile_id, year, month] = (amount, pricing_plan)
+    for profile_id, year, month, amount, pricing_plan in history.values_list(
+            'student_profile_id', 'year', 'month', 'amount_paid', 'pricing_plan').order_by('-id'):
+        paid[profile_id, year, month] = (amount, pricing_plan)
+
+    profiles = list(all_profiles)
+    months = [item for item in REPORT_MONTHS if month_filter is None or item[0] == month_filter]
 
     all_info = []
     total_income = 0
 
     for year in sorted(years, reverse=True):  # Сортируем года по убыванию
-        year_info = {
-            'date': year,
-            'months': [
-                {'title': 'Декабрь', 'id': 12, 'paid_users': [], 'unpaid_users': [], 'payers_count': 0, 'all_users': 0, 'is_paid': False},
-                {'title': 'Ноябрь', 'id': 11, 'paid_users': [], 'unpaid_users': [], 'payers_count': 0, 'all_users': 0, 'is_paid': False},
-                {'title': 'Октябрь', 'id': 10, 'paid_users': [], 'unpaid_users': [], 'payers_count': 0, 'all_users': 0, 'is_paid': False},
-                {'title': 'Сентябрь', 'id': 9, 'paid_users': [], 'unpaid_users': [], 'payers_count': 0, 'all_users': 0, 'is_paid': False},
-                {'title': 'Август', 'id': 8, 'paid_users': [], 'unpaid_users': [], 'payers_count': 0, 'all_users': 0, 'is_paid': False},
-                {'title': 'Июль', 'id': 7, 'paid_users': [], 'unpaid_users': [], 'payers_count': 0, 'all_users': 0, 'is_paid': False},
-                {'title': 'Июнь', 'id': 6, 'paid_users': [], 'unpaid_users': [], 'payers_count': 0, 'all_users': 0, 'is_paid': False},
-                {'title': 'Май', 'id': 5, 'paid_users': [], 'unpaid_users': [], 'payers_count': 0, 'all_users': 0, 'is_paid': False},
-                {'title': 'Апрель', 'id': 4, 'paid_users': [], 'unpaid_users': [], 'payers_count': 0, 'all_users': 0, 'is_paid': False},
-                {'title': 'Март', 'id': 3, 'paid_users': [], 'unpaid_users': [], 'payers_count': 0, 'all_users': 0, 'is_paid': False},
-                {'title': 'Февраль', 'id': 2, 'paid_users': [], 'unpaid_users': [], 'payers_count': 0, 'all_users': 0, 'is_paid': False},
-                {'title': 'Январь', 'id': 1, 'paid_users': [], 'unpaid_users': [], 'payers_count': 0, 'all_users': 0, 'is_paid': False},
-            ]
-        }
-
-        for month in year_info['months']:
-            month['all_users'] = 0
-            month['paid_users'] = []
-            month['unpaid_users'] = []
-
-            for profile in all_profiles:
+        year_info = {'date': year, 'months': []}
+
+        for month_id, title in months:
+            month = {'title': title, 'id': month_id, 'paid_users': [], 'unpaid_users': [],
+                     'payers_count': 0, 'all_users': 0, 'is_paid': False}
+
+            for profile in profiles:
                 # учитываем дату регистрации профиля - показываем только тех, кто был зарегистрирован к этому месяцу
-                if profile.register_date.year < year or (profile.register_date.year == year and profile.register_date.month <= month['id']):
-                    month['all_users'] += 1
-
-                    # Проверяем оплату в PaymentHistory
-                    ph_qs = PaymentHistory.objects.filter(
-                        month=month["id"],
-                        year=year,
-                        user=profile.user,
-                        student_profile=profile,
-                        status='completed'
-                    )
-
-                    # Также проверяем успешные платежи в Payment (на случай если webhook не обработался)
-                    payment_qs = Payment.objects.filter(
-                        payment_month=month["id"],
-                        payment_year=year,
-                        user=profile.user,
-                        student_profile=profile,
-                        status='succeeded'
-                    )
-
-                    if ph_qs.exists() or payment_qs.exists():
-                        month['payers_count'] += 1
-                        month['is_paid'] = True
-
-                        # Предпочитаем PaymentHistory, но если его нет, используем Payment
-                        if ph_qs.exists():
-                            payment_record = ph_qs.first()
-                        else:
-                            payment_obj = payment_qs.first()
-                            # Создаем временный объект, похожий на PaymentHistory для шаблона
-                            class TempPaymentRecord:
-                                def __init__(self, payment_obj, profile):
-                                    self.student_profile = profile
-                                    self.amount_paid = payment_obj.amount
-                                    self.pricing_plan = payment_obj.pricing_plan
-                            payment_record = TempPaymentRecord(payment_obj, profile)
-
-                        month['paid_users'].append(payment_record)
-                        total_income += payment_record.amount_paid
-                    else:
-                        month['unpaid_users'].append(profile)
+                if (profile.register_date.year, profile.register_date.month) > (year, month_id):
+                    continue
+                month['all_users'] += 1
+
+                record = paid.get((profile.id, year, month_id))
+                if record is None:
+                    month['unpaid_users'].append(profile)
+                    continue
+
+                amount, pricing_plan = record
+                month['payers_count'] += 1
+                month['is_paid'] = True
+                month['paid_users'].append(PaidRecord(profile, amount, pricing_plan))
+                total_income += amount
+
+            year_info['months'].append(month)
 
         all_info.append(year_info)
 
@@ -202,8 +174,13 @@ def payment_info(request):
         'all_info': all_info,
         'now_year': datetime.now().year,
         'now_month': datetime.now().month,
-        'total_students': all_profiles.count(),
-        'total_income': total_income
+        'total_students': len(profiles),
+        'total_income': total_income,
+        'years': sorted(all_years, reverse=True),
+        'months': REPORT_MONTHS,
+        'selected_course': course,
+        'selected_year': year_filter,
+        'selected_month': month_filter,
     })
 
 
@@ -211,22 +188,34 @@ def payment_info(request):
 def index(request):
     if request.method == "POST":
         json_str = request.body.decode('UTF-8')
-        logger.info(f"Received webhook data: {json_str}")
-        
         update = telebot.types.Update.de_json(json_str)
-        logger.info(f"Parsed update: {update}")
+        # Полное тело обновления - только при LOG_LEVEL=DEBUG и с выборкой
+        logger.debug("Update received: %s", json_str, extra={'update_id': update.update_id, 'sample': 'telegram.update'})
         
-        try:
-            bot.process_new_updates([update])
-            logger.info("Successfully processed update")
-        except Exception as e:
-            logger.error(f"Error processing update: {e}")
-            logger.error(f"Traceback: {format_exc()}")
+        # Отвечаем Telegram сразу, обработка идёт в пуле потоков
+        if not dispatch_update(update):
+            logger.warning(f"Update queue is full, update {update.update_id} rejected")
+            return HttpResponse("", status=503)
         
         return HttpResponse("")
     return HttpResponse("Bot is running")
 
 
+@csrf_exempt
+async def async_index(request):
+    """Webhook для ASGI: частые callback-запросы обрабатываются в цикле событий"""
+    if request.method == "POST":
+        update = Update.de_json(request.body.decode('UTF-8'))
+        logger.debug("Update received", extra={'update_id': update.update_id, 'sample': 'telegram.update'})
+
+        # Частые callback-запросы - в цикле событий, остальные - в синхронный пул обработки
+        if not await dispatch_update_async(update):
+            logger.warning(f"Update queue is full, update {update.update_id} rejected")
+            return HttpResponse("", status=503)
+        return HttpResponse("")
+    return HttpResponse("Bot is running")
+
+
 @require_GET
 def set_webhook(request: HttpRequest) -> JsonResponse:
     """Setting webhook."""
@@ -235,7 +224,10 @@ def set_webhook(request: HttpRequest) -> JsonResponse:
         bot.remove_webhook()
         
         # Устанавливаем новый webhook
-        bot.set_webhook(url=f"{settings.HOOK}/bot/{settings.BOT_TOKEN}")
+        path = f"{settings.BOT_TOKEN}/async" if settings.BOT_ASYNC_WEBHOOK else settings.BOT_TOKEN
+        bot.set_webhook(url=f"{settings.HOOK}/bot/{path}")
+        # Регистрируем команды бота (при импорте бот больше не обращается к сети)
+        setup_bot()
         bot.send_message(settings.OWNER_ID, "webhook set")
         return JsonResponse({"message": "Webhook set successfully"}, status=200)
     except Exception as e:
@@ -248,6 +240,12 @@ def status(request: HttpRequest) -> JsonResponse:
     return JsonResponse({"message": "OK"}, status=200)
 
 
+@require_GET
+def bot_metrics(request: HttpRequest) -> JsonResponse:
+    """Метрики обработки обновлений: глубина очереди, задержки обработчиков"""
+    return JsonResponse(metrics.snapshot(), status=200)
+
+
 @csrf_exempt
 @require_POST
 def yookassa_webhook(request):
@@ -258,22 +256,17 @@ def yookassa_webhook(request):
         # Получаем данные из POST запроса
         webhook_data = json.loads(request.body.decode('utf-8'))
 
-        logger.info(f"Получен webhook от ЮKassa: {webhook_data}")
+        logger.info(
+            "Получен webhook от ЮKassa",
+            extra={'event': webhook_data.get('event'), 'payment_id': (webhook_data.get('object') or {}).get('id')}
+        )
 
         # Обрабатываем webhook через функцию из yookassa_client
         from bot.yookassa_client import process_webhook
         success = process_webhook(webhook_data)
 
         if success:
-            # Если платеж успешно обработан, отправляем уведомления
-            event_type = webhook_data.get('event')
-            if event_type == 'payment.succeeded':
-                payment_id = webhook_data.get('object', {}).get('id')
-                if payment_id:
-                    # Вызываем функцию отправки уведомлений
-                    from bot.handlers.payments import notify_payment_success
-                    notify_payment_success(payment_id)
-
+            # Уведомления записаны в очередь вместе с платежом и отправляются после ответа
             return JsonResponse({"status": "ok"}, status=200)
         else:
             logger.error("Ошибка обработки webhook от ЮKassa")
@@ -340,113 +333,69 @@ def start_polling(request: HttpRequest) -> JsonResponse:
 
 # Обработчик команды /start удален - используется тестовый обработчик выше
 
-bot.register_callback_query_handler(menu_call, func=lambda c: c.data == "main_menu")
-
-# Обработчики для профилей
-bot.register_callback_query_handler(profiles_menu, func=lambda c: c.data == "profiles_menu")
-bot.register_callback_query_handler(view_profiles, func=lambda c: c.data == "view_profiles")
-bot.register_callback_query_handler(create_profile, func=lambda c: c.data == "create_profile")
-bot.register_callback_query_handler(confirm_profile_creation, func=lambda c: c.data == "confirm_profile_creation")
-
-# Обработчики для выбора профиля
-@bot.callback_query_handler(func=lambda call: call.data.startswith("select_profile_"))
-def handle_profile_selection(call):
-    """Обрабатывает выбор профиля"""
-    from bot.handlers.profiles import select_profile
-    select_profile(call)
-
-# Обработчики для переключения профиля
-@bot.callback_query_handler(func=lambda call: call.data.startswith("switch_to_profile_"))
-def handle_profile_switch(call):
-    """Обрабатывает переключение на профиль"""
-    from bot.handlers.profiles import switch_to_profile
-    switch_to_profile(call)
-
-# Обработчики для управления данными профиля
-@bot.callback_query_handler(func=lambda call: call.data.startswith("edit_profile_data_"))
-def handle_profile_data_management(call):
-    """Обрабатывает управление данными профиля"""
-    from bot.handlers.profiles import edit_profile_data
-    edit_profile_data(call)
-
-# Обработчики для удаления профиля
-@bot.callback_query_handler(func=lambda call: call.data.startswith("delete_profile_"))
-def handle_profile_deletion(call):
-    """Обрабатывает удаление профиля"""
-    from bot.handlers.profiles import delete_profile
-    delete_profile(call)
-
-# Обработчики для подтверждения удаления профиля
-@bot.callback_query_handler(func=lambda call: call.data.startswith("confirm_delete_profile_"))
-def handle_profile_deletion_confirmation(call):
-    """Обрабатывает первое подтверждение удаления профиля"""
-    from bot.handlers.profiles import confirm_delete_profile
-    confirm_delete_profile(call)
-
-# Обработчики для финального удаления профиля
-@bot.callback_query_handler(func=lambda call: call.data.startswith("final_delete_profile_"))
-def handle_profile_final_deletion(call):
-    """Обрабатывает финальное удаление профиля"""
-    from bot.handlers.profiles import final_delete_profile
-    final_delete_profile(call)
-
-# Обработчики для создания профиля
-@bot.callback_query_handler(func=lambda call: call.data.startswith("profile_class_"))
-def handle_profile_class_selection(call):
-    """Обрабатывает выбор класса для профиля"""
-    from bot.handlers.profiles import handle_profile_class_choice
-    handle_profile_class_choice(call)
-
 # Обработчики для регистрации и создания профилей
 @bot.message_handler(func=lambda message: not message.text.startswith('/'))
 def handle_all_messages(message):
     """Обрабатывает все текстовые сообщения для регистрации и создания профилей (кроме команд)"""
-    from bot.handlers.registration import handle_registration_message, is_user_registering
-    from bot.handlers.profiles import handle_profile_creation_message, is_user_creating_profile
+    from bot.handlers.registration import handle_registration_message, registration_states
+    from bot.handlers.profiles import handle_profile_creation_message, profile_creation_states
     
-    # Проверяем, находится ли пользователь в процессе создания профиля
-    if is_user_creating_profile(str(message.from_user.id)):
-        handle_profile_creation_message(message)
-    # Проверяем, находится ли пользователь в процессе регистрации
-    elif is_user_registering(str(message.from_user.id)):
-        handle_registration_message(message)
-
-# Обработчики для выбора класса
-@bot.callback_query_handler(func=lambda call: call.data.startswith("class_"))
-def handle_class_selection(call):
-    """Обрабатывает выбор класса"""
-    from bot.handlers.registration import handle_class_choice
-    handle_class_choice(call)
+    # Состояние читается один раз: сначала создание профиля, затем регистрация
+    store, state = find_state(str(message.from_user.id), profile_creation_states, registration_states)
+    if store is profile_creation_states:
+        handle_profile_creation_message(message, state)
+    elif store is registration_states:
+        handle_registration_message(message, state)
+
+
+"""Callback routes"""
+
+# Главное меню
+router.exact("main_menu", menu_call)
+
+# Обработчики для профилей
+router.exact("profiles_menu", profiles_menu)
+router.exact("view_profiles", view_profiles)
+router.exact("create_profile", create_profile)
+router.exact("confirm_profile_creation", confirm_profile_creation)
+router.prefix("select_profile_", select_profile, int)
+router.prefix("switch_to_profile_", switch_to_profile, int)
+router.prefix("edit_profile_data_", edit_profile_data, int)
+router.prefix("delete_profile_", delete_profile, int)
+router.prefix("confirm_delete_profile_", confirm_delete_profile, int)
+router.prefix("final_delete_profile_", final_delete_profile, int)
+router.prefix("profile_class_", handle_profile_class_choice)
+
+# Обработчики для регистрации
+router.prefix("class_", handle_class_choice)
 
 # Обработчики платежей
-bot.register_callback_query_handler(start_payment, func=lambda c: c.data == "start_payment")
-bot.register_callback_query_handler(payment_history, func=lambda c: c.data == "payment_history")
-bot.register_callback_query_handler(payment_method, func=lambda c: c.data == "payment_method")
-bot.register_callback_query_handler(payment_menu, func=lambda c: c.data == "payment_menu")
-
-# Обработчик для возврата в админ меню
-admin_menu_callback_handler = bot.callback_query_handler(lambda c: c.data == "admin_menu")(admin_menu_callback)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("pay_month_"))
-def handle_payment_month_selection(call):
-    """Обрабатывает выбор месяца для оплаты"""
-    from bot.handlers.payments import select_payment_month
-    select_payment_month(call)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("check_payment_"))
-def handle_payment_check(call):
-    """Обрабатывает проверку оплаты"""
-    from bot.handlers.payments import check_payment
-    check_payment(call)
-
-@bot.callback_query_handler(func=lambda call: call.data in ["pay_with_yookassa", "pay_with_balance"])
-def handle_payment_method_selection(call):
-    """Обрабатывает выбор способа оплаты"""
-    from bot.handlers.payments import select_payment_method
-    select_payment_method(call)
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith("pay_balance_month_"))
-def handle_balance_payment_month_selection(call):
-    """Обрабатывает выбор месяца для оплаты с баланса"""
-    from bot.handlers.payments import select_balance_payment_month
-    select_balance_payment_month(call)
\ No newline at end of file
+router.exact("start_payment", start_payment)
+router.exact("payment_history", payment_history)
+router.exact("payment_method", payment_method)
+router.exact("payment_menu", payment_menu)
+router.exact("pay_with_yookassa", select_payment_method)
+router.exact("pay_with_balance", select_payment_method)
+router.prefix("pay_month_", select_payment_month, int, int)
+router.prefix("pay_balance_month_", select_balance_payment_month, int, int)
+router.prefix("check_payment_", check_payment, str, int, int)
+
+# Обработчики админ-панели
+router.exact("admin_menu", admin_menu_callback)
+router.exact("view_students", handle_view_students)
+router.exact("search_students", handle_search_students)
+router.exact("mark_student_payment", handle_mark_student_payment)
+router.prefix("students_page_", handle_students_page, int, str, str)
+router.prefix("select_student_", handle_select_student)
+router.prefix("view_payment_history_", handle_view_payment_history)
+router.prefix("mark_payment_for_student_", handle_mark_payment_for_student)
+router.prefix("admin_month_payment_", handle_admin_payment_method_selection)
+router.prefix("admin_balance_payment_", handle_admin_payment_method_selection)
+router.prefix("admin_mark_payment_", handle_admin_mark_payment, str, int, int)
+
+# Все callback-запросы разрешаются маршрутизатором
+bot.register_callback_query_handler(router.dispatch, func=lambda call: True)
+
+
+# Замер времени выполнения всех зарегистрированных обработчиков
+instrument_handlers(bot)
@@ -1,35 +1,26 @@
+import logging
 import uuid
+import random
+import threading
+import time
 import requests
 import json
-import os
 from django.conf import settings
 from decimal import Decimal
+from requests.adapters import HTTPAdapter
+
+from bot.metrics import metrics
+
+
+# Ответы ЮKassa, после которых запрос можно повторить с тем же Idempotence-Key
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
 
 
 class YooKassaClient:
     """Клиент для работы с API ЮKassa"""
     
     def __init__(self):
-        import logging
         logger = logging.getLogger('bot')
-        logger.info("==========================================")
-        logger.info("Инициализация YooKassa клиента")
-        logger.info("------------------------------------------")
-        
-        # Проверяем все переменные окружения
-        env_vars = {
-            'LOCAL': os.getenv('LOCAL'),
-            'DEBUG': settings.DEBUG,
-            'BOT_TOKEN': os.getenv('BOT_TOKEN'),
-            'YOOKASSA_SHOP_ID': os.getenv('YOOKASSA_SHOP_ID'),
-            'YOOKASSA_SECRET_KEY': bool(os.getenv('YOOKASSA_SECRET_KEY')),  # только наличие
-            'YOOKASSA_TEST_MODE': os.getenv('YOOKASSA_TEST_MODE')
-        }
-        
-        for key, value in env_vars.items():
-            logger.info(f"{key}: {value}")
-        
-        logger.info("------------------------------------------")
         
         # Проверяем настройки Django
         self.shop_id = settings.YOOKASSA_SHOP_ID
@@ -45,7 +36,6 @@ class YooKassaClient:
             raise ValueError(error_msg)
         
         self.test_mode = settings.YOOKASSA_TEST_MODE
-        logger.info(f"Режим работы YooKassa: {'тестовый' if self.test_mode else 'боевой'}")
         
         # URL для API ЮKassa
         self.base_url = "https://api.yookassa.ru/v3"
@@ -57,8 +47,67 @@ class YooKassaClient:
             logger.error(error_msg)
             raise ValueError(error_msg)
             
-        logger.info("YooKassa клиент успешно инициализирован")
-        logger.info("==========================================")
+        # Одна keep-alive сессия с пулом соединений на процесс
+        self.timeout = (settings.YOOKASSA_CONNECT_TIMEOUT, settings.YOOKASSA_READ_TIMEOUT)
+        self.max_retries = settings.YOOKASSA_MAX_RETRIES
+        self.session = self._build_session()
+        
+        logger.info("YooKassa клиент инициализирован", extra={'test_mode': self.test_mode})
+    
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.YOOKASSA_POOL_SIZE,
+            max_retries=0
+        )
+        session.mount('https://', adapter)
+        session.auth = self.auth
+        session.headers.update({
+            'User-Agent': 'YooKassa-Bot/1.0',
+            'Accept': 'application/json',
+            'Accept-Charset': 'utf-8',
+        })
+        return session
+    
+    def _request(self, method, path, endpoint, json_data=None, idempotence_key=None):
+        """
+        Выполняет запрос к API через общую сессию.
+        
+        Сетевые ошибки, таймауты и ответы 429/5xx повторяются с экспоненциальной
+        задержкой и случайным разбросом. POST-запросы повторяются с тем же
+        Idempotence-Key, поэтому ЮKassa не создаст дубликат операции.
+        
+        Returns:
+            requests.Response: ответ последней попытки
+        """
+        url = f"{self.base_url}{path}"
+        headers = {}
+        if method == 'POST':
+            headers['Idempotence-Key'] = idempotence_key or str(uuid.uuid4())
+        
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    headers=headers,
+                    json=json_data,
+                    timeout=self.timeout
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                metrics.increment(f'yookassa.{endpoint}.errors')
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+            finally:
+                metrics.observe(f'yookassa.{endpoint}', time.perf_counter() - started)
+            
+            metrics.increment(f'yookassa.{endpoint}.retries')
+            time.sleep(random.uniform(0, 0.5 * 2 ** attempt))
     
     def create_payment(self, amount, description, return_url=None, metadata=None):
         """
@@ -73,15 +122,8 @@ class YooKassaClient:
         Returns:
             dict: Ответ от API ЮKassa
         """
-        import logging
         logger = logging.getLogger('bot')
-        logger.info(f"Создание платежа в YooKassa:")
-        logger.info(f"Shop ID: {self.shop_id}")
-        logger.info(f"Test Mode: {self.test_mode}")
-        logger.info(f"Amount: {amount}")
-        logger.info(f"Description: {description}")
-        logger.info(f"Return URL: {return_url}")
-        logger.info(f"Metadata: {metadata}")
+        logger.info("Создание платежа в YooKassa", extra={'amount': str(amount), 'test_mode': self.test_mode})
         url = f"{self.base_url}/payments"
         
         payment_data = {
@@ -118,60 +160,26 @@ class YooKassaClient:
         if metadata:
             payment_data["metadata"] = metadata
         
-        headers = {
-            "Idempotence-Key": str(uuid.uuid4()),
-            "Content-Type": "application/json"
-        }
+        idempotence_key = str(uuid.uuid4())
         
         try:
-            print(f"Отправляем запрос к ЮKassa: {url}")
-            print(f"Данные платежа: {json.dumps(payment_data, ensure_ascii=False, indent=2)}")
-            
-            # Настройки для более надежного соединения
-            session = requests.Session()
-            
-            # Используем более простой подход, как в curl
             try:
-                logger.info("==========================================")
-                logger.info("Отправка запроса к YooKassa")
-                logger.info("------------------------------------------")
-                
-                # Добавляем User-Agent и другие заголовки
-                headers['User-Agent'] = 'YooKassa-Bot/1.0'
-                headers['Accept'] = 'application/json'
-                headers['Accept-Charset'] = 'utf-8'
-                
-                # Логируем детали запроса
-                logger.info("Параметры запроса:")
-                logger.info(f"URL: {url}")
-                logger.info(f"Headers: {headers}")
-                logger.info(f"Auth present: {bool(self.auth)}")
-                logger.info(f"Test mode: {self.test_mode}")
-                logger.info("Payment Data:")
-                logger.info(json.dumps(payment_data, ensure_ascii=False, indent=2))
-                
-                logger.info("------------------------------------------")
-                logger.info("Отправка запроса...")
+                logger.debug("Запрос к YooKassa: %s", json.dumps(payment_data, ensure_ascii=False),
+                             extra={'idempotence_key': idempotence_key})
                 
-                # Устанавливаем увеличенные таймауты
-                response = session.post(
-                    url,
-                    auth=self.auth,
-                    headers=headers,
-                    json=payment_data,
-                    timeout=(30, 60)  # (connect timeout, read timeout)
+                # Повторы при сбоях идут с тем же Idempotence-Key
+                response = self._request(
+                    'POST',
+                    '/payments',
+                    'create_payment',
+                    json_data=payment_data,
+                    idempotence_key=idempotence_key
                 )
                 
-                logger.info("Ответ получен:")
-                logger.info(f"Статус код: {response.status_code}")
-                logger.info(f"Заголовки ответа: {dict(response.headers)}")
-                logger.info("Тело ответа:")
-                try:
-                    response_json = response.json()
-                    logger.info(json.dumps(response_json, ensure_ascii=False, indent=2))
-                except:
-                    logger.info(response.text[:1000])  # Логируем первую 1000 символов если не JSON
-                logger.info("==========================================")
+                logger.info(
+                    "Ответ YooKassa на создание платежа",
+                    extra={'status_code': response.status_code, 'idempotence_key': idempotence_key}
+                )
                 
             except requests.exceptions.SSLError as e:
                 error_msg = f"❌ SSL ошибка при подключении к ЮKassa: {e}"
@@ -190,9 +198,6 @@ class YooKassaClient:
                 logger.error(error_msg)
                 raise Exception(error_msg)
             
-            print(f"Статус ответа: {response.status_code}")
-            print(f"Заголовки ответа: {dict(response.headers)}")
-            
             if response.status_code >= 400:
                 try:
                     error_data = response.json()
@@ -210,7 +215,7 @@ class YooKassaClient:
             
             response.raise_for_status()
             result = response.json()
-            print(f"Успешный ответ: {json.dumps(result, ensure_ascii=False, indent=2)}")
+            logger.debug("Ответ YooKassa: %s", json.dumps(result, ensure_ascii=False))
             
             # Проверяем наличие URL для оплаты
             if 'confirmation' in result and 'confirmation_url' in result['confirmation']:
@@ -221,28 +226,32 @@ class YooKassaClient:
                     }
                 }
             else:
-                print("❌ В ответе нет URL для оплаты")
+                logger.error("В ответе YooKassa нет URL для оплаты", extra={'payment_id': result.get('id')})
                 return None
             
         except requests.exceptions.ConnectTimeout:
-            print("❌ Таймаут соединения с ЮKassa")
+            logger.error("Таймаут соединения с YooKassa", extra={'endpoint': 'create_payment'})
             return None
         except requests.exceptions.ReadTimeout:
-            print("❌ Таймаут чтения ответа от ЮKassa")
+            logger.error("Таймаут чтения ответа YooKassa", extra={'endpoint': 'create_payment'})
             return None
         except requests.exceptions.SSLError as e:
-            print(f"❌ Ошибка SSL: {e}")
+            logger.error("Ошибка SSL при запросе к YooKassa", extra={'endpoint': 'create_payment', 'error': str(e)})
             return None
         except requests.exceptions.ConnectionError as e:
-            print(f"❌ Ошибка соединения: {e}")
+            logger.error("Ошибка соединения с YooKassa", extra={'endpoint': 'create_payment', 'error': str(e)})
             return None
         except requests.exceptions.RequestException as e:
-            print(f"❌ Ошибка при создании платежа: {e}")
-            print(f"Тип ошибки: {type(e).__name__}")
+            logger.error(
+                "Ошибка при создании платежа в YooKassa",
+                extra={'endpoint': 'create_payment', 'error': str(e), 'error_type': type(e).__name__}
+            )
             return None
         except Exception as e:
-            print(f"❌ Неожиданная ошибка: {e}")
-            print(f"Тип ошибки: {type(e).__name__}")
+            logger.error(
+                "Ошибка при создании платежа в YooKassa",
+                extra={'endpoint': 'create_payment', 'error': str(e), 'error_type': type(e).__name__}
+            )
             return None
     
     def get_payment(self, payment_id):
@@ -255,14 +264,15 @@ class YooKassaClient:
         Returns:
             dict: Информация о платеже
         """
-        url = f"{self.base_url}/payments/{payment_id}"
-        
         try:
-            response = requests.get(url, auth=self.auth)
+            response = self._request('GET', f"/payments/{payment_id}", 'get_payment')
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
-            print(f"Ошибка при получении информации о платеже: {e}")
+            logger.error(
+                "Ошибка при получении информации о платеже",
+                extra={'endpoint': 'get_payment', 'payment_id': payment_id, 'error': str(e)}
+            )
             return None
     
     def capture_payment(self, payment_id, amount=None):
@@ -276,8 +286,6 @@ class YooKassaClient:
         Returns:
             dict: Ответ от API ЮKassa
         """
-        url = f"{self.base_url}/payments/{payment_id}/capture"
-        
         capture_data = {}
         if amount is not None:
             capture_data["amount"] = {
@@ -285,22 +293,20 @@ class YooKassaClient:
                 "currency": "RUB"
             }
         
-        headers = {
-            "Idempotence-Key": str(uuid.uuid4()),
-            "Content-Type": "application/json"
-        }
-        
         try:
-            response = requests.post(
-                url,
-                auth=self.auth,
-                headers=headers,
-                json=capture_data
+            response = self._request(
+                'POST',
+                f"/payments/{payment_id}/capture",
+                'capture_payment',
+                json_data=capture_data
             )
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
-            print(f"Ошибка при подтверждении платежа: {e}")
+            logger.error(
+                "Ошибка при подтверждении платежа",
+                extra={'endpoint': 'capture_payment', 'payment_id': payment_id, 'error': str(e)}
+            )
             return None
     
     def cancel_payment(self, payment_id):
@@ -313,42 +319,53 @@ class YooKassaClient:
         Returns:
             dict: Ответ от API ЮKassa
         """
-        url = f"{self.base_url}/payments/{payment_id}/cancel"
-        
-        headers = {
-            "Idempotence-Key": str(uuid.uuid4()),
-            "Content-Type": "application/json"
-        }
-        
         try:
-            response = requests.post(
-                url,
-                auth=self.auth,
-                headers=headers,
-                json={}
+            response = self._request(
+                'POST',
+                f"/payments/{payment_id}/cancel",
+                'cancel_payment',
+                json_data={}
             )
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
-            print(f"Ошибка при отмене платежа: {e}")
+            logger.error(
+                "Ошибка при отмене платежа",
+                extra={'endpoint': 'cancel_payment', 'payment_id': payment_id, 'error': str(e)}
+            )
             return None
 
 
-# Создаем глобальный экземпляр клиента
-client = YooKassaClient()
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Возвращает общий для процесса экземпляр клиента, создавая его при первом обращении
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = YooKassaClient()
+    return _client
 
 
 def create_payment(amount, description, return_url=None, metadata=None):
     """
-    Функция-обертка для создания платежа через глобальный экземпляр клиента
+    Функция-обертка для создания платежа через общий экземпляр клиента
     """
-    return client.create_payment(amount, description, return_url, metadata)
+    return get_client().create_payment(amount, description, return_url, metadata)
 
 
 def process_webhook(webhook_data):
     """
     Обработка уведомлений от ЮKassa
     
+    Повторные и устаревшие уведомления (статус уже применён или переход
+    недопустим) обрабатываются без изменений в базе.
+    
     Args:
         webhook_data (dict): Данные уведомления
     
@@ -357,59 +374,30 @@ def process_webhook(webhook_data):
     """
     try:
         event_type = webhook_data.get('event')
-        payment_data = webhook_data.get('object')
+        payment_data = webhook_data.get('object') or {}
         
-        if event_type == 'payment.succeeded':
-            # Платеж успешно завершен
-            payment_id = payment_data.get('id')
-
-            # Здесь нужно обновить статус платежа в базе данных
-            from .models import Payment, PaymentHistory
-
-            try:
-                payment = Payment.objects.get(yookassa_payment_id=payment_id)
-                payment.status = 'succeeded'
-                payment.payment_method = payment_data.get('payment_method', {})
-                payment.save()
+        if event_type in ('payment.waiting_for_capture', 'payment.succeeded', 'payment.canceled'):
+            from .models import Payment
+            from .payment_state import apply_payment_status
 
-                # Создаем запись в истории оплат только если её ещё нет
-                if not PaymentHistory.objects.filter(
-                    user=payment.user,
-                    payment=payment,
-                    month=payment.payment_month,
-                    year=payment.payment_year
-                ).exists():
-                    PaymentHistory.objects.create(
-                        user=payment.user,
-                        student_profile=payment.student_profile,
-                        payment=payment,
-                        month=payment.payment_month,
-                        year=payment.payment_year,
-                        amount_paid=payment.amount,
-                        pricing_plan=payment.pricing_plan,
-                        payment_type='card',
-                        status='completed'
-                    )
-
-                return True
-            except Payment.DoesNotExist:
-                print(f"Платеж {payment_id} не найден в базе данных")
-                return False
-        
-        elif event_type == 'payment.canceled':
-            # Платеж отменен
             payment_id = payment_data.get('id')
-            
+            status = event_type.split('.', 1)[1]
             try:
-                payment = Payment.objects.get(yookassa_payment_id=payment_id)
-                payment.status = 'canceled'
-                payment.save()
+                apply_payment_status(
+                    payment_id,
+                    status,
+                    payment_method=payment_data.get('payment_method') if status == 'succeeded' else None,
+                    source='webhook'
+                )
                 return True
             except Payment.DoesNotExist:
-                print(f"Платеж {payment_id} не найден в базе данных")
+                logger.error("Платеж из уведомления не найден в базе данных", extra={'payment_id': payment_id})
                 return False
         
         return True
     except Exception as e:
-        print(f"Ошибка при обработке webhook: {e}")
-        return False
\ No newline at end of file
+        logger.error(
+            "Ошибка при обработке webhook",
+            extra={'error': str(e), 'error_type': type(e).__name__}
+        )
+        return False
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dd.settings')
 
 application = get_asgi_application()
+
+# Фоновые задачи процесса веб-сервера (после настройки Django)
+from bot import start_process  # noqa: E402
+
+start_process()
@@ -28,6 +28,54 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 OWNER_ID = os.getenv('OWNER_ID')
 HOOK = os.getenv('HOOK')
 
+# Обработка обновлений: число потоков (0 - синхронно в запросе webhook) и размер очереди
+BOT_UPDATE_WORKERS = int(os.getenv('BOT_UPDATE_WORKERS', 4))
+BOT_UPDATE_QUEUE_SIZE = int(os.getenv('BOT_UPDATE_QUEUE_SIZE', 1000))
+
+# Запросы к Telegram Bot API: таймауты (сек) и размер общего пула keep-alive соединений процесса
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv('TELEGRAM_CONNECT_TIMEOUT', 5))
+TELEGRAM_READ_TIMEOUT = float(os.getenv('TELEGRAM_READ_TIMEOUT', 15))
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', 20))
+
+# Асинхронный webhook (ASGI, нужен aiohttp): включение, потоки для запросов к базе
+# и число одновременно обрабатываемых в цикле событий обновлений
+BOT_ASYNC_WEBHOOK = os.getenv('BOT_ASYNC_WEBHOOK', 'False').lower() == 'true'
+ASYNC_DB_WORKERS = int(os.getenv('ASYNC_DB_WORKERS', 16))
+ASYNC_MAX_IN_FLIGHT = int(os.getenv('ASYNC_MAX_IN_FLIGHT', 500))
+
+# Время жизни кэша контекста пользователя в процессе, сек (0 - только в пределах обновления)
+USER_CONTEXT_CACHE_TTL = float(os.getenv('USER_CONTEXT_CACHE_TTL', 0))
+
+# Период перечитывания списка администраторов из базы, сек
+ADMIN_IDS_REFRESH_INTERVAL = float(os.getenv('ADMIN_IDS_REFRESH_INTERVAL', 60))
+
+# Время жизни кэша оплаченных месяцев в процессе, сек (0 - без кэша)
+PAID_MONTHS_CACHE_TTL = float(os.getenv('PAID_MONTHS_CACHE_TTL', 60))
+
+# Время жизни кэша количества учеников для пагинации, сек
+STUDENTS_COUNT_CACHE_TTL = float(os.getenv('STUDENTS_COUNT_CACHE_TTL', 300))
+
+# Хранилище состояний диалогов: memory (в процессе) или database (общее для всех процессов)
+STATE_STORE_BACKEND = os.getenv('STATE_STORE_BACKEND', 'memory')
+STATE_STORE_TTL = int(os.getenv('STATE_STORE_TTL', 24 * 60 * 60))
+STATE_STORE_MAX_SIZE = int(os.getenv('STATE_STORE_MAX_SIZE', 10000))
+
+# Массовые рассылки: сообщений в секунду (лимит Telegram - 30) и число потоков отправки
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 25))
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', 8))
+
+# Минимальный интервал между правками сообщений в одном чате, сек (частые правки объединяются)
+EDIT_MIN_INTERVAL = float(os.getenv('EDIT_MIN_INTERVAL', 1.0))
+
+# Период проверки версии таблицы тарифов, сек
+TARIFF_RELOAD_INTERVAL = float(os.getenv('TARIFF_RELOAD_INTERVAL', 60))
+
+# Очередь уведомлений: фоновая отправка в процессе, размер пакета, число попыток и период опроса, сек
+OUTBOX_DRAIN_IN_PROCESS = os.getenv('OUTBOX_DRAIN_IN_PROCESS', 'True').lower() == 'true'
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 30))
+
 # Получаем имя бота из токена (до первого :)
 BOT_USERNAME = os.getenv('BOT_USERNAME') or (BOT_TOKEN.split(':')[0] if BOT_TOKEN else None)
 
@@ -35,6 +83,11 @@ BOT_USERNAME = os.getenv('BOT_USERNAME') or (BOT_TOKEN.split(':')[0] if BOT_TOKE
 YOOKASSA_TEST_MODE = os.getenv('YOOKASSA_TEST_MODE', 'True').lower() == 'true'
 YOOKASSA_SHOP_ID = os.getenv('YOOKASSA_SHOP_ID')
 YOOKASSA_SECRET_KEY = os.getenv('YOOKASSA_SECRET_KEY')
+# Таймауты (сек), повторы при сетевых ошибках и размер пула соединений к API ЮKassa
+YOOKASSA_CONNECT_TIMEOUT = float(os.getenv('YOOKASSA_CONNECT_TIMEOUT', 5))
+YOOKASSA_READ_TIMEOUT = float(os.getenv('YOOKASSA_READ_TIMEOUT', 30))
+YOOKASSA_MAX_RETRIES = int(os.getenv('YOOKASSA_MAX_RETRIES', 2))
+YOOKASSA_POOL_SIZE = int(os.getenv('YOOKASSA_POOL_SIZE', 10))
 
 # Application definition
 BOT_COMMANDS = [
@@ -149,27 +202,44 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Настройки логирования
+# Журнал: JSON в logs/bot.log, запись из фонового потока; файл общий для всех процессов,
+# ротация внешняя (logrotate). LOG_SAMPLE_RATE - доля записей частых событий
+# (extra={'sample': ...}), например входящих обновлений
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.01))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'formatters': {
-        'verbose': {
-            'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
-            'style': '{',
+        'json': {
+            '()': 'bot.log.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sample': {
+            '()': 'bot.log.SamplingFilter',
+            'rate': LOG_SAMPLE_RATE,
         },
     },
     'handlers': {
         'file': {
-            'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'filename': os.path.join(BASE_DIR, 'logs', 'debug.log'),
-            'formatter': 'verbose',
+            'level': LOG_LEVEL,
+            '()': 'bot.log.QueueFileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs', 'bot.log'),
+            'formatter': 'json',
+            'filters': ['sample'],
         },
     },
     'loggers': {
         'bot': {
             'handlers': ['file'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
+            'propagate': True,
+        },
+        'TeleBot': {
+            'handlers': ['file'],
+            'level': LOG_LEVEL,
             'propagate': True,
         },
     },
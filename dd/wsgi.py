@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dd.settings')
 
 application = get_wsgi_application()
+
+# Фоновые задачи процесса веб-сервера (после настройки Django)
+from bot import start_process  # noqa: E402
+
+start_process()